@@ -0,0 +1,50 @@
+import numpy as np
+
+from settings import ACTION_NOTIFY, ACTION_RECORD
+from tracker import TRACK_ENTER
+
+
+class DetectionActions:
+    """
+    The settings-driven side effects of a frame's detections, shared by the live app and batch.py.
+
+    filter() keeps the detections of watched classes and fires the notify and record
+    actions once per class per frame: notify through notifier (a NotificationDispatcher),
+    unless event_uploader (an EventUploader) is set, in which case tracked objects go to
+    the ingestion function via track_events() and it sends the emails; record as a
+    trigger of recorder (a ClipRecorder). Any of the three may be None.
+    """
+
+    def __init__(self, class_names, notifier=None, recorder=None, event_uploader=None):
+        self.class_names = class_names
+        self.notifier = notifier
+        self.recorder = recorder
+        self.event_uploader = event_uploader
+
+    def filter(self, raw_boxes, raw_scores, raw_class_ids, settings, stream="default", timestamp=None):
+        """ The detections of the classes watched in settings (a CompiledSettings), after firing their actions. """
+        watched_boxes, watched_scores, watched_class_ids = settings.filter(raw_boxes, raw_scores, raw_class_ids)
+        if watched_class_ids.shape[0] == 0:
+            return watched_boxes, watched_scores, watched_class_ids
+
+        if self.notifier is not None and self.event_uploader is None:
+            # One non-blocking event per class per frame; the dispatcher handles cooldowns and HTTP
+            notify_counts = settings.action_counts(watched_class_ids, ACTION_NOTIFY)
+            for class_id in np.flatnonzero(notify_counts):
+                self.notifier.notify(self.class_names[class_id], settings.notification_email,
+                                     int(notify_counts[class_id]))
+
+        if self.recorder is not None:
+            # Triggers while the object stays in view extend the same clip
+            for class_id in np.flatnonzero(settings.action_counts(watched_class_ids, ACTION_RECORD)):
+                self.recorder.trigger(stream, self.class_names[class_id], timestamp)
+
+        return watched_boxes, watched_scores, watched_class_ids
+
+    def track_events(self, tracker, stream="default", timestamp=None):
+        """ Uploads one event per track the tracker's latest update confirmed. """
+        if self.event_uploader is None:
+            return
+        for kind, track_id, class_id in tracker.events:
+            if kind == TRACK_ENTER:
+                self.event_uploader.record(self.class_names[class_id], track_id, stream, timestamp)
@@ -1,33 +1,209 @@
 import gradio as gr
-import cv2
-from huggingface_hub import hf_hub_download
-# Updated import: also get class_names and draw_detections from inference
-from inference import YOLOv10, class_names as coco_class_names_from_inference, draw_detections
-from fastrtc import Stream # Corrected import
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from inference import class_names as coco_class_names_from_inference
+from model_loader import DEFAULT_OPTIMIZED_DIR, ModelLoader
+from runtime_profile import ExecutionProfile, available_cores
+import metrics
+from batching import BatchingDetector
+from workers import WorkerPoolDetector
+from notifications import EventUploader, NotificationDispatcher
+from actions import DetectionActions
+from recorder import ClipRecorder
+from tracker import IoUTracker
+from keyframe import MARGIN as KEYFRAME_MARGIN, KeyframeScheduler
+from ladder import LadderController, QualityLadder
+from motion import MotionGate
+from renderer import OverlayRenderer
+from overlay import FLAG_LOADING, FLAG_REUSED, encode_detections, frame_record
+from session_context import ContextRegistry, DetectionContext
+from settings import CompiledSettings
+from zones import editable_zones, stored_zones
+from settings_client import DEFAULT_CACHE_PATH as DEFAULT_SETTINGS_CACHE_PATH, SettingsClient, SettingsError
+from fastrtc import AdditionalOutputs, Stream, get_current_context # Corrected import
+import json
+import os
 import time # For timestamp in email
 
-# Download the YOLOv10n ONNX model
-model_path = hf_hub_download(repo_id="onnx-community/yolov10n", filename="onnx/model.onnx")
+# Frames from concurrent streams are batched into a single session.run
+BATCH_MAX_SIZE = int(os.environ.get("YOLO_BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("YOLO_BATCH_MAX_WAIT_MS", "10"))
+# Letterboxing keeps the aspect ratio of non-square frames instead of stretching them
+LETTERBOX = os.environ.get("YOLO_LETTERBOX", "0") == "1"
 
-# Instantiate the YOLOv10 model
-model = YOLOv10(model_path)
+# ONNX Runtime settings: ORT_PROFILE is a JSON profile saved by `python runtime_profile.py MODEL.onnx`,
+# ORT_INTRA_OP_THREADS pins the detector's thread budget (default: every core this process may use)
+execution_profile = ExecutionProfile.load(os.environ["ORT_PROFILE"]) if os.environ.get("ORT_PROFILE") else ExecutionProfile()
+if os.environ.get("ORT_INTRA_OP_THREADS"):
+    execution_profile.intra_op_num_threads = int(os.environ["ORT_INTRA_OP_THREADS"])
+# Independent detector sessions shared by all streams; without a thread count each gets an equal share of the cores
+YOLO_SESSIONS = int(os.environ.get("YOLO_SESSIONS", str(max(1, available_cores() // 4))))
+# YOLO_WORKERS > 0 runs detection in that many worker processes instead, out of reach of this process's GIL
+YOLO_WORKERS = int(os.environ.get("YOLO_WORKERS", "0"))
 
-# Global dictionary to store object counts per frame
-object_counts = {}
+def create_shared_detector(detectors):
+    """ The detector all streams share: the worker pool with YOLO_WORKERS, else the in-process batcher. """
+    if YOLO_WORKERS > 0:
+        # No session is made in this process: detectors is the ModelSource the workers load, i.e. the
+        # cached optimized graph if any
+        return WorkerPoolDetector(detectors.path, workers=YOLO_WORKERS, letterbox=LETTERBOX, profile=detectors.profile)
+    return BatchingDetector(detectors, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+
+# The YOLOv10n model is loaded and warmed up in the background, so the server starts right away.
+# YOLO_MODEL_PATH loads a local ONNX file instead of the Hugging Face one; YOLO_OFFLINE=1 only uses
+# the Hugging Face cache (YOLO_MODEL_CACHE_DIR). The optimized graph is cached in
+# ORT_OPTIMIZED_MODEL_DIR (set it empty to disable) so later starts skip graph optimization.
+# YOLO_PRECISION=int8-dynamic|int8-static loads a quantized variant made by quantize.py.
+def create_model_loader(local_path=None):
+    """ A background loader of the shared detector, with the model, runtime and batching settings above. """
+    return ModelLoader(
+        local_path=local_path,
+        cache_dir=os.environ.get("YOLO_MODEL_CACHE_DIR") or None,
+        offline=os.environ.get("YOLO_OFFLINE", "0") == "1",
+        precision=os.environ.get("YOLO_PRECISION", "fp32"),
+        profile=execution_profile,
+        letterbox=LETTERBOX,
+        optimized_dir=os.environ.get("ORT_OPTIMIZED_MODEL_DIR", DEFAULT_OPTIMIZED_DIR),
+        warmup_runs=int(os.environ.get("YOLO_WARMUP_RUNS", "3")),
+        warmup_batch_size=BATCH_MAX_SIZE,
+        sessions=0 if YOLO_WORKERS > 0 else YOLO_SESSIONS,
+        wrap=create_shared_detector,
+    ).start()
+
+model_loader = create_model_loader(os.environ.get("YOLO_MODEL_PATH") or None)
+
+# Quality ladder: YOLO_LADDER lists model variants from the cheapest to the most accurate (comma-separated
+# ONNX paths, "default" for the model above), e.g. the model exported at 320, 480 and 640 plus a larger one.
+# Each is loaded next to the others, and every stream moves down or up the ladder to keep its detector
+# within the frame budget of LADDER_TARGET_FPS. Streams start on YOLO_LADDER_START (a rung name or index),
+# by default the "default" rung if listed, else the top one.
+YOLO_LADDER = [entry.strip() for entry in os.environ.get("YOLO_LADDER", "").split(",") if entry.strip()]
+quality_ladder = LADDER_START = None
+if YOLO_LADDER:
+    quality_ladder = QualityLadder(
+        [model_loader if entry == "default" else create_model_loader(entry) for entry in YOLO_LADDER],
+        names=[entry if entry == "default" else os.path.splitext(os.path.basename(entry))[0] for entry in YOLO_LADDER],
+    )
+    LADDER_START = quality_ladder.index(os.environ.get("YOLO_LADDER_START")
+                                        or ("default" if "default" in YOLO_LADDER else len(YOLO_LADDER) - 1))
+LADDER_TARGET_FPS = float(os.environ.get("LADDER_TARGET_FPS", "15"))
+LADDER_MIN_DWELL_S = float(os.environ.get("LADDER_MIN_DWELL_S", "5"))
+LADDER_BACKOFF_S = float(os.environ.get("LADDER_BACKOFF_S", "30"))
+
+# Each stream gets a tracker that associates its watched detections across frames, so "count"
+# reports distinct objects, not boxes per frame
+TRACKER_USE_KALMAN = os.environ.get("TRACKER_USE_KALMAN", "0") == "1"
+
+# Keyframe mode: run the detector only on some frames and propagate tracks in between.
+# The interval adapts to keep detector time per frame within KEYFRAME_BUDGET_MS.
+KEYFRAME_MODE = os.environ.get("KEYFRAME_MODE", "0") == "1"
+KEYFRAME_BUDGET_MS = float(os.environ.get("KEYFRAME_BUDGET_MS", "10"))
+KEYFRAME_MAX_INTERVAL = int(os.environ.get("KEYFRAME_MAX_INTERVAL", "5"))
+# A keyframe whose mean score is within this of the confidence threshold forces the next one
+KEYFRAME_CONFIDENCE_MARGIN = float(os.environ.get("KEYFRAME_CONFIDENCE_MARGIN", str(KEYFRAME_MARGIN)))
+
+# Motion gate: static scenes reuse the last detections instead of running the model.
+# MOTION_GATE_REGIONS is an optional JSON list of polygons in normalized [0, 1] frame coordinates.
+MOTION_GATE = os.environ.get("MOTION_GATE", "0") == "1"
+MOTION_GATE_REGIONS = json.loads(os.environ.get("MOTION_GATE_REGIONS", "[]"))
+
+def create_detection_context(stream_id):
+    """ Fresh per-stream pipeline state: tracker, and keyframe scheduler, motion gate and ladder controller if enabled. """
+    return DetectionContext(
+        stream_id,
+        tracker=IoUTracker(num_classes=len(coco_class_names_from_inference), use_kalman=TRACKER_USE_KALMAN),
+        keyframes=KeyframeScheduler(latency_budget_ms=KEYFRAME_BUDGET_MS, max_interval=KEYFRAME_MAX_INTERVAL,
+                                    confidence_margin=KEYFRAME_CONFIDENCE_MARGIN) if KEYFRAME_MODE else None,
+        motion_gate=MotionGate(
+            pixel_threshold=int(os.environ.get("MOTION_GATE_PIXEL_THRESHOLD", "25")),
+            min_changed_fraction=float(os.environ.get("MOTION_GATE_MIN_CHANGED", "0.002")),
+            refresh_interval=float(os.environ.get("MOTION_GATE_REFRESH_S", "30")),
+            regions=MOTION_GATE_REGIONS,
+        ) if MOTION_GATE else None,
+        ladder=LadderController(quality_ladder, target_fps=LADDER_TARGET_FPS, start_level=LADDER_START,
+                                min_dwell=LADDER_MIN_DWELL_S, backoff=LADDER_BACKOFF_S) if quality_ladder else None,
+    )
+
+# One context per connected camera; streams idle for STREAM_IDLE_TIMEOUT_S are dropped with their metrics
+detection_contexts = ContextRegistry(create_detection_context,
+                                     idle_timeout=float(os.environ.get("STREAM_IDLE_TIMEOUT_S", "300")))
+
+def connection_for(request=None):
+    """
+    (stream id, channel order) of the connection a frame came from. Under FastRTC: the WebRTC
+    id, and BGR, the order it delivers frames in and encodes returned ones from. Else the
+    Gradio session, whose frames in and out are RGB.
+    """
+    try:
+        return get_current_context().webrtc_id, "BGR"
+    except Exception:
+        pass
+    session_hash = getattr(request, "session_hash", None)
+    return session_hash or "default", "RGB"
+
+# Annotated frames are produced at display resolution, in the channel order of the entry point that returns them
+renderers = {order: OverlayRenderer(output_size=(640, 480), color_order=order) for order in ("RGB", "BGR")}
 
 # Define the slider component first in the global scope
 conf_slider = gr.Slider(minimum=0, maximum=1, step=0.01, value=0.3, label="Confidence Threshold")
+# Connection ids change on every connect, so per-camera settings (zones) go by the name the client sets
+camera_box = gr.Textbox(value="", label="Camera name", placeholder="e.g. front-door; zones for it apply")
+
+def camera_name(camera):
+    """ The stable name a client gave its camera, None if it gave none (only "*" zones apply). """
+    return str(camera or "").strip() or None
 
 # --- Firebase Settings Integration ---
-import json # json was already imported below, but placing it here is fine too
 import requests
 
-GET_PREFS_URL = "YOUR_GET_USER_PREFERENCES_FUNCTION_URL" # TODO: Update with deployed Firebase Function URL
-SET_PREFS_URL = "YOUR_SET_USER_PREFERENCES_FUNCTION_URL" # TODO: Update with deployed Firebase Function URL
-SEND_EMAIL_URL = "YOUR_SEND_EMAIL_NOTIFICATION_FUNCTION_URL" # TODO: Update with deployed Firebase Function URL
+GET_PREFS_URL = os.environ.get("GET_PREFS_URL", "YOUR_GET_USER_PREFERENCES_FUNCTION_URL") # TODO: Update with deployed Firebase Function URL
+SET_PREFS_URL = os.environ.get("SET_PREFS_URL", "YOUR_SET_USER_PREFERENCES_FUNCTION_URL") # TODO: Update with deployed Firebase Function URL
+SEND_EMAIL_URL = os.environ.get("SEND_EMAIL_URL", "YOUR_SEND_EMAIL_NOTIFICATION_FUNCTION_URL") # TODO: Update with deployed Firebase Function URL
+INGEST_EVENTS_URL = os.environ.get("INGEST_EVENTS_URL", "YOUR_INGEST_DETECTION_EVENTS_FUNCTION_URL") # TODO: Update with deployed Firebase Function URL
 SIMULATED_USER_ID_TOKEN = "dummy-firebase-id-token"
 
+# One pooled session (keep-alive connections) for every call to the Firebase functions
+firebase_session = requests.Session()
+
+# Notifications are posted from a background thread; per-class cooldown and coalescing window in seconds
+NOTIFY_COOLDOWN_S = float(os.environ.get("NOTIFY_COOLDOWN_S", "60"))
+NOTIFY_COALESCE_S = float(os.environ.get("NOTIFY_COALESCE_S", "2"))
+notification_dispatcher = NotificationDispatcher(
+    SEND_EMAIL_URL,
+    SIMULATED_USER_ID_TOKEN,
+    cooldown=NOTIFY_COOLDOWN_S,
+    coalesce_window=NOTIFY_COALESCE_S,
+    simulate="YOUR_SEND_EMAIL_NOTIFICATION_FUNCTION_URL" in SEND_EMAIL_URL,
+    session=firebase_session,
+)
+
+# With the ingestion function deployed, tracked objects are uploaded as batched events and
+# the function sends the (rate-limited) emails; otherwise the dispatcher above emails directly
+EVENT_FLUSH_S = float(os.environ.get("EVENT_FLUSH_S", "5"))
+event_uploader = None
+if "YOUR_INGEST_DETECTION_EVENTS_FUNCTION_URL" not in INGEST_EVENTS_URL:
+    event_uploader = EventUploader(INGEST_EVENTS_URL, SIMULATED_USER_ID_TOKEN, flush_interval=EVENT_FLUSH_S,
+                                   session=firebase_session)
+
+# recordOnDetect clips: a compressed pre-roll buffer per stream, clips written in the background
+clip_recorder = ClipRecorder(
+    os.environ.get("RECORDINGS_DIR", "recordings"),
+    pre_roll=float(os.environ.get("RECORD_PRE_ROLL_S", "5")),
+    post_roll=float(os.environ.get("RECORD_POST_ROLL_S", "5")),
+    fps=float(os.environ.get("RECORD_FPS", "10")),
+    scale=float(os.environ.get("RECORD_SCALE", "0.5")),
+    max_stream_bytes=int(float(os.environ.get("RECORD_STREAM_MB", "32")) * 2**20),
+    retention=float(os.environ.get("RECORD_RETENTION_H", "72")) * 3600,
+    max_disk_bytes=int(float(os.environ.get("RECORD_MAX_DISK_MB", "2048")) * 2**20),
+)
+
+# Notify/record actions of watched detections (and tracked-object events for the ingestion function)
+detection_actions = DetectionActions(coco_class_names_from_inference, notifier=notification_dispatcher,
+                                     recorder=clip_recorder, event_uploader=event_uploader)
+
 COCO_CLASSES_FOR_UI = ["person", "car", "dog", "cat", "bottle"]
+COCO_CLASS_IDS = {name: i for i, name in enumerate(coco_class_names_from_inference)}
 
 current_user_settings = {
     "watchedObjects": {cls: False for cls in COCO_CLASSES_FOR_UI},
@@ -37,107 +213,292 @@ current_user_settings = {
     },
     "notificationEmail": "user@example.com"
 }
+# What detection() reads: current_user_settings compiled into per-class lookup arrays
+compiled_settings = CompiledSettings.compile(current_user_settings, coco_class_names_from_inference, COCO_CLASSES_FOR_UI)
 
-def detection(image, conf_threshold):
+def apply_user_settings(new_settings):
     """
-    Performs object detection on an image, filters based on settings, and draws results.
+    Makes new_settings current. They are compiled first and then swapped in with a single
+    assignment, so a frame uses either the old or the new settings, never a mix.
     """
-    if image is None: # Gradio might pass None if webcam isn't ready
-        # Ensure np is available if not already. It's imported in __main__ for now.
-        # For robustness, one might ensure np is imported globally in app.py
-        return np.zeros((480, 640, 3), dtype=np.uint8)
+    global current_user_settings, compiled_settings
+    compiled_settings = CompiledSettings.compile(new_settings, coco_class_names_from_inference, COCO_CLASSES_FOR_UI)
+    current_user_settings = new_settings
 
-    bgr_image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-    raw_boxes, raw_scores, raw_class_ids = model.detect_objects(bgr_image, conf_threshold)
+def settings_for_ui_classes(loaded_settings):
+    """ Stored settings completed with a value for every UI class and action. """
+    new_settings = {
+        "notificationEmail": loaded_settings.get("notificationEmail") or current_user_settings["notificationEmail"],
+        "watchedObjects": {}, "objectActions": {},
+    }
+    loaded_watched = loaded_settings.get("watchedObjects", {})
+    loaded_actions = loaded_settings.get("objectActions", {})
+    for cls in COCO_CLASSES_FOR_UI:
+        new_settings["watchedObjects"][cls] = loaded_watched.get(cls, False)
+        cls_actions = loaded_actions.get(cls, {})
+        new_settings["objectActions"][cls] = {
+            "count": cls_actions.get("count", False),
+            "notifyOnDetect": cls_actions.get("notifyOnDetect", False),
+            "recordOnDetect": cls_actions.get("recordOnDetect", False),
+        }
+    new_settings["zones"] = stored_zones(loaded_settings.get("zones"))
+    return new_settings
 
-    global object_counts
-    object_counts.clear()
+# Settings are cached on disk and polled in the background; detection() only ever reads compiled_settings
+SETTINGS_CACHE_PATH = os.environ.get("SETTINGS_CACHE_PATH", DEFAULT_SETTINGS_CACHE_PATH)
+SETTINGS_TTL_S = float(os.environ.get("SETTINGS_TTL_S", "300"))
+SETTINGS_POLL_S = float(os.environ.get("SETTINGS_POLL_S", "60"))
+settings_client = SettingsClient(
+    GET_PREFS_URL,
+    SET_PREFS_URL,
+    SIMULATED_USER_ID_TOKEN,
+    cache_path=SETTINGS_CACHE_PATH,
+    ttl=SETTINGS_TTL_S,
+    poll_interval=SETTINGS_POLL_S,
+    on_change=lambda loaded_settings: apply_user_settings(settings_for_ui_classes(loaded_settings)),
+    offline="YOUR_GET_USER_PREFERENCES_FUNCTION_URL" in GET_PREFS_URL,
+    session=firebase_session,
+).start()
 
-    watched_boxes = []
-    watched_scores = []
-    watched_class_ids = []
+def run_pipeline(context, image, conf_threshold, channel_order="RGB"):
+    """
+    Runs one frame of a stream through detection, the settings actions and tracking.
 
-    if raw_boxes is not None and len(raw_boxes) > 0:
-        for box, score, class_id_val in zip(raw_boxes, raw_scores, raw_class_ids): # Renamed class_id to avoid conflict
-            class_name = coco_class_names_from_inference[int(class_id_val)]
+    Returns (boxes, scores, class_ids, track_ids, reused): the watched detections, the
+    track each belongs to and whether they were carried forward from an earlier frame
+    (keyframe interval or static scene) instead of detected. None while the model loads.
+    """
+    stream = context.stream_id
+    metrics.registry.inc("frames_total", stream=stream)
+    context.sequence += 1
 
-            if class_name in COCO_CLASSES_FOR_UI and current_user_settings["watchedObjects"].get(class_name, False):
-                watched_boxes.append(box)
-                watched_scores.append(score)
-                watched_class_ids.append(class_id_val)
+    if context.ladder is not None:
+        # The stream's rung, or the nearest loaded one while it is still loading
+        level, model = quality_ladder.detector(context.ladder.level)
+    else:
+        model = model_loader.model
+    if model is None:
+        # Still loading: pass the camera feed through until the warmed-up model is published
+        metrics.registry.inc("frames_skipped_total", stream=stream, reason="model_loading")
+        return None
 
-                actions = current_user_settings["objectActions"].get(class_name, {})
-                if actions.get("count", False):
-                    object_counts[class_name] = object_counts.get(class_name, 0) + 1
+    # Read once: an update swaps in a new CompiledSettings, so this frame sees one consistent version
+    settings = compiled_settings
+    reused = True
+    with context.queued(), context.lock:
+        context.frame_size = (image.shape[1], image.shape[0])
+        if settings.recording:
+            clip_recorder.add_frame(stream, image, image_order=channel_order)
+        tracker = context.tracker
+        if context.motion_gate is not None and not context.motion_gate.has_motion(image):
+            # Nothing moved since the last processed frame, so its detections still hold
+            watched_boxes, watched_scores, watched_class_ids, track_ids = context.last_watched_detections
+            metrics.registry.inc("frames_skipped_total", stream=stream, reason="static_scene")
+        elif context.keyframes is None or context.keyframes.should_run(image):
+            reused = False
+            start = time.perf_counter()
+            # Scores of unwatched classes are not even decoded, and with zones only their crops are run.
+            # "detect" is this stream's wait for the shared detector, batching included
+            with metrics.stage("detect", stream=stream):
+                raw_boxes, raw_scores, raw_class_ids = model.detect_objects(image, conf_threshold,
+                                                                            channel_order=channel_order,
+                                                                            class_mask=settings.watched,
+                                                                            zones=settings.zones_for(context.camera))
+            detector_ms = (time.perf_counter() - start) * 1000
+            if context.keyframes is not None:
+                context.keyframes.record_keyframe(detector_ms, raw_scores, conf_threshold)
+            # A fallback rung may have served the frame while the stream's own rung loads (or after it
+            # failed); the controller only steps down on such runs, or moves to the serving rung
+            if context.ladder is not None:
+                transition = context.ladder.record(detector_ms, quality_ladder.queue_depth(level), level=level)
+                if transition is not None:
+                    from_level, to_level = transition
+                    metrics.registry.inc("ladder_transitions_total", stream=stream,
+                                         direction="up" if to_level > from_level else "down",
+                                         rung=quality_ladder.names[to_level])
+            with metrics.stage("filter", stream=stream):
+                watched_boxes, watched_scores, watched_class_ids = detection_actions.filter(
+                    raw_boxes, raw_scores, raw_class_ids, settings, stream)
+            with metrics.stage("track", stream=stream):
+                tracker.update(watched_boxes, watched_scores, watched_class_ids)
+            track_ids = tracker.detection_track_ids
+            # One event per newly confirmed track rather than per detection per frame
+            detection_actions.track_events(tracker, stream)
+        else:
+            # Between keyframes the tracker carries the last detections forward along their motion
+            with metrics.stage("track", stream=stream):
+                watched_boxes, watched_scores, watched_class_ids, track_ids = tracker.predict()
+            metrics.registry.inc("frames_skipped_total", stream=stream, reason="keyframe_interval")
+        context.last_watched_detections = (watched_boxes, watched_scores, watched_class_ids, track_ids)
 
-                if actions.get("notifyOnDetect", False):
-                    trigger_email_notification(class_name) # Call new function
+        context.object_counts = {coco_class_names_from_inference[class_id]: int(tracker.unique_counts[class_id])
+                                 for class_id in settings.counted_ids}
+    return watched_boxes, watched_scores, watched_class_ids, track_ids, reused
 
-                if actions.get("recordOnDetect", False):
-                    print(f"RECORDING TRIGGER: Detected {class_name}")
+def detection(image, conf_threshold, camera="", request: gr.Request = None):
+    """
+    Performs object detection on an image, filters based on settings, and draws results.
 
-    output_image_bgr = bgr_image.copy()
-    if watched_boxes:
-        output_image_bgr = draw_detections(output_image_bgr, watched_boxes, watched_scores, watched_class_ids)
+    State is kept in the DetectionContext of the stream the frame belongs to, so any
+    number of cameras can be served in parallel. camera names the camera for its zones.
+    """
+    stream_id, channel_order = connection_for(request)
+    # Frames come back in the order they came in: RGB for Gradio, BGR for FastRTC
+    renderer = renderers[channel_order]
+    if image is None: # Gradio might pass None if webcam isn't ready
+        return renderer.blank()
+    context = detection_contexts.get(stream_id)
+    context.camera = camera_name(camera)
+    # The model consumes RGB frames without a color conversion, BGR ones with a single one
+    result = run_pipeline(context, image, conf_threshold, channel_order=channel_order)
+    if result is None:
+        return renderer.render(image, [], [], [], image_order=channel_order, stream=context.stream_id)
+    watched_boxes, watched_scores, watched_class_ids, _, _ = result
+    # Boxes are scaled to the display size and drawn once into a reused output frame
+    return renderer.render(image, watched_boxes, watched_scores, watched_class_ids, context.object_counts,
+                           image_order=channel_order, stream=context.stream_id)
+
+def detection_records(image, conf_threshold, camera=""):
+    """
+    Detections-only handler: returns the frame's detections as a compact binary record
+    (see overlay.py) instead of an annotated frame, for the browser to draw over its own
+    video. Nothing is rendered or re-encoded, and only the record goes back to the client.
+    """
+    # Only served through FastRTC, so always BGR
+    stream_id, _ = connection_for()
+    context = detection_contexts.get(stream_id)
+    context.camera = camera_name(camera)
+    result = run_pipeline(context, image, conf_threshold, channel_order="BGR")
+    height, width = image.shape[:2]
+    if result is None:
+        record = encode_detections(context.sequence, width, height, [], [], [], flags=FLAG_LOADING)
+    else:
+        boxes, scores, class_ids, track_ids, reused = result
+        with metrics.stage("encode_record", stream=context.stream_id):
+            counts = {COCO_CLASS_IDS[name]: count for name, count in context.object_counts.items()}
+            record = encode_detections(context.sequence, width, height, boxes, scores, class_ids, track_ids, counts,
+                                       flags=FLAG_REUSED if reused else 0)
+    metrics.registry.inc("record_bytes_total", len(record), stream=context.stream_id)
+    return AdditionalOutputs(record)
+
+def collect_pipeline_metrics():
+    """ Scrape-time gauges for state owned by the pipeline components. """
+    samples = [("model_ready", {}, int(model_loader.ready))]
+    model = model_loader.model
+    if isinstance(model, BatchingDetector):
+        samples.append(("batch_queue_depth", {}, model.queue_depth))
+        samples.append(("batch_mean_size", {}, model.mean_batch_size))
+        samples.append(("detector_sessions", {}, len(model.models)))
+    elif isinstance(model, WorkerPoolDetector):
+        samples.append(("batch_queue_depth", {}, model.queue_depth))
+        samples.append(("detector_workers", {}, model.workers))
+        samples.append(("detector_worker_restarts", {}, model.restarts))
+    for key, value in notification_dispatcher.stats().items():
+        samples.append((f"notifications_{key}", {}, value))
+    if event_uploader is not None:
+        for key, value in event_uploader.stats().items():
+            samples.append((f"events_{key}", {}, value))
+    for key, value in settings_client.stats().items():
+        if value is not None:
+            samples.append((f"settings_{key}", {}, value))
+    for key, value in clip_recorder.stats().items():
+        samples.append((f"recorder_{key}", {}, value))
+    samples.append(("streams_active", {}, len(detection_contexts)))
+    for context in detection_contexts.contexts():
+        labels = {"stream": context.stream_id}
+        if context.motion_gate is not None:
+            samples.append(("motion_gate_inferred_frames", labels, context.motion_gate.inferred_frames))
+            samples.append(("motion_gate_skipped_frames", labels, context.motion_gate.skipped_frames))
+        if context.keyframes is not None:
+            samples.append(("keyframe_interval", labels, context.keyframes.interval))
+        if context.ladder is not None:
+            samples.append(("ladder_level", labels, context.ladder.level))
+            if context.ladder.latency_ms is not None:
+                samples.append(("ladder_latency_ms", labels, context.ladder.latency_ms))
+        samples.append(("tracks_active", labels, len(context.tracker)))
+        samples.append(("stream_queue_depth", labels, context.queue_depth))
+    if quality_ladder is not None:
+        levels = [context.ladder.level for context in detection_contexts.contexts() if context.ladder is not None]
+        for level, name in enumerate(quality_ladder.names):
+            labels = {"rung": name}
+            samples.append(("ladder_rung_ready", labels, int(quality_ladder.ready(level))))
+            samples.append(("ladder_rung_streams", labels, levels.count(level)))
+            samples.append(("ladder_rung_queue_depth", labels, quality_ladder.queue_depth(level)))
+    return samples
 
-    y_offset = 30
-    for class_name_count, count_val in object_counts.items():
-        text = f"{class_name_count}: {count_val}"
-        cv2.putText(output_image_bgr, text, (10, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-        y_offset += 30
+metrics.registry.add_collector(collect_pipeline_metrics)
 
-    output_image_rgb = cv2.cvtColor(output_image_bgr, cv2.COLOR_BGR2RGB)
-    display_image = cv2.resize(output_image_rgb, (640, 480))
-    return display_image
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def ready_endpoint():
+    """ Readiness probe: 200 once the model is loaded and warmed up, 503 until then (or if loading failed). """
+    return JSONResponse(model_loader.status(), status_code=200 if model_loader.ready else 503)
 
 # Initialize FastRTC Stream
 stream_config = Stream(
     handler=detection,
     modality="video",
     mode="send-receive",
-    additional_inputs=[conf_slider]
+    additional_inputs=[conf_slider, camera_box]
+)
+
+# Detections-only mode: the browser (public/overlay.html, served at /overlay) sends its camera
+# and draws the overlay on its own video from the records streamed on /detections/records
+record_stream = Stream(
+    handler=detection_records,
+    modality="video",
+    mode="send",
+    additional_inputs=[conf_slider, camera_box],
+    concurrency_limit=int(os.environ.get("RECORD_STREAM_MAX_CLIENTS", "16")),
 )
+PUBLIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "public")
+
+async def detections_input(request: Request):
+    """
+    Sets the confidence threshold and camera name of a detections-only connection; its frames
+    are processed from then on.
+    """
+    body = await request.json()
+    record_stream.set_input(body["webrtc_id"], float(body.get("conf_threshold", 0.3)), str(body.get("camera") or ""))
+    return JSONResponse({"status": "ok"})
+
+async def detections_records(webrtc_id: str):
+    """ The detection records of a connection, each prefixed with its uint32 length, until it closes. """
+    if webrtc_id not in record_stream.pcs:
+        return JSONResponse({"error": "unknown webrtc_id"}, status_code=404)
+
+    async def records():
+        async for outputs in record_stream.output_stream(webrtc_id):
+            yield frame_record(outputs.args[0])
+
+    return StreamingResponse(records(), media_type="application/octet-stream",
+                             headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"})
+
+def detections_classes():
+    return JSONResponse(list(coco_class_names_from_inference))
 
 def load_user_settings_from_firebase():
-    global current_user_settings
-    headers = {"Authorization": f"Bearer {SIMULATED_USER_ID_TOKEN}", "Content-Type": "application/json"}
     try:
-        print(f"Attempting to load settings from: {GET_PREFS_URL}")
-        response = requests.post(GET_PREFS_URL, headers=headers, json={"data": {}})
-        response.raise_for_status()
-        data = response.json()
-        if "result" in data:
-            loaded_settings = data["result"]
-        elif "error" in data:
-            print(f"Error from Firebase function: {data['error']}")
-            return "Error loading settings from Firebase."
-        else:
-            loaded_settings = data
-
-        current_user_settings["notificationEmail"] = loaded_settings.get("notificationEmail", current_user_settings["notificationEmail"])
-        loaded_watched = loaded_settings.get("watchedObjects", {})
-        for cls in COCO_CLASSES_FOR_UI:
-            current_user_settings["watchedObjects"][cls] = loaded_watched.get(cls, False)
-        loaded_actions = loaded_settings.get("objectActions", {})
-        for cls in COCO_CLASSES_FOR_UI:
-            cls_actions = loaded_actions.get(cls, {})
-            current_user_settings["objectActions"][cls]["count"] = cls_actions.get("count", False)
-            current_user_settings["objectActions"][cls]["notifyOnDetect"] = cls_actions.get("notifyOnDetect", False)
-            current_user_settings["objectActions"][cls]["recordOnDetect"] = cls_actions.get("recordOnDetect", False)
+        print(f"Checking for updated settings at: {GET_PREFS_URL}")
+        # Only downloads the settings if they changed since the cached version
+        settings_client.refresh()
         print("Successfully loaded settings:", json.dumps(current_user_settings, indent=2))
         return json.dumps(current_user_settings, indent=2)
-    except requests.exceptions.RequestException as e:
-        print(f"Error loading settings: {e}")
-        if "YOUR_GET_USER_PREFERENCES_FUNCTION_URL" in GET_PREFS_URL:
+    except SettingsError as e:
+        print(f"Error from Firebase function: {e}")
+        if settings_client.offline:
             print("Note: Firebase URL is a placeholder. Actual call would fail.")
             return "Error: Firebase URL not configured. Using default/current settings."
+        return "Error loading settings from Firebase."
+    except requests.exceptions.RequestException as e:
+        print(f"Error loading settings: {e}")
         return f"Error loading settings: {str(e)}"
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
         return f"Unexpected error: {str(e)}"
 
 def save_user_settings_to_firebase(*args):
-    global current_user_settings
     new_settings = {"notificationEmail": args[0], "watchedObjects": {}, "objectActions": {}}
     arg_idx = 1
     for cls in COCO_CLASSES_FOR_UI:
@@ -148,54 +509,36 @@ def save_user_settings_to_firebase(*args):
             "recordOnDetect": args[arg_idx+3]
         }
         arg_idx += 4
-    headers = {"Authorization": f"Bearer {SIMULATED_USER_ID_TOKEN}", "Content-Type": "application/json"}
+    try:
+        # Edited as [x, y] points, saved as Firestore-compatible maps of flat points
+        new_settings["zones"] = stored_zones(json.loads(args[arg_idx]) if args[arg_idx].strip() else {})
+        # Streams whose zones were removed are saved as empty, so the stored ones are cleared too
+        for stream_id in current_user_settings.get("zones", {}):
+            new_settings["zones"].setdefault(stream_id, [])
+        CompiledSettings.compile(new_settings, coco_class_names_from_inference, COCO_CLASSES_FOR_UI)
+    except (ValueError, TypeError, AttributeError) as e:
+        return f"Error: invalid zones: {e}"
     try:
         print(f"Attempting to save settings to: {SET_PREFS_URL}")
-        print("Settings to save:", json.dumps(new_settings, indent=2))
-        response = requests.post(SET_PREFS_URL, headers=headers, json={"data": new_settings})
-        response.raise_for_status()
-        current_user_settings = new_settings
-        return f"Settings saved successfully: {response.json().get('message', 'OK')}"
-    except requests.exceptions.RequestException as e:
+        # Only the fields that differ from the stored settings are sent; the client applies the result
+        changes = settings_client.save(new_settings)
+        if not changes:
+            return "Settings unchanged, nothing to save."
+        print("Settings changes saved:", json.dumps(changes, indent=2))
+        return "Settings saved successfully."
+    except SettingsError as e:
         print(f"Error saving settings: {e}")
-        if "YOUR_SET_USER_PREFERENCES_FUNCTION_URL" in SET_PREFS_URL:
+        if settings_client.offline:
             print("Note: Firebase URL is a placeholder. Actual call would fail.")
             return "Error: Firebase URL not configured. Settings not saved to cloud."
         return f"Error saving settings: {str(e)}"
+    except requests.exceptions.RequestException as e:
+        print(f"Error saving settings: {e}")
+        return f"Error saving settings: {str(e)}"
     except Exception as e:
         print(f"An unexpected error occurred during save: {e}")
         return f"Unexpected error during save: {str(e)}"
 
-def trigger_email_notification(class_name_detected):
-    global current_user_settings, SIMULATED_USER_ID_TOKEN, SEND_EMAIL_URL
-    target_email = current_user_settings.get("notificationEmail")
-    if not target_email:
-        print(f"No notification email configured globally. Cannot send notification for {class_name_detected}.")
-        return
-    subject = f"Object Detection Alert: {class_name_detected}"
-    body = f"A '{class_name_detected}' has been detected by your application at {time.strftime('%Y-%m-%d %H:%M:%S')}."
-    payload = {"recipient_email": target_email, "subject": subject, "body": body}
-    headers = {"Authorization": f"Bearer {SIMULATED_USER_ID_TOKEN}", "Content-Type": "application/json"}
-    try:
-        print(f"Attempting to call email notification function at {SEND_EMAIL_URL} for {class_name_detected} to {target_email}")
-        if "YOUR_SEND_EMAIL_NOTIFICATION_FUNCTION_URL" in SEND_EMAIL_URL:
-            print("Note: Email Firebase URL is a placeholder. Actual call would fail. Simulating success.")
-            print(f"Payload that would be sent: {json.dumps({'data': payload})}")
-            mock_response_data = {"result": {"message": f"Email simulation successful for: {target_email}"}}
-            print(f"Mocked successful call for {class_name_detected}. Response: {mock_response_data}")
-            return
-        response = requests.post(SEND_EMAIL_URL, json={"data": payload}, headers=headers, timeout=10)
-        response.raise_for_status()
-        print(f"Email notification function called successfully for {class_name_detected}. Response: {response.json()}")
-    except requests.exceptions.Timeout:
-        print(f"Timeout when calling email notification function for {class_name_detected}.")
-    except requests.exceptions.HTTPError as http_err:
-        print(f"HTTP error calling email notification function for {class_name_detected}: {http_err} - Response: {http_err.response.text}")
-    except requests.exceptions.RequestException as e:
-        print(f"Error calling email notification function for {class_name_detected}: {e}")
-    except Exception as e:
-        print(f"Unexpected error in trigger_email_notification for {class_name_detected}: {e}")
-
 def create_settings_ui():
     ui_components = []
     with gr.Blocks() as settings_interface:
@@ -212,6 +555,12 @@ def create_settings_ui():
                     notify_cb = gr.Checkbox(label=f"Notify on {cls} detect", value=current_user_settings["objectActions"].get(cls, {}).get("notifyOnDetect", False))
                     record_cb = gr.Checkbox(label=f"Record on {cls} detect", value=current_user_settings["objectActions"].get(cls, {}).get("recordOnDetect", False))
                     ui_components.extend([watch_cb, count_cb, notify_cb, record_cb])
+        with gr.Accordion("Detection Zones", open=False):
+            gr.Markdown('Polygons of normalized `[x, y]` points per camera name (as set next to the video), '
+                        '`"*"` for all cameras, e.g. `{"*": [[[0.1, 0.5], [0.4, 0.5], [0.4, 1.0], [0.1, 1.0]]]}`. '
+                        'Leave empty for the whole frame.')
+            zones_comp = gr.Code(language="json", value=json.dumps(editable_zones(current_user_settings.get("zones"))))
+            ui_components.append(zones_comp)
         with gr.Row():
             load_button = gr.Button("Load Settings from Firebase")
             save_button = gr.Button("Save Settings to Firebase")
@@ -221,14 +570,30 @@ def create_settings_ui():
     return settings_interface
 
 if __name__ == "__main__":
-    import numpy as np # Needed for np.zeros in detection if image is None
     video_interface = gr.Interface(
         fn=detection,
-        inputs=[gr.Image(sources=["webcam"], type="numpy", streaming=True), conf_slider],
+        inputs=[gr.Image(sources=["webcam"], type="numpy", streaming=True), conf_slider, camera_box],
         outputs=gr.Image(type="numpy"),
         live=True,
         title="Live Object Detection Stream",
     )
     settings_ui = create_settings_ui()
     app = gr.TabbedInterface([video_interface, settings_ui], ["Object Detection Stream", "Settings"])
-    app.launch()
+    # Serve the Gradio app, the Prometheus-style /metrics endpoint and the /ready probe from one server
+    server = FastAPI()
+    server.add_api_route("/metrics", metrics_endpoint, methods=["GET"])
+    server.add_api_route("/ready", ready_endpoint, methods=["GET"])
+    # Detections-only mode: WebRTC signaling (/webrtc/offer), the record stream and the browser overlay
+    record_stream.mount(server)
+    server.add_api_route("/detections/input", detections_input, methods=["POST"])
+    server.add_api_route("/detections/records", detections_records, methods=["GET"])
+    server.add_api_route("/detections/classes", detections_classes, methods=["GET"])
+    server.add_api_route("/overlay", lambda: FileResponse(os.path.join(PUBLIC_DIR, "overlay.html")), methods=["GET"])
+    server.add_api_route("/overlay.js", lambda: FileResponse(os.path.join(PUBLIC_DIR, "overlay.js"),
+                                                             media_type="text/javascript"), methods=["GET"])
+    server = gr.mount_gradio_app(server, app, path="/")
+    uvicorn.run(
+        server,
+        host=os.environ.get("GRADIO_SERVER_NAME", "127.0.0.1"),
+        port=int(os.environ.get("GRADIO_SERVER_PORT", os.environ.get("PORT", "7860"))),
+    )
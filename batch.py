@@ -0,0 +1,588 @@
+"""
+Headless detection over recorded video: every frame of the given files (and of the video
+files under the given directories) goes through the detector, the user settings and the
+tracker, and the detections are saved per input as a compressed NPZ table.
+
+Usage: python batch.py INPUT... [--output-dir detections] [--model yolov10n.onnx]
+       [--settings settings.json] [--conf 0.3] [--stride 1] [--sessions N] [--batch-size 8]
+       [--annotate] [--clips DIR] [--checkpoint-every 9000] [--report-interval 10]
+
+For each input the output directory gets NAME.npz, NAME being its path relative to the
+input argument with separators replaced by "__", with one row per tracked detection:
+frame (index in the source), time (s), box (x1, y1, x2, y2 source pixels), score,
+class_id and track_id, plus counts (distinct objects per class), class_names, source,
+fps, width, height and stride. --annotate also writes NAME.annotated-*.mp4 with the
+detections drawn on the frames; --clips records the recordOnDetect clips of the
+settings into DIR. Notifications are not sent for recorded footage.
+
+Progress is saved every --checkpoint-every source frames (NAME.part-*.npz and
+NAME.checkpoint.json), so an interrupted run picks up where it stopped when started
+again with the same arguments; inputs that already have NAME.npz are skipped.
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from actions import DetectionActions
+from inference import class_names
+from model_loader import DEFAULT_OPTIMIZED_DIR, ModelLoader
+from quantize import PRECISIONS
+from recorder import ClipRecorder
+from renderer import OverlayRenderer
+from runtime_profile import ExecutionProfile, available_cores
+from settings import CompiledSettings
+from settings_client import DEFAULT_CACHE_PATH
+from tracker import IoUTracker
+from zones import merge_detections
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".webm", ".m4v")
+STAGES = ("decode", "preprocess", "inference", "postprocess", "encode")
+
+
+def find_videos(inputs):
+    """ (path, output name) of each video file given or found under a given directory, in a stable order. """
+    videos = []
+    for path in inputs:
+        if os.path.isdir(path):
+            found = []
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                found.extend(os.path.join(root, name) for name in sorted(files)
+                             if name.lower().endswith(VIDEO_EXTENSIONS))
+            videos.extend((found_path, os.path.relpath(found_path, path)) for found_path in found)
+        elif os.path.isfile(path):
+            videos.append((path, os.path.basename(path)))
+        else:
+            raise FileNotFoundError(f"No such file or directory: {path}")
+    return [(path, name.replace(os.sep, "__").replace("/", "__")) for path, name in videos]
+
+
+def load_settings(path=None):
+    """
+    The settings dict in path (plain, or a settings cache written by the app), else in the
+    app's settings cache if there is one, else one that watches every class.
+    """
+    for candidate in [path] if path else [DEFAULT_CACHE_PATH]:
+        if os.path.exists(candidate):
+            with open(candidate) as f:
+                settings = json.load(f)
+            if "watchedObjects" not in settings and isinstance(settings.get("settings"), dict):
+                settings = settings["settings"]
+            settings.setdefault("watchedObjects", {})
+            settings.setdefault("objectActions", {})
+            settings.setdefault("notificationEmail", None)
+            return settings
+        if path:
+            raise FileNotFoundError(f"No such settings file: {path}")
+    return {"watchedObjects": {name: True for name in class_names}, "objectActions": {}, "notificationEmail": None}
+
+
+class _Video:
+    """ One input: what its decoder has read and what postprocessing has accumulated since the last checkpoint. """
+
+    def __init__(self, path, name, output_dir):
+        self.path = path
+        self.name = name
+        self.output_dir = output_dir
+        self.fps = 30.0
+        self.width = 0
+        self.height = 0
+        # Recording start, approximated from the file's modification time; frame times are offsets from it
+        self.base_time = 0.0
+        self.tracker = IoUTracker(len(class_names))
+        self.total = None
+        self.next_seq = 0
+        self.pending = {}
+        self.frames_done = 0
+
+        self.start_frame = 0
+        self.part = 0
+        self.base_counts = np.zeros(len(class_names), dtype=np.int64)
+        self.track_offset = 0
+        self.rows = []
+
+    def file(self, suffix):
+        return os.path.join(self.output_dir, self.name + suffix)
+
+    def source_key(self):
+        stat = os.stat(self.path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def resume(self):
+        """ Continues from the checkpoint of an earlier run, unless the source changed since. """
+        try:
+            with open(self.file(".checkpoint.json")) as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return
+        if checkpoint.get("source") != self.source_key():
+            return
+        self.start_frame = checkpoint["next_frame"]
+        self.part = checkpoint["parts"]
+        self.base_counts = np.array(checkpoint["counts"], dtype=np.int64)
+        self.track_offset = checkpoint["track_offset"]
+
+    def columns(self):
+        """ The rows since the last checkpoint as NPZ columns. """
+        if not self.rows:
+            return {"frame": np.empty(0, dtype=np.int32), "time": np.empty(0, dtype=np.float32),
+                    "box": np.empty((0, 4), dtype=np.int16), "score": np.empty(0, dtype=np.float16),
+                    "class_id": np.empty(0, dtype=np.int16), "track_id": np.empty(0, dtype=np.int32)}
+        frames, times, boxes, scores, class_ids, track_ids = zip(*self.rows)
+        return {
+            "frame": np.concatenate(frames).astype(np.int32),
+            "time": np.concatenate(times).astype(np.float32),
+            "box": np.clip(np.rint(np.concatenate(boxes)), -32768, 32767).astype(np.int16),
+            "score": np.concatenate(scores).astype(np.float16),
+            "class_id": np.concatenate(class_ids).astype(np.int16),
+            "track_id": np.concatenate(track_ids).astype(np.int32),
+        }
+
+    def counts(self):
+        return self.base_counts + self.tracker.unique_counts
+
+
+class _Frame:
+    """ A decoded frame on its way through the stages; parts is the number of crops inference sees. """
+
+    __slots__ = ("video", "seq", "index", "image", "parts", "results")
+
+    def __init__(self, video, seq, index, image):
+        self.video = video
+        self.seq = seq
+        self.index = index
+        self.image = image
+        self.parts = 1
+        self.results = []
+
+
+class BatchPipeline:
+    """
+    Runs detection over video files as stages that overlap, connected by bounded queues:
+
+        decode        decoders threads, one file at a time each
+        preprocess    preprocessors threads: resize and normalize, one item per zone crop
+        inference     one thread per detector, up to batch_size items per session run
+        postprocess   decoding, the settings filter and actions, tracking, in frame order
+        encode        the annotated video, with annotate
+
+    OpenCV and ONNX Runtime release the GIL while they work, so the stages run on separate
+    cores; the queues cap the frames in flight, and a full queue shows which stage limits
+    the throughput. Frames of one file are tracked in source order however the stages
+    interleave them. recorder, a ClipRecorder, gets the frames and recordOnDetect
+    triggers on the timeline of each file, and is waited for rather than dropping frames.
+    """
+
+    def __init__(self, detectors, settings, output_dir, conf_threshold=0.3, batch_size=8, decoders=2,
+                 preprocessors=2, queue_size=32, stride=1, checkpoint_every=9000, annotate=False,
+                 recorder=None, report_interval=10.0, log=print):
+        self.detectors = detectors
+        self.settings = settings
+        self.output_dir = output_dir
+        self.conf_threshold = conf_threshold
+        self.batch_size = batch_size
+        self.decoders = decoders
+        self.preprocessors = preprocessors
+        self.stride = max(1, int(stride))
+        self.checkpoint_every = checkpoint_every
+        self.annotate = annotate
+        self.recorder = recorder
+        self.report_interval = report_interval
+        self.log = log
+        self.actions = DetectionActions(class_names, recorder=recorder)
+
+        self._videos = queue.Queue()
+        self._frames = queue.Queue(queue_size)
+        self._tensors = queue.Queue(queue_size)
+        self._outputs = queue.Queue(queue_size)
+        self._encode = queue.Queue(queue_size)
+        self._stop = threading.Event()
+        self._error = None
+        self._busy = dict.fromkeys(STAGES, 0.0)
+        self._busy_lock = threading.Lock()
+        self.frames_done = 0
+        self.files_done = 0
+
+    def run(self, paths):
+        """ Processes the (path, name) inputs; returns a summary of the run. Raises the first stage error. """
+        os.makedirs(self.output_dir, exist_ok=True)
+        skipped = 0
+        for path, name in paths:
+            video = _Video(path, name, self.output_dir)
+            if os.path.exists(video.file(".npz")):
+                skipped += 1
+                continue
+            video.resume()
+            self._videos.put(video)
+        if skipped:
+            self.log(f"Skipping {skipped} input(s) with results in {self.output_dir}")
+
+        threads = {stage: [] for stage in STAGES}
+        threads["decode"] = [self._thread(self._decode_loop, f"decode-{i}") for i in range(self.decoders)]
+        threads["preprocess"] = [self._thread(self._preprocess_loop, f"preprocess-{i}")
+                                 for i in range(self.preprocessors)]
+        threads["inference"] = [self._thread(self._inference_loop, f"inference-{i}", detector)
+                                for i, detector in enumerate(self.detectors)]
+        threads["postprocess"] = [self._thread(self._postprocess_loop, "postprocess")]
+        if self.annotate:
+            threads["encode"] = [self._thread(self._encode_loop, "encode")]
+
+        started = time.perf_counter()
+        # Each stage is told to finish once all threads feeding it have, one sentinel per consumer
+        sentinels = {"decode": (self._frames, self.preprocessors), "preprocess": (self._tensors, len(self.detectors)),
+                     "inference": (self._outputs, 1), "postprocess": (self._encode, 1), "encode": (None, 0)}
+        last_report, last_frames = started, 0
+        try:
+            for stage in STAGES:
+                for thread in threads[stage]:
+                    while thread.is_alive():
+                        thread.join(0.5)
+                        now = time.perf_counter()
+                        if self.report_interval and now - last_report >= self.report_interval:
+                            self._report(now - last_report, self.frames_done - last_frames)
+                            last_report, last_frames = now, self.frames_done
+                target, count = sentinels[stage]
+                for _ in range(count):
+                    self._put(target, None)
+        except KeyboardInterrupt:
+            self._stop.set()
+            for stage_threads in threads.values():
+                for thread in stage_threads:
+                    thread.join()
+            raise
+        if self._error is not None:
+            raise self._error
+
+        elapsed = time.perf_counter() - started
+        summary = {
+            "files": self.files_done,
+            "skipped": skipped,
+            "frames": self.frames_done,
+            "seconds": elapsed,
+            "fps": self.frames_done / elapsed if elapsed > 0 else 0.0,
+            # Share of its threads' wall time each stage spent working rather than waiting on a queue
+            "busy": {stage: self._busy[stage] / (elapsed * len(threads[stage]))
+                     for stage in STAGES if threads[stage] and elapsed > 0},
+        }
+        return summary
+
+    def _thread(self, target, name, *args):
+        def run():
+            try:
+                target(*args)
+            except Exception as e:
+                if self._error is None:
+                    self._error = e
+                self._stop.set()
+        thread = threading.Thread(target=run, name=f"batch-{name}", daemon=True)
+        thread.start()
+        return thread
+
+    def _put(self, target, item):
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, source):
+        """ The next item, or None when the stage should finish. """
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def _add_busy(self, stage, seconds):
+        with self._busy_lock:
+            self._busy[stage] += seconds
+
+    def _report(self, seconds, frames):
+        depths = ", ".join(f"{name} {q.qsize()}/{q.maxsize}" for name, q in
+                           (("decoded", self._frames), ("preprocessed", self._tensors), ("inferred", self._outputs),
+                            ("to encode", self._encode)))
+        self.log(f"{self.frames_done} frames, {self.files_done} files done, {frames / seconds:.1f} fps; "
+                 f"queues: {depths}")
+
+    def _decode_loop(self):
+        while not self._stop.is_set():
+            try:
+                video = self._videos.get_nowait()
+            except queue.Empty:
+                return
+            cap = cv2.VideoCapture(video.path)
+            if not cap.isOpened():
+                self.log(f"Cannot open {video.path}, skipped")
+                continue
+            video.fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+            video.width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            video.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / video.fps
+            video.base_time = os.stat(video.path).st_mtime - duration
+            index = video.start_frame
+            if index:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            seq = 0
+            try:
+                while not self._stop.is_set():
+                    start = time.perf_counter()
+                    # Skipped frames are only demuxed, not decoded
+                    if not cap.grab():
+                        break
+                    if index % self.stride == 0:
+                        ok, image = cap.retrieve()
+                        if not ok:
+                            break
+                        self._add_busy("decode", time.perf_counter() - start)
+                        if not self._put(self._frames, _Frame(video, seq, index, image)):
+                            break
+                        seq += 1
+                    else:
+                        self._add_busy("decode", time.perf_counter() - start)
+                    index += 1
+            finally:
+                cap.release()
+            # Straight to postprocessing, which finishes the file once it has seen seq frames
+            self._put(self._outputs, ("end", video, seq))
+
+    def _preprocess_loop(self):
+        model = self.detectors[0]
+        while True:
+            frame = self._get(self._frames)
+            if frame is None:
+                return
+            start = time.perf_counter()
+            zones = self.settings.zones_for(frame.video.name)
+            crops = zones.crops(frame.image) if zones is not None else [(frame.image, None)]
+            frame.parts = len(crops)
+            items = []
+            for view, crop in crops:
+                # A fresh tensor per item: it waits in the queue while this thread prepares the next
+                tensor = np.empty((3, model.input_height, model.input_width), dtype=np.float32)
+                _, geometry = model.prepare_input(view, "BGR", out=tensor)
+                items.append((frame, crop, tensor, geometry))
+            self._add_busy("preprocess", time.perf_counter() - start)
+            for item in items:
+                if not self._put(self._tensors, item):
+                    return
+
+    def _inference_loop(self, detector):
+        batch_size = self.batch_size if detector.supports_batching else 1
+        batch_tensor = np.empty((batch_size, 3, detector.input_height, detector.input_width), dtype=np.float32)
+        finished = False
+        while not finished:
+            item = self._get(self._tensors)
+            if item is None:
+                return
+            items = [item]
+            # Take what is already waiting, up to a full batch, without holding the first item back
+            while len(items) < batch_size:
+                try:
+                    item = self._tensors.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    finished = True
+                    break
+                items.append(item)
+
+            start = time.perf_counter()
+            if len(items) == 1:
+                output = detector.run_session(items[0][2][None]).copy()
+            else:
+                tensor = batch_tensor[:len(items)]
+                np.stack([tensor for _, _, tensor, _ in items], out=tensor)
+                output = detector.run_session(tensor).copy()
+            self._add_busy("inference", time.perf_counter() - start)
+            for i, (frame, crop, _, geometry) in enumerate(items):
+                if not self._put(self._outputs, ("output", frame, crop, output[i:i + 1], geometry)):
+                    return
+
+    def _postprocess_loop(self):
+        model = self.detectors[0]
+        while True:
+            item = self._get(self._outputs)
+            if item is None:
+                return
+            start = time.perf_counter()
+            if item[0] == "end":
+                _, video, total = item
+                video.total = total
+            else:
+                _, frame, crop, output, geometry = item
+                video = frame.video
+                frame.results.append(model.process_output(output, self.conf_threshold, geometry,
+                                                          self.settings.watched, crop))
+                if len(frame.results) == frame.parts:
+                    video.pending[frame.seq] = frame
+            while video.next_seq in video.pending:
+                self._process_frame(video.pending.pop(video.next_seq))
+                video.next_seq += 1
+            if video.total is not None and video.next_seq == video.total:
+                self._finish(video)
+            self._add_busy("postprocess", time.perf_counter() - start)
+
+    def _process_frame(self, frame):
+        video = frame.video
+        timestamp = frame.index / video.fps
+        if self.recorder is not None:
+            while self.recorder.backlog >= self.recorder.max_backlog - 1 and not self._stop.is_set():
+                time.sleep(0.005)
+            self.recorder.add_frame(video.name, frame.image, "BGR", video.base_time + timestamp)
+        boxes, scores, class_ids = merge_detections(frame.results)
+        boxes, scores, class_ids = self.actions.filter(boxes, scores, class_ids, self.settings,
+                                                       video.name, video.base_time + timestamp)
+        boxes, scores, class_ids, track_ids = video.tracker.update(boxes, scores, class_ids)
+        if track_ids.shape[0]:
+            video.rows.append((np.full(track_ids.shape[0], frame.index), np.full(track_ids.shape[0], timestamp),
+                               boxes, scores, class_ids, track_ids + video.track_offset))
+        if self.annotate:
+            self._put(self._encode, ("frame", video, video.part, frame.image, boxes, scores, class_ids,
+                                     video.counts()))
+        video.frames_done += 1
+        self.frames_done += 1
+        if frame.index + 1 - video.start_frame >= self.checkpoint_every:
+            self._checkpoint(video, frame.index + 1)
+
+    def _checkpoint(self, video, next_frame):
+        """ Saves the rows since the last checkpoint as the next part, then where to continue from. """
+        np.savez_compressed(video.file(f".part-{video.part:04d}.npz"), **video.columns())
+        if self.annotate:
+            # The checkpoint may only cover annotated frames that are on disk
+            self._put(self._encode, ("close", video, video.part))
+            while self._encode.unfinished_tasks and not self._stop.is_set():
+                time.sleep(0.01)
+        counts = video.counts()
+        track_offset = max([video.track_offset] + [int(row[-1].max()) for row in video.rows])
+        temp_path = video.file(f".checkpoint.{os.getpid()}.tmp")
+        with open(temp_path, "w") as f:
+            json.dump({"source": video.source_key(), "next_frame": next_frame, "parts": video.part + 1,
+                       "counts": counts.tolist(), "track_offset": track_offset}, f)
+        os.replace(temp_path, video.file(".checkpoint.json"))
+        video.rows = []
+        video.part += 1
+        video.start_frame = next_frame
+        video.base_counts = counts
+        video.track_offset = track_offset
+        # A resumed run starts with a fresh tracker, so an uninterrupted one does too
+        video.tracker.reset()
+
+    def _finish(self, video):
+        """ Merges the parts and the remaining rows into NAME.npz and removes the checkpoint files. """
+        if self._stop.is_set():
+            return
+        parts = [video.file(f".part-{part:04d}.npz") for part in range(video.part)]
+        columns = [dict(np.load(path)) for path in parts] + [video.columns()]
+        merged = {key: np.concatenate([part[key] for part in columns]) for key in columns[-1]}
+        if self.annotate:
+            self._put(self._encode, ("close", video, video.part))
+        if self.recorder is not None:
+            self.recorder.end_stream(video.name)
+        temp_path = video.file(f".{os.getpid()}.tmp.npz")
+        np.savez_compressed(temp_path, **merged, counts=video.counts(), class_names=np.array(class_names),
+                            source=np.array(os.path.abspath(video.path)), fps=video.fps, width=video.width,
+                            height=video.height, stride=self.stride)
+        os.replace(temp_path, video.file(".npz"))
+        for path in parts:
+            os.remove(path)
+        if video.part:
+            os.remove(video.file(".checkpoint.json"))
+        self.files_done += 1
+        found = ", ".join(f"{count} {class_names[i]}" for i, count in enumerate(video.counts()) if count)
+        self.log(f"{video.path}: {merged['frame'].shape[0]} detections in {video.frames_done} frames"
+                 f"{'; ' + found if found else ''}")
+
+    def _encode_loop(self):
+        writers = {}
+        while True:
+            item = self._get(self._encode)
+            if item is None:
+                break
+            start = time.perf_counter()
+            kind, video, part = item[:3]
+            key = (video.name, part)
+            if kind == "close":
+                writer = writers.pop(key, None)
+                if writer is not None:
+                    writer[0].release()
+            else:
+                image, boxes, scores, class_ids, counts = item[3:]
+                writer = writers.get(key)
+                if writer is None:
+                    height, width = image.shape[:2]
+                    writer = writers[key] = (
+                        cv2.VideoWriter(video.file(f".annotated-{part:04d}.mp4"), cv2.VideoWriter_fourcc(*"mp4v"),
+                                        video.fps / self.stride, (width, height)),
+                        OverlayRenderer(output_size=(width, height), color_order="BGR"))
+                shown = {class_names[i]: int(count) for i, count in enumerate(counts) if count}
+                writer[0].write(writer[1].render(image, boxes, scores, class_ids, shown, image_order="BGR"))
+            self._add_busy("encode", time.perf_counter() - start)
+            self._encode.task_done()
+        for writer, _ in writers.values():
+            writer.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="Video files and directories to search for them")
+    parser.add_argument("--output-dir", default="detections")
+    parser.add_argument("--model", help="Local ONNX model (default: the app's model from Hugging Face)")
+    parser.add_argument("--offline", action="store_true", help="Only use the Hugging Face cache")
+    parser.add_argument("--precision", choices=PRECISIONS, default="fp32")
+    parser.add_argument("--profile", help="ExecutionProfile JSON saved by runtime_profile.py")
+    parser.add_argument("--letterbox", action="store_true")
+    parser.add_argument("--settings", help=f"Settings JSON (default: {DEFAULT_CACHE_PATH} if present, "
+                                           "else every class watched)")
+    parser.add_argument("--conf", type=float, default=0.3)
+    parser.add_argument("--stride", type=int, default=1, help="Process every Nth frame")
+    parser.add_argument("--sessions", type=int, default=max(1, available_cores() // 4))
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--decoders", type=int, default=2)
+    parser.add_argument("--preprocessors", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=32)
+    parser.add_argument("--annotate", action="store_true", help="Also write annotated videos")
+    parser.add_argument("--clips", help="Record the recordOnDetect clips of the settings into this directory")
+    parser.add_argument("--checkpoint-every", type=int, default=9000, help="Source frames between checkpoints")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="Seconds between progress lines")
+    args = parser.parse_args()
+
+    videos = find_videos(args.inputs)
+    settings = CompiledSettings.compile(load_settings(args.settings), class_names, class_names)
+    loader = ModelLoader(local_path=args.model, offline=args.offline, precision=args.precision,
+                         profile=ExecutionProfile.load(args.profile) if args.profile else None,
+                         letterbox=args.letterbox, optimized_dir=DEFAULT_OPTIMIZED_DIR,
+                         warmup_batch_size=args.batch_size, sessions=args.sessions)
+    loader.wait()
+    print(f"{len(videos)} input(s), {len(loader.detectors)} session(s) of {loader.model_path}")
+
+    recorder = None
+    if args.clips:
+        # Clips end on the timeline of the files, not the wall clock; retention is left to the user
+        recorder = ClipRecorder(args.clips, clock=lambda: 0.0, retention=float("inf"), max_disk_bytes=float("inf"))
+    pipeline = BatchPipeline(loader.detectors, settings, args.output_dir, conf_threshold=args.conf,
+                             batch_size=args.batch_size, decoders=args.decoders, preprocessors=args.preprocessors,
+                             queue_size=args.queue_size, stride=args.stride, checkpoint_every=args.checkpoint_every,
+                             annotate=args.annotate, recorder=recorder, report_interval=args.report_interval)
+    try:
+        summary = pipeline.run(videos)
+    finally:
+        if recorder is not None:
+            recorder.close()
+    busy = ", ".join(f"{stage} {share:.0%}" for stage, share in summary["busy"].items())
+    print(f"{summary['files']} file(s), {summary['frames']} frames in {summary['seconds']:.1f} s: "
+          f"{summary['fps']:.1f} fps sustained; stage busy: {busy}")
+    if recorder is not None:
+        print(f"{recorder.clips_written} clip(s) in {args.clips}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class BatchingDetector:
+    """
+    Gathers frames from concurrent streams into batched YOLOv10 inference calls.
+
+    Each caller of detect_objects blocks until its frame has been run. A batch is
+    dispatched as soon as max_batch_size frames are waiting, or max_wait_ms after
+    the first frame of the batch arrived, whichever comes first. It only waits while
+    more frames can be expected within that time: the rate of recent arrivals and how
+    many other requests were in flight when they arrived are tracked, so a lone stream
+    (or streams too sparse to share a batch) is dispatched without waiting at all.
+
+    models may be a single detector or a pool of them (one per ONNX Runtime session).
+    Every detector gets its own scheduler thread pulling batches from the shared queue,
+    so up to len(models) batches run in parallel.
+    """
+
+    def __init__(self, models, max_batch_size=8, max_wait_ms=10.0):
+        self.models = list(models) if isinstance(models, (list, tuple)) else [models]
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self.batches_run = 0
+        self.frames_run = 0
+
+        # Smoothed over recent arrivals: seconds between them, and other requests in flight at each
+        self._arrival_gap = None
+        self._arrival_concurrency = 0.0
+        self._last_arrival = None
+        self._in_flight = 0
+
+        self._queue = queue.Queue()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._run, args=(model,), name=f"yolo-batcher-{i}", daemon=True)
+                         for i, model in enumerate(self.models)]
+        for thread in self._threads:
+            thread.start()
+
+    def detect_objects(self, image, conf_threshold=0.3, channel_order="BGR", class_mask=None, zones=None):
+        """ Same contract as YOLOv10.detect_objects, but shares session.run with other streams. """
+        if self._closed:
+            raise RuntimeError("BatchingDetector has been closed.")
+        future = Future()
+        self._record_arrival()
+        try:
+            self._queue.put((image, conf_threshold, channel_order, class_mask, zones, future))
+            return future.result()
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    @property
+    def mean_batch_size(self):
+        return self.frames_run / self.batches_run if self.batches_run else 0.0
+
+    def close(self):
+        """ Stops the scheduler threads after the frames already queued have been served. """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            for thread in self._threads:
+                thread.join()
+
+    def _record_arrival(self, smoothing=0.2):
+        now = time.perf_counter()
+        with self._stats_lock:
+            if self._last_arrival is not None:
+                gap = now - self._last_arrival
+                self._arrival_gap = gap if self._arrival_gap is None else \
+                    self._arrival_gap + smoothing * (gap - self._arrival_gap)
+            self._arrival_concurrency += smoothing * (self._in_flight - self._arrival_concurrency)
+            self._last_arrival = now
+            self._in_flight += 1
+
+    def _worth_waiting(self, remaining):
+        """ Whether another frame is likely to arrive within remaining seconds. """
+        with self._stats_lock:
+            if self._arrival_gap is None or self._arrival_concurrency < 0.5:
+                # Frames mostly arrive with nothing else in flight, i.e. from a single stream at a time
+                return False
+            return self._arrival_gap < remaining
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if self._queue.empty() and not self._worth_waiting(remaining):
+                break
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Put the sentinel back so the loop stops once this batch is served
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self, model):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                # Pass the sentinel on so every scheduler thread stops
+                self._queue.put(None)
+                return
+            images = [item[0] for item in batch]
+            conf_thresholds = [item[1] for item in batch]
+            channel_orders = [item[2] for item in batch]
+            class_masks = [item[3] for item in batch]
+            zones = [item[4] for item in batch]
+            futures = [item[5] for item in batch]
+            try:
+                results = model.detect_objects_batch(images, conf_thresholds, channel_orders, class_masks, zones)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            with self._stats_lock:
+                self.batches_run += 1
+                self.frames_run += len(batch)
+            for future, result in zip(futures, results):
+                future.set_result(result)
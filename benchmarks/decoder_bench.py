@@ -0,0 +1,174 @@
+"""
+Benchmark for the detection decoder.
+
+Decodes output tensors with the original process_output (raw YOLOv8-style layout
+only, normalized boxes) and with DetectionDecoder and reports time per frame, for all
+classes and for a few watched ones (the app's class_mask). Output tensors are synthetic
+unless recorded ones are given with --recorded (a .npy file holding one output of shape
+[1, rows, cols] or a stack of them [frames, rows, cols]).
+
+tests/test_decoder.py checks that both decoders agree, on synthetic outputs and on
+data/decoder_raw320.npz: outputs recorded from ONNX Runtime running the synthetic raw
+model (synthetic_model.py, 320 input) on synthetic 1280x720 frames, with boxes in input
+pixels. --record-fixture regenerates the fixture.
+
+Usage: python benchmarks/decoder_bench.py [--recorded outputs.npy] [--iterations 500] [--record-fixture]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+from decoder import LAYOUT_RAW, DetectionDecoder, detect_layout  # noqa: E402
+
+NUM_CLASSES = 80
+INPUT_SIZE = 640
+FRAME_WIDTH, FRAME_HEIGHT = 1280, 720
+FIXTURE_PATH = os.path.join(BENCH_DIR, "data", "decoder_raw320.npz")
+FIXTURE_INPUT_SIZE = 320
+# The app's UI classes: person, car, dog, cat, bottle
+WATCHED_CLASSES = (0, 2, 16, 15, 39)
+
+
+def legacy_process_output(output, conf_threshold, img_width, img_height):
+    """ The decoder as it was in YOLOv10.process_output / extract_boxes / rescale_boxes. """
+    predictions = np.squeeze(output).T
+    scores = np.max(predictions[:, 4:], axis=1)
+    predictions = predictions[scores > conf_threshold, :]
+    scores = scores[scores > conf_threshold]
+    if scores.shape[0] == 0:
+        return np.array([]), np.array([]), np.array([])
+    class_ids = np.argmax(predictions[:, 4:], axis=1)
+    boxes = predictions[:, :4]
+    boxes[:, 0] *= img_width
+    boxes[:, 1] *= img_height
+    boxes[:, 2] *= img_width
+    boxes[:, 3] *= img_height
+    x1 = boxes[:, 0] - boxes[:, 2] / 2
+    y1 = boxes[:, 1] - boxes[:, 3] / 2
+    x2 = boxes[:, 0] + boxes[:, 2] / 2
+    y2 = boxes[:, 1] + boxes[:, 3] / 2
+    return np.column_stack((x1, y1, x2, y2)), scores, class_ids
+
+
+def synthetic_raw(rng, anchors=8400, objects=20):
+    output = np.empty((1, 4 + NUM_CLASSES, anchors), dtype=np.float32)
+    output[0, :2] = rng.uniform(0.05, 0.95, size=(2, anchors))
+    output[0, 2:4] = rng.uniform(0.01, 0.2, size=(2, anchors))
+    output[0, 4:] = rng.uniform(0.0, 0.05, size=(NUM_CLASSES, anchors))
+    hits = rng.choice(anchors, size=objects, replace=False)
+    output[0, 4 + rng.integers(0, NUM_CLASSES, size=objects), hits] = rng.uniform(0.4, 0.99, size=objects)
+    return output
+
+
+def synthetic_end2end(rng, rows=300, objects=20):
+    output = np.zeros((1, rows, 6), dtype=np.float32)
+    xy = rng.uniform(0, INPUT_SIZE - 100, size=(rows, 2))
+    output[0, :, :2] = xy
+    output[0, :, 2:4] = xy + rng.uniform(5, 100, size=(rows, 2))
+    output[0, :, 4] = rng.uniform(0.0, 0.1, size=rows)
+    output[0, :objects, 4] = rng.uniform(0.4, 0.99, size=objects)
+    output[0, :, 5] = rng.integers(0, NUM_CLASSES, size=rows)
+    return output
+
+
+def time_per_frame(fn, outputs, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(outputs[i % len(outputs)])
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+def legacy_masked(output, conf_threshold, img_width, img_height, class_mask=None):
+    """
+    The legacy decoder restricted to class_mask: the scores of other classes are zeroed first,
+    so, as with the decoder, a box takes its best-scoring watched class.
+    """
+    output = output.copy()
+    if class_mask is not None:
+        output[..., 4:4 + NUM_CLASSES, :][..., ~class_mask, :] = 0.0
+    return legacy_process_output(output, conf_threshold, img_width, img_height)
+
+
+def agrees(legacy, decoded):
+    """ Whether the decoder's detections are the legacy ones, in score order. """
+    boxes, scores, class_ids = (np.asarray(values) for values in legacy)
+    order = np.argsort(-scores, kind="stable")
+    new_boxes, new_scores, new_class_ids = decoded
+    return (len(scores) == len(new_scores) and np.allclose(boxes[order].reshape(-1, 4), new_boxes, atol=1e-3)
+            and np.allclose(scores[order], new_scores) and np.array_equal(class_ids[order], new_class_ids))
+
+
+def record_fixture(path, frames=3):
+    """ Runs the synthetic raw model on synthetic frames and saves its outputs, boxes in input pixels. """
+    import onnxruntime
+
+    from pipeline_bench import synthetic_frames
+    from preprocess import Preprocessor
+    from synthetic_model import build_model
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    model_path = build_model(f"{path}.onnx", "raw", FIXTURE_INPUT_SIZE)
+    try:
+        session = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        preprocessor = Preprocessor(FIXTURE_INPUT_SIZE, FIXTURE_INPUT_SIZE)
+        outputs = [session.run(None, {"images": preprocessor(frame, "RGB")[0]})[0][0]
+                   for frame in synthetic_frames(FRAME_WIDTH, FRAME_HEIGHT, frames)]
+    finally:
+        os.remove(model_path)
+    np.savez_compressed(path, outputs=np.stack(outputs), frame_size=np.array([FRAME_WIDTH, FRAME_HEIGHT]))
+    print(f"Recorded {len(outputs)} outputs of shape {list(outputs[0].shape)} to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recorded", help="Path to a .npy file of recorded model outputs")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--conf-threshold", type=float, default=0.3)
+    parser.add_argument("--record-fixture", action="store_true", help=f"Re-record {FIXTURE_PATH} and exit")
+    args = parser.parse_args()
+
+    if args.record_fixture:
+        record_fixture(FIXTURE_PATH)
+        return
+
+    rng = np.random.default_rng(0)
+    geometry = (INPUT_SIZE / FRAME_WIDTH, INPUT_SIZE / FRAME_HEIGHT, 0, 0)
+    if args.recorded:
+        recorded = np.load(args.recorded)
+        suites = {"recorded": [recorded[i:i + 1] for i in range(len(recorded))]}
+    else:
+        suites = {
+            "raw": [synthetic_raw(rng) for _ in range(8)],
+            "end2end": [synthetic_end2end(rng) for _ in range(8)],
+        }
+
+    for name, outputs in suites.items():
+        shape = outputs[0].shape
+        decoder = DetectionDecoder([{"shape": list(shape)}], INPUT_SIZE, INPUT_SIZE,
+                                   num_classes=NUM_CLASSES).calibrate(outputs[0])
+        mask = np.zeros(NUM_CLASSES, dtype=bool)
+        mask[list(WATCHED_CLASSES)] = True
+        print(f"{name}: shape={list(shape)} layout={detect_layout(shape, NUM_CLASSES)}")
+        new_ms = time_per_frame(lambda o: decoder.decode(o, args.conf_threshold, geometry), outputs, args.iterations)
+        masked_ms = time_per_frame(lambda o: decoder.decode(o, args.conf_threshold, geometry, mask),
+                                   outputs, args.iterations)
+        if decoder.layout == LAYOUT_RAW:
+            legacy_ms = time_per_frame(
+                lambda o: legacy_process_output(o, args.conf_threshold, FRAME_WIDTH, FRAME_HEIGHT),
+                [o.copy() for o in outputs], args.iterations)
+            print(f"  legacy                {legacy_ms:8.3f} ms/frame  (all classes)")
+            print(f"  decoder, all classes  {new_ms:8.3f} ms/frame  ({legacy_ms / new_ms:.2f}x)")
+            print(f"  decoder, {len(WATCHED_CLASSES)} watched    {masked_ms:8.3f} ms/frame  ({legacy_ms / masked_ms:.2f}x)")
+        else:
+            print(f"  decoder, all classes  {new_ms:8.3f} ms/frame  (no legacy decoder for this layout)")
+            print(f"  decoder, {len(WATCHED_CLASSES)} watched    {masked_ms:8.3f} ms/frame")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Function invocations and Firestore writes of detection notifications, per delivery path.
+
+A synthetic scene (objects entering and leaving the view of several cameras, every
+class watched with notifyOnDetect) is run through a real IoUTracker per camera and
+delivered as
+    per-detection  one send_email_notification call per detection per frame
+    dispatcher     NotificationDispatcher: per-class cooldown, coalesced per window
+    ingest         EventUploader batches of tracker "enter" events, one
+                   ingest_detection_events call per flush interval
+Writes of the email paths count the Trigger Email "mail" document of each email.
+The ingest writes are counted by running firebase_functions/events.py against an
+in-memory Firestore stand-in, plus the email state and mail documents, including those
+of the scheduled flush of held-back counts (flush_pending_emails).
+
+A burst of detections followed by silence is also run with and without the flush, to
+show how many of the counts the rate limit held back are emailed
+(tests/test_events.py checks that all of them are).
+
+Usage: python benchmarks/events_bench.py [--cameras 4] [--minutes 10] [--arrivals-per-minute 12]
+"""
+import argparse
+import itertools
+import os
+import sys
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "firebase_functions"))
+
+from events import (EMAIL_FLUSH_PERIOD_S, EMAIL_MIN_INTERVAL_S, flush_email, notify_counts, plan_email,  # noqa: E402
+                    write_events)
+from tracker import TRACK_ENTER, IoUTracker  # noqa: E402
+
+CLASSES = ["person", "car", "dog", "cat", "bottle"]
+
+
+class Increment:
+    """ Stand-in for firestore.Increment. """
+
+    def __init__(self, value):
+        self.value = value
+
+
+class InMemoryFirestore:
+    """ Just enough of the Firestore client for events.write_events, counting writes and commits. """
+
+    def __init__(self):
+        self.documents = {}
+        self.writes = 0
+        self.commits = 0
+        self._ids = itertools.count()
+
+    def collection(self, name):
+        return _Reference(self, (name,))
+
+    def batch(self):
+        return _Batch(self)
+
+
+class _Reference:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+
+    def collection(self, name):
+        return _Reference(self.db, self.path + (name,))
+
+    def document(self, document_id=None):
+        return _Reference(self.db, self.path + (document_id or f"auto-{next(self.db._ids)}",))
+
+
+class _Batch:
+    def __init__(self, db):
+        self.db = db
+        self.pending = []
+
+    def set(self, ref, data, merge=False):
+        if len(self.pending) == 500:
+            raise ValueError("A batch accepts at most 500 writes.")
+        self.pending.append((ref.path, data, merge))
+
+    def commit(self):
+        for path, data, merge in self.pending:
+            self.db.documents[path] = _merge(self.db.documents.get(path, {}) if merge else {}, data)
+        self.db.writes += len(self.pending)
+        self.db.commits += 1
+
+
+def _merge(existing, data):
+    merged = dict(existing)
+    for key, value in data.items():
+        if isinstance(value, Increment):
+            merged[key] = merged.get(key, 0) + value.value
+        elif isinstance(value, dict):
+            merged[key] = _merge(merged.get(key, {}), value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def synthetic_scene(cameras, seconds, fps, arrivals_per_minute, seed=0):
+    """ Per camera, a list of (start_frame, end_frame, class, box, velocity) objects. """
+    rng = np.random.default_rng(seed)
+    scene = []
+    for _ in range(cameras):
+        objects = []
+        count = rng.poisson(arrivals_per_minute * seconds / 60)
+        for start in np.sort(rng.uniform(0, seconds, count)):
+            dwell = rng.uniform(5, 30)
+            x, y = rng.uniform(0, 1100), rng.uniform(0, 560)
+            size = rng.uniform(60, 160)
+            objects.append((int(start * fps), int((start + dwell) * fps), str(rng.choice(CLASSES)),
+                            np.array([x, y, x + size, y + size], dtype=np.float32), rng.normal(0, 1.5, 2)))
+        scene.append(objects)
+    return scene
+
+
+def run_trackers(scene, frames, fps):
+    """ Detections per frame and (timestamp, camera, class, track id) enter events. """
+    class_ids = {name: i for i, name in enumerate(CLASSES)}
+    detections, events = [], []
+    for camera, objects in enumerate(scene):
+        tracker = IoUTracker(len(CLASSES))
+        for frame in range(frames):
+            visible = [(class_name, box + np.tile(velocity * (frame - start), 2))
+                       for start, end, class_name, box, velocity in objects if start <= frame < end]
+            boxes = np.array([box for _, box in visible], dtype=np.float32).reshape(-1, 4)
+            ids = np.array([class_ids[name] for name, _ in visible], dtype=np.int64)
+            tracker.update(boxes, np.full(len(visible), 0.9, dtype=np.float32), ids)
+            timestamp = frame / fps
+            detections.extend((timestamp, name) for name, _ in visible)
+            events.extend((timestamp, f"camera-{camera}", CLASSES[class_id], track_id)
+                          for kind, track_id, class_id in tracker.events if kind == TRACK_ENTER)
+    return detections, sorted(events)
+
+
+def dispatcher_calls(detections, cooldown, coalesce_window):
+    """ Calls NotificationDispatcher makes: per-class cooldown, then one call per coalescing window. """
+    last_notified, accepted = {}, []
+    for timestamp, class_name in sorted(detections):
+        last = last_notified.get(class_name)
+        if last is None or timestamp - last >= cooldown:
+            last_notified[class_name] = timestamp
+            accepted.append(timestamp)
+    calls, window_end = 0, None
+    for timestamp in accepted:
+        if window_end is None or timestamp > window_end:
+            calls += 1
+            window_end = timestamp + coalesce_window
+    return calls
+
+
+def ingest(events, flush_interval, flush_period=None, until=0.0):
+    """
+    Invocations, writes, emails (with the times they went out) and emailed counts of batched
+    ingestion into an in-memory Firestore, with the scheduled flush every flush_period
+    seconds up to until, or none if flush_period is None.
+    """
+    db = InMemoryFirestore()
+    preferences = {"objectActions": {name: {"notifyOnDetect": True} for name in CLASSES}}
+    # (time, ingest batch), flushes sorting first (None) at equal times
+    calls = [((window + 1) * flush_interval, [
+        {"class": class_name, "trackId": track_id, "timestamp": 1.7e9 + timestamp, "camera": camera}
+        for timestamp, camera, class_name, track_id in window_events])
+        for window, window_events in itertools.groupby(events, key=lambda event: int(event[0] // flush_interval))]
+    if flush_period is not None:
+        calls += [(float(tick), None) for tick in np.arange(flush_period, until + flush_period, flush_period)]
+    state, invocations, extra_writes, sent_at, emailed = None, 0, 0, [], 0
+    for now, batch in sorted(calls, key=lambda call: (call[0], call[1] is not None)):
+        if batch is None:
+            # The flush only reads states with nothing due; a sent email rewrites the state
+            state, email = flush_email(state, now)
+            extra_writes += 2 * (email is not None)
+        else:
+            invocations += 1
+            write_events(db, "bench-user", batch, Increment)
+            counts = notify_counts(batch, preferences)
+            if not counts:
+                continue
+            state, email = plan_email(state, counts, now)
+            # Email state document, plus the mail document of a sent email
+            extra_writes += 1 + (email is not None)
+        if email is not None:
+            sent_at.append(now)
+            emailed += sum(email[0].values())
+    return invocations, db.writes + extra_writes, sent_at, emailed, db.commits
+
+
+def report_burst_then_silence(flush_interval, seconds=120, until=1800, seed=1):
+    """ A burst of arrivals then silence, emailed with and without the scheduled flush. """
+    rng = np.random.default_rng(seed)
+    events = sorted((float(t), "camera-0", str(rng.choice(CLASSES)), i)
+                    for i, t in enumerate(rng.uniform(0, seconds, 40)))
+    _, _, unflushed_sent, unflushed, _ = ingest(events, flush_interval)
+    _, _, sent_at, emailed, _ = ingest(events, flush_interval, EMAIL_FLUSH_PERIOD_S, until)
+    print(f"burst then silence: {len(events)} objects in {seconds} s; without the flush "
+          f"{unflushed}/{len(events)} emailed in {len(unflushed_sent)} email(s), with it {emailed}/{len(events)} "
+          f"in {len(sent_at)}, the last {sent_at[-1] - events[-1][0]:.0f} s after the burst")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cameras", type=int, default=4)
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--fps", type=int, default=15)
+    parser.add_argument("--arrivals-per-minute", type=float, default=12)
+    parser.add_argument("--flush-interval", type=float, default=5.0)
+    parser.add_argument("--cooldown", type=float, default=60.0)
+    parser.add_argument("--coalesce-window", type=float, default=2.0)
+    args = parser.parse_args()
+
+    seconds = args.minutes * 60
+    frames = int(seconds * args.fps)
+    scene = synthetic_scene(args.cameras, seconds, args.fps, args.arrivals_per_minute)
+    detections, events = run_trackers(scene, frames, args.fps)
+    print(f"{args.cameras} cameras, {args.minutes:g} min at {args.fps} fps: "
+          f"{len(detections)} detections, {len(events)} tracked objects")
+
+    calls = dispatcher_calls(detections, args.cooldown, args.coalesce_window)
+    invocations, writes, sent_at, emailed, commits = ingest(events, args.flush_interval, EMAIL_FLUSH_PERIOD_S,
+                                                            seconds + EMAIL_MIN_INTERVAL_S + EMAIL_FLUSH_PERIOD_S)
+    rows = [
+        ("per-detection", len(detections), len(detections), len(detections)),
+        ("dispatcher", calls, calls, calls),
+        ("ingest", invocations, writes, len(sent_at)),
+    ]
+    print(f"{'path':<14} {'invocations':>12} {'writes':>10} {'emails':>8}")
+    for name, row_invocations, row_writes, row_emails in rows:
+        print(f"{name:<14} {row_invocations:>12} {row_writes:>10} {row_emails:>8}")
+    print(f"ingest: {commits} batch commits, at most one email per {EMAIL_MIN_INTERVAL_S} s, "
+          f"{emailed}/{len(events)} tracked objects emailed; the dispatcher keeps one class mention per cooldown")
+    report_burst_then_silence(args.flush_interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Accuracy/compute tradeoff of keyframe inference on a synthetic moving-object scene.
+
+A simulated detector returns the ground-truth boxes with jitter and a fixed cost per
+call. Every frame is first run through the detector ("full"), then through
+KeyframeScheduler + IoUTracker propagation at several latency budgets. For each
+mode it reports the fraction of frames that ran the detector, the detector time
+per frame, and recall / mean IoU of the output boxes against ground truth.
+
+A second table sets the confidence floor, the margin above the app's confidence
+threshold under which a keyframe forces the next one. Scores there sit just above the
+threshold, as with a real detector on a hard scene, and fall with an object's speed, so
+low scores mark the boxes propagation gets wrong. It shows how far each margin pulls
+the interval back toward 1 and what recall that buys.
+
+Usage: python benchmarks/keyframe_bench.py [--frames 600] [--objects 12] [--detector-ms 40]
+"""
+import argparse
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from keyframe import MARGIN, KeyframeScheduler  # noqa: E402
+from tracker import IoUTracker, iou_matrix  # noqa: E402
+
+WIDTH, HEIGHT = 1280, 720
+
+
+class SyntheticScene:
+    """ Boxes moving at constant velocity that bounce off the frame edges. """
+
+    def __init__(self, objects, rng):
+        self.rng = rng
+        self.sizes = rng.uniform(40, 160, size=(objects, 2))
+        self.positions = rng.uniform(0, 1, size=(objects, 2)) * ([WIDTH, HEIGHT] - self.sizes)
+        self.velocities = rng.uniform(-6, 6, size=(objects, 2))
+        self.colors = rng.integers(60, 255, size=(objects, 3))
+
+    def step(self):
+        self.positions += self.velocities
+        limits = np.array([WIDTH, HEIGHT]) - self.sizes
+        bounced = (self.positions < 0) | (self.positions > limits)
+        self.velocities[bounced] *= -1
+        self.positions = np.clip(self.positions, 0, limits)
+        return np.hstack((self.positions, self.positions + self.sizes)).astype(np.float32)
+
+    def render(self, boxes):
+        frame = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+        for box, color in zip(boxes.astype(int), self.colors.tolist()):
+            cv2.rectangle(frame, tuple(box[:2]), tuple(box[2:]), color, -1)
+        return frame
+
+
+def simulated_detector(gt_boxes, rng, jitter=2.0, speeds=None, conf_threshold=None):
+    """
+    Ground truth with jitter. Scores are 0.6-0.95, or with conf_threshold, up to 0.25 above
+    it, mostly close to it, and lower the faster the object (speeds in px/frame, up to
+    about 8.5).
+    """
+    boxes = gt_boxes + rng.normal(0, jitter, size=gt_boxes.shape).astype(np.float32)
+    if conf_threshold is None:
+        scores = rng.uniform(0.6, 0.95, size=len(gt_boxes))
+    else:
+        # Skewed toward the threshold, as most detections of a hard scene are
+        sharpness = 1 - np.clip(speeds / 8.5, 0, 1)
+        scores = conf_threshold + 0.25 * np.clip(sharpness + rng.normal(0, 0.15, len(gt_boxes)), 0.02, 1) ** 2
+    return boxes, scores.astype(np.float32), np.zeros(len(gt_boxes), dtype=np.int64)
+
+
+def score_frame(pred_boxes, gt_boxes):
+    """ Returns (matched at IoU >= 0.5, sum of IoU of best matches). """
+    if len(pred_boxes) == 0:
+        return 0, 0.0
+    best = iou_matrix(gt_boxes, np.asarray(pred_boxes, dtype=np.float32)).max(axis=1)
+    return int((best >= 0.5).sum()), float(best.sum())
+
+
+def run(args, budget_ms, confidence_margin=None, conf_threshold=None):
+    rng = np.random.default_rng(args.seed)
+    scene = SyntheticScene(args.objects, rng)
+    tracker = IoUTracker(num_classes=1, min_hits=1)
+    scheduler = None
+    if budget_ms:
+        options = {} if confidence_margin is None else {"confidence_margin": confidence_margin}
+        scheduler = KeyframeScheduler(latency_budget_ms=budget_ms, max_interval=args.max_interval, **options)
+    calls = matched = 0
+    iou_sum = 0.0
+    for _ in range(args.frames):
+        gt = scene.step()
+        if scheduler is None or scheduler.should_run(scene.render(gt)):
+            calls += 1
+            boxes, scores, class_ids = simulated_detector(gt, rng, speeds=np.hypot(*scene.velocities.T),
+                                                          conf_threshold=conf_threshold)
+            if scheduler is not None:
+                scheduler.record_keyframe(args.detector_ms, scores, conf_threshold or 0.0)
+            tracker.update(boxes, scores, class_ids)
+            output = boxes
+        else:
+            output = tracker.predict()[0]
+        frame_matched, frame_iou = score_frame(output, gt)
+        matched += frame_matched
+        iou_sum += frame_iou
+    total = args.frames * args.objects
+    return calls / args.frames, matched / total, iou_sum / total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--objects", type=int, default=12)
+    parser.add_argument("--detector-ms", type=float, default=40.0)
+    parser.add_argument("--max-interval", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--conf-threshold", type=float, default=0.3, help="The app's default threshold")
+    args = parser.parse_args()
+
+    print(f"{'mode':<18} {'detector runs':>13} {'det ms/frame':>12} {'recall@0.5':>10} {'mean IoU':>9}")
+    for budget_ms in (None, 20.0, 13.0, 10.0, 8.0):
+        ratio, recall, mean_iou = run(args, budget_ms)
+        label = "full" if budget_ms is None else f"budget {budget_ms:g} ms"
+        print(f"{label:<18} {ratio:>12.0%} {ratio * args.detector_ms:>12.1f} {recall:>10.3f} {mean_iou:>9.3f}")
+
+    print(f"\nconfidence floor, scores just above a {args.conf_threshold:g} threshold, budget 10 ms "
+          f"(default margin {MARGIN:g})")
+    print(f"{'margin':<18} {'detector runs':>13} {'det ms/frame':>12} {'recall@0.5':>10} {'mean IoU':>9}")
+    for objects in (args.objects, 3):
+        for margin in (None, 0.0, 0.02, 0.05, 0.1):
+            ratio, recall, mean_iou = run(argparse.Namespace(**{**vars(args), "objects": objects}),
+                                          None if margin is None else 10.0, margin, args.conf_threshold)
+            label = f"{objects} obj, " + ("full" if margin is None else f"{margin:g}")
+            print(f"{label:<18} {ratio:>12.0%} {ratio * args.detector_ms:>12.1f} {recall:>10.3f} {mean_iou:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
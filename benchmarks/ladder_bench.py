@@ -0,0 +1,127 @@
+"""
+Quality ladder: the controller holding a target fps under load.
+
+Synthetic models (benchmarks/synthetic_model.py) at input sizes 320, 480 and 640 form a
+ladder, each rung its own batched detector as in app.py. Streams run in threads at the
+target fps (frames arriving while one is processed are dropped, as with a live camera),
+each with a LadderController. The load goes from few streams to many and back; per phase
+it reports the delivered fps per stream, the mean rung and the transitions. Timings are
+shortened (dwell, backoff) so the run takes about a minute. tests/test_ladder.py checks
+that every rung maps boxes back to frame pixels with its own input size.
+
+Usage: python benchmarks/ladder_bench.py [--streams 2 12 2] [--phase-s 15] [--target-fps 15]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from batching import BatchingDetector  # noqa: E402
+from ladder import LadderController, QualityLadder  # noqa: E402
+from model_loader import ModelLoader  # noqa: E402
+from runtime_profile import ExecutionProfile  # noqa: E402
+from synthetic_model import build_model  # noqa: E402
+
+SIZES = (320, 480, 640)
+
+
+class StreamSimulator(threading.Thread):
+    """ A camera at target_fps whose frames are detected on the rung its controller picks. """
+
+    def __init__(self, ladder, controller, frame, target_fps):
+        super().__init__(daemon=True)
+        self.ladder = ladder
+        self.controller = controller
+        self.frame = frame
+        self.period = 1.0 / target_fps
+        self.processed = 0
+        self.levels = []
+        self.transitions = []
+        self.running = True
+
+    def run(self):
+        next_frame = time.perf_counter()
+        while self.running:
+            level, model = self.ladder.detector(self.controller.level)
+            start = time.perf_counter()
+            model.detect_objects(self.frame, 0.3)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            # As in app.py, with the rung that served the frame
+            transition = self.controller.record(elapsed_ms, self.ladder.queue_depth(level), level=level)
+            if transition is not None:
+                self.transitions.append(transition)
+            self.processed += 1
+            self.levels.append(level)
+            # Frames that arrived meanwhile are dropped; wait for the next one
+            now = time.perf_counter()
+            next_frame += self.period * max(1, np.ceil((now - next_frame) / self.period))
+            time.sleep(max(0.0, next_frame - now))
+
+
+def run_control(workdir, phases, phase_s, target_fps, threads):
+    loaders = []
+    for input_size in SIZES:
+        path = build_model(os.path.join(workdir, f"synthetic-{input_size}.onnx"), "end2end", input_size)
+        loaders.append(ModelLoader(local_path=path, optimized_dir=None, warmup_runs=2,
+                                   profile=ExecutionProfile(intra_op_num_threads=threads),
+                                   wrap=lambda detector: BatchingDetector(detector, max_batch_size=8, max_wait_ms=2)))
+    ladder = QualityLadder([loader.start() for loader in loaders], names=[f"s{size}" for size in SIZES])
+    for loader in loaders:
+        loader.wait()
+    frame = np.random.default_rng(0).integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    for level, loader in enumerate(loaders):
+        start = time.perf_counter()
+        for _ in range(20):
+            loader.detector.detect_objects(frame, 0.3)
+        print(f"rung {ladder.names[level]}: {(time.perf_counter() - start) / 20 * 1000:.1f} ms per frame alone")
+
+    print(f"control: target {target_fps:g} fps ({1000 / target_fps:.1f} ms budget), {threads} ORT thread(s) per rung")
+    print(f"{'phase':>5} {'streams':>7} {'fps/stream':>10} {'mean rung':>9} {'on top':>7} {'down':>5} {'up':>4}")
+    streams = []
+    for phase, count in enumerate(phases):
+        while len(streams) < count:
+            controller = LadderController(ladder, target_fps=target_fps, min_dwell=2.0, backoff=4.0,
+                                          max_backoff=16.0, up_after=15)
+            streams.append(StreamSimulator(ladder, controller, frame, target_fps))
+            streams[-1].start()
+        while len(streams) > count:
+            streams.pop().running = False
+        marks = [(stream.processed, len(stream.levels), len(stream.transitions)) for stream in streams]
+        time.sleep(phase_s)
+        # The second half of the phase, once the controllers had time to settle
+        processed, levels, transitions = [], [], []
+        for stream, (processed_at, levels_at, transitions_at) in zip(streams, marks):
+            processed.append(stream.processed - processed_at)
+            levels += stream.levels[levels_at + (len(stream.levels) - levels_at) // 2:]
+            transitions += stream.transitions[transitions_at:]
+        down = sum(1 for from_level, to_level in transitions if to_level < from_level)
+        print(f"{phase:>5} {count:>7} {np.mean(processed) / phase_s:>10.1f} {np.mean(levels):>9.2f} "
+              f"{np.mean(np.array(levels) == len(SIZES) - 1):>7.0%} {down:>5} {len(transitions) - down:>4}")
+    for stream in streams:
+        stream.running = False
+    for loader in loaders:
+        loader.model.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, nargs="+", default=[2, 12, 2], help="Streams per load phase")
+    parser.add_argument("--phase-s", type=float, default=15)
+    parser.add_argument("--target-fps", type=float, default=15)
+    parser.add_argument("--threads", type=int, default=1, help="ONNX Runtime threads per rung")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        run_control(workdir, args.streams, args.phase_s, args.target_fps, args.threads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Server cost and outbound payload per frame: annotated video vs detection records.
+
+    annotated   what send-receive mode returns: OverlayRenderer draws the detections
+                into a display frame, which is encoded by aiortc's VP8 encoder, as
+                FastRTC does for every returned frame
+    json        the detections as a JSON message, for reference
+    records     overlay.encode_detections: int16 boxes, uint8 classes and scores,
+                uint32 track ids, in a 16-byte-header binary record
+
+Frames are synthetic (moving rectangles over a gradient) with n synthetic detections
+each. Times are server CPU per frame; bytes are what is sent back per frame, for the
+video at the encoder's steady state after its first keyframe. The video size is set
+by the encoder's rate control (aiortc targets 500 kbit/s, adapting between 250 and
+1500 to the link), so real camera footage sits near the target, while the synthetic
+frames compress below it: the annotated rows are a lower bound. tests/test_overlay.py
+checks that records decode back to the detections they were made from.
+
+Usage: python benchmarks/overlay_bench.py [--frames 150] [--fps 15] [--detections 0 5 20 50]
+"""
+import argparse
+import fractions
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from overlay import encode_detections  # noqa: E402
+from pipeline_bench import synthetic_frames  # noqa: E402
+from renderer import OverlayRenderer  # noqa: E402
+
+
+def synthetic_detections(frames, count, width, height, seed=0):
+    """ Per frame (boxes, scores, class_ids, track_ids) of count objects drifting across the frame. """
+    rng = np.random.default_rng(seed)
+    starts = rng.uniform(0, [width - 120, height - 120], (count, 2))
+    sizes = rng.uniform(30, 120, (count, 2))
+    velocities = rng.normal(0, 2, (count, 2))
+    class_ids = rng.integers(0, 80, count)
+    track_ids = np.arange(1, count + 1) + 1000
+    detections = []
+    for frame in range(frames):
+        corner = np.clip(starts + velocities * frame, 0, [width - 120, height - 120])
+        boxes = np.concatenate((corner, corner + sizes), axis=1).astype(np.float32)
+        scores = rng.uniform(0.3, 1.0, count).astype(np.float32)
+        detections.append((boxes, scores, class_ids, track_ids))
+    return detections
+
+
+def bench_annotated(frames, detections, counts):
+    """ Render plus VP8 encode per frame: (seconds per frame, bytes per frame after the first keyframe). """
+    import av
+    from aiortc.codecs.vpx import Vp8Encoder
+
+    height, width = frames[0].shape[:2]
+    renderer = OverlayRenderer(output_size=(width, height), color_order="RGB")
+    encoder = Vp8Encoder()
+    time_base = fractions.Fraction(1, 90000)
+    sizes, elapsed = [], 0.0
+    for i, (frame, (boxes, scores, class_ids, _)) in enumerate(zip(frames * (len(detections) // len(frames) + 1),
+                                                                  detections)):
+        start = time.perf_counter()
+        out = renderer.render(frame, boxes, scores, class_ids, counts, image_order="RGB")
+        video_frame = av.VideoFrame.from_ndarray(out, format="rgb24")
+        video_frame.pts, video_frame.time_base = i * 3000, time_base
+        payloads, _ = encoder.encode(video_frame)
+        elapsed += time.perf_counter() - start
+        sizes.append(sum(len(payload) for payload in payloads))
+    return elapsed / len(detections), float(np.mean(sizes[1:]))
+
+
+def bench_json(detections, counts, width, height):
+    sizes, elapsed = [], 0.0
+    for sequence, (boxes, scores, class_ids, track_ids) in enumerate(detections):
+        start = time.perf_counter()
+        message = json.dumps({
+            "seq": sequence, "width": width, "height": height,
+            "detections": [{"box": [round(float(v), 1) for v in box], "score": round(float(score), 3),
+                            "class": int(class_id), "track": int(track_id)}
+                           for box, score, class_id, track_id in zip(boxes, scores, class_ids, track_ids)],
+            "counts": counts,
+        }, separators=(",", ":")).encode()
+        elapsed += time.perf_counter() - start
+        sizes.append(len(message))
+    return elapsed / len(detections), float(np.mean(sizes))
+
+
+def bench_records(detections, counts, width, height):
+    count_ids = {i: count for i, count in enumerate(counts.values())}
+    sizes, elapsed = [], 0.0
+    for sequence, (boxes, scores, class_ids, track_ids) in enumerate(detections):
+        start = time.perf_counter()
+        record = encode_detections(sequence, width, height, boxes, scores, class_ids, track_ids, count_ids)
+        elapsed += time.perf_counter() - start
+        sizes.append(len(record))
+    return elapsed / len(detections), float(np.mean(sizes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=150)
+    parser.add_argument("--fps", type=float, default=15)
+    parser.add_argument("--size", default="640x480", help="Frame size WIDTHxHEIGHT")
+    parser.add_argument("--detections", type=int, nargs="+", default=[0, 5, 20, 50])
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split("x"))
+    frames = synthetic_frames(width, height, 30)
+    counts = {"person": 12, "car": 3}
+    print(f"{width}x{height}, {args.frames} frames per case; kbit/s at {args.fps:g} fps")
+    print(f"{'detections':>10} {'path':<10} {'bytes/frame':>12} {'kbit/s':>9} {'server ms/frame':>16}")
+    for count in args.detections:
+        detections = synthetic_detections(args.frames, count, width, height)
+        rows = [
+            ("annotated", *bench_annotated(frames, detections, counts)),
+            ("json", *bench_json(detections, counts, width, height)),
+            ("records", *bench_records(detections, counts, width, height)),
+        ]
+        for name, seconds, size in rows:
+            print(f"{count:>10} {name:<10} {size:>12.0f} {size * 8 * args.fps / 1000:>9.1f} {seconds * 1000:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
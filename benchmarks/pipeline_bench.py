@@ -0,0 +1,301 @@
+"""
+Offline benchmark and regression check for the detection pipeline.
+
+Replays frames through the same code paths the app uses, with no webcam, browser or
+network:
+    detector  inference.YOLOv10.detect_objects on its own session (one stream)
+    batched   the app's BatchingDetector, called from N concurrent streams
+    app       app.detection, the full FastRTC handler, including filtering, tracking
+              and rendering, called from N concurrent streams with a context each
+Frames are synthetic moving rectangles, or the frames of a local video file with
+--video, resized to each resolution. The model is a small ONNX model generated
+locally by synthetic_model.py unless --model points at a real export. The app reads
+its usual environment variables (KEYFRAME_MODE, MOTION_GATE, ...), so a
+configuration is benchmarked by setting them for this script.
+
+Each scenario reports fps, p50/p99/mean frame latency, the mean of every stage in
+metrics.stage_latency_ms, and the process RSS. Results are written as JSON. With a
+baseline (a previous results file), the script exits with status 1 if the p50
+latency or any stage mean of a scenario regresses past the baseline by more than
+--tolerance (relative) plus --slack-ms (absolute, for sub-millisecond stages).
+Baselines are machine specific; refresh the stored one with --update-baseline after
+an intended change, on the machine that runs the check.
+
+Usage: python benchmarks/pipeline_bench.py [--video clip.mp4] [--model model.onnx]
+           [--resolutions 640x480,1280x720,1920x1080] [--concurrency 1,2,4] [--frames 120]
+           [--output bench_results.json] [--baseline benchmarks/baseline.json] [--update-baseline]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+import types
+
+import cv2
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+from synthetic_model import LAYOUTS, build_model  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+# Environment variables that change what app.detection does, recorded with every run
+APP_ENV_VARS = ("YOLO_BATCH_MAX_SIZE", "YOLO_BATCH_MAX_WAIT_MS", "YOLO_LETTERBOX", "TRACKER_USE_KALMAN",
+                "KEYFRAME_MODE", "KEYFRAME_BUDGET_MS", "MOTION_GATE", "METRICS_ENABLED", "ORT_PROFILE",
+                "ORT_INTRA_OP_THREADS", "YOLO_SESSIONS")
+
+
+def synthetic_frames(width, height, count, seed=0):
+    """ RGB frames of colored rectangles moving over a gradient, with light sensor noise. """
+    rng = np.random.default_rng(seed)
+    objects = 8
+    sizes = rng.uniform(0.08, 0.3, size=(objects, 2)) * (width, height)
+    positions = rng.uniform(0, 1, size=(objects, 2)) * ((width, height) - sizes)
+    velocities = rng.uniform(-0.01, 0.01, size=(objects, 2)) * (width, height)
+    object_colors = rng.integers(40, 255, size=(objects, 3))
+    gradient = np.linspace(30, 120, width, dtype=np.float32)
+    background = np.broadcast_to(gradient[None, :, None], (height, width, 3)).astype(np.uint8)
+
+    frames = []
+    for _ in range(count):
+        positions += velocities
+        limits = np.array([width, height]) - sizes
+        bounced = (positions < 0) | (positions > limits)
+        velocities[bounced] *= -1
+        np.clip(positions, 0, limits, out=positions)
+
+        frame = background.copy()
+        for (x, y), (w, h), color in zip(positions.astype(int), sizes.astype(int), object_colors.tolist()):
+            cv2.rectangle(frame, (x, y), (x + w, y + h), color, -1)
+        frame = cv2.add(frame, rng.integers(0, 12, size=frame.shape, dtype=np.uint8))
+        frames.append(frame)
+    return frames
+
+
+def video_frames(path, width, height, count):
+    """ Up to count frames of the video, converted to RGB and resized to width x height. """
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    capture.release()
+    if not frames:
+        raise SystemExit(f"Could not read any frames from {path}")
+    return frames
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as statm:
+            return round(int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def stage_summary(registry):
+    """ Mean and count per stage, over all streams of the per-stream stages. """
+    totals = {}
+    for (name, labels), histogram in registry.histograms.items():
+        if name != "stage_latency_ms" or not histogram.count:
+            continue
+        total = totals.setdefault(dict(labels)["stage"], [0.0, 0])
+        total[0] += histogram.sum
+        total[1] += histogram.count
+    return {stage: {"mean_ms": round(total / count, 4), "count": count}
+            for stage, (total, count) in sorted(totals.items())}
+
+
+def run_scenario(call, frames, concurrency, iterations, warmup, registry):
+    """ Runs iterations calls spread over concurrency threads and returns the scenario results. """
+    for frame in frames[:warmup]:
+        call(frame, 0)
+    registry.reset()
+
+    latencies = [[] for _ in range(concurrency)]
+    detections = [[] for _ in range(concurrency)]
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(index):
+        barrier.wait()
+        for i in range(index, iterations, concurrency):
+            frame = frames[i % len(frames)]
+            start = time.perf_counter()
+            found = call(frame, index)
+            latencies[index].append((time.perf_counter() - start) * 1000)
+            if found is not None:
+                detections[index].append(found)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latency = np.concatenate([np.asarray(values) for values in latencies])
+    found = [count for values in detections for count in values]
+    return {
+        "frames": int(latency.size),
+        "fps": round(latency.size / elapsed, 2),
+        "p50_ms": round(float(np.percentile(latency, 50)), 3),
+        "p99_ms": round(float(np.percentile(latency, 99)), 3),
+        "mean_ms": round(float(latency.mean()), 3),
+        "detections_per_frame": round(float(np.mean(found)), 2) if found else None,
+        "rss_mb": current_rss_mb(),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "stages": stage_summary(registry),
+    }
+
+
+def find_regressions(results, baseline, tolerance, slack_ms):
+    """ Human-readable descriptions of every scenario metric that is worse than the baseline allows. """
+    regressions = []
+    for key, current in results["scenarios"].items():
+        reference = baseline.get("scenarios", {}).get(key)
+        if reference is None:
+            continue
+        checks = [("p50", current["p50_ms"], reference["p50_ms"])]
+        for stage, stats in current["stages"].items():
+            if stage in reference.get("stages", {}):
+                checks.append((f"stage {stage}", stats["mean_ms"], reference["stages"][stage]["mean_ms"]))
+        for name, value, expected in checks:
+            limit = expected * (1 + tolerance) + slack_ms
+            if value > limit:
+                regressions.append(f"{key} {name}: {value:.3f} ms > limit {limit:.3f} ms (baseline {expected:.3f} ms)")
+    return regressions
+
+
+def parse_resolutions(text):
+    return [tuple(int(v) for v in item.lower().split("x")) for item in text.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", help="Replay this video file instead of synthetic frames")
+    parser.add_argument("--model", help="ONNX model to use instead of a generated synthetic one")
+    parser.add_argument("--layout", choices=LAYOUTS, default="end2end", help="Output layout of the synthetic model")
+    parser.add_argument("--resolutions", default="640x480,1280x720,1920x1080")
+    parser.add_argument("--concurrency", default="1,2,4", help="Stream counts for the batched and app targets")
+    parser.add_argument("--targets", default="detector,batched,app")
+    parser.add_argument("--frames", type=int, default=120, help="Timed frames per scenario")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--conf", type=float, default=0.3)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Allowed relative slowdown per metric")
+    parser.add_argument("--slack-ms", type=float, default=0.2, help="Allowed absolute slowdown per metric")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="pipeline_bench_")
+    model_path = args.model or build_model(os.path.join(work_dir, "model.onnx"), args.layout)
+    # app.py loads a local model instead of downloading one; keep its optimized graph cache out of the home directory
+    os.environ["YOLO_MODEL_PATH"] = model_path
+    os.environ.setdefault("ORT_OPTIMIZED_MODEL_DIR", work_dir)
+    import app
+    import metrics
+    from inference import YOLOv10, class_names
+    from settings import CompiledSettings
+
+    batcher = app.model_loader.wait()
+    concurrency_levels = [int(c) for c in args.concurrency.split(",") if c]
+
+    # Watch and count every class, not just those offered in the UI, so filtering and tracking
+    # see every detection of the (arbitrary-class) synthetic model, as in a crowded scene
+    watch_all = {"watchedObjects": {name: True for name in class_names},
+                 "objectActions": {name: {"count": True} for name in class_names}}
+    app.compiled_settings = CompiledSettings.compile(watch_all, class_names, class_names)
+
+    detector = YOLOv10(model_path, letterbox=app.LETTERBOX, profile=app.execution_profile)
+
+    # Each benchmark stream stands in for one Gradio session, and so gets its own detection context
+    sessions = [types.SimpleNamespace(session_hash=f"bench-{i}") for i in range(max(concurrency_levels))]
+
+    def run_app(frame, stream_index):
+        request = sessions[stream_index]
+        app.detection(frame, args.conf, request)
+        return len(app.detection_contexts.get(request.session_hash).last_watched_detections[0])
+
+    targets = {
+        "detector": (lambda frame, _: len(detector.detect_objects(frame, args.conf, channel_order="RGB")[0]), 1),
+        "batched": (lambda frame, _: len(batcher.detect_objects(frame, args.conf, channel_order="RGB")[0]), None),
+        "app": (run_app, None),
+    }
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "machine": platform.machine(),
+            "processor": platform.processor() or platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "onnxruntime": __import__("onnxruntime").__version__,
+            "model": args.model or f"synthetic-{args.layout}",
+            "source": args.video or "synthetic",
+            "env": {name: os.environ[name] for name in APP_ENV_VARS if name in os.environ},
+        },
+        "scenarios": {},
+    }
+
+    for width, height in parse_resolutions(args.resolutions):
+        # A short clip is replayed in a loop, so frame memory stays small next to the pipeline's own
+        count = min(args.frames + args.warmup, 48)
+        frames = video_frames(args.video, width, height, count) if args.video else synthetic_frames(width, height, count)
+        for target in args.targets.split(","):
+            call, fixed_concurrency = targets[target]
+            for concurrency in [fixed_concurrency] if fixed_concurrency else concurrency_levels:
+                key = f"{target}/{width}x{height}/c{concurrency}"
+                scenario = run_scenario(call, frames, concurrency, args.frames, args.warmup, metrics.registry)
+                results["scenarios"][key] = scenario
+                stages = ", ".join(f"{name} {stats['mean_ms']:.2f}" for name, stats in scenario["stages"].items())
+                print(f"{key:28s} {scenario['fps']:8.1f} fps  p50 {scenario['p50_ms']:7.2f} ms  "
+                      f"p99 {scenario['p99_ms']:7.2f} ms  rss {scenario['rss_mb']} MB  [{stages}]")
+    batcher.close()
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, skipping the regression check")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("meta", {}).get("processor") != results["meta"]["processor"]:
+        print("Warning: the baseline was recorded on a different processor, timings may not be comparable")
+    regressions = find_regressions(results, baseline, args.tolerance, args.slack_ms)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        return 1
+    print(f"No regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+Microbenchmark for YOLOv10 input preprocessing.
+
+Compares the original prepare_input pipeline (color conversion, resize, float64
+division, transpose, cast) against the reusable Preprocessor at 720p and 1080p,
+reporting time per frame and the peak bytes allocated while handling one frame.
+
+Usage: python benchmarks/preprocess_bench.py [--iterations 200] [--letterbox]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from preprocess import Preprocessor  # noqa: E402
+
+RESOLUTIONS = {"720p": (1280, 720), "1080p": (1920, 1080)}
+
+
+def legacy_prepare_input(image, input_width, input_height):
+    """ The preprocessing pipeline as it was before Preprocessor, RGB frame in. """
+    bgr_image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    input_img = cv2.cvtColor(bgr_image, cv2.COLOR_BGR2RGB)
+    input_img = cv2.resize(input_img, (input_width, input_height))
+    input_img = input_img / 255.0
+    input_img = input_img.transpose(2, 0, 1)
+    return input_img[np.newaxis, :, :, :].astype(np.float32)
+
+
+def measure(fn, iterations):
+    fn()  # warm up caches and buffers
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    ms_per_frame = (time.perf_counter() - start) * 1000 / iterations
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ms_per_frame, peak - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--input-size", type=int, default=640)
+    parser.add_argument("--letterbox", action="store_true")
+    args = parser.parse_args()
+
+    size = args.input_size
+    rng = np.random.default_rng(0)
+    print(f"{'resolution':<10} {'pipeline':<13} {'ms/frame':>9} {'peak alloc/frame':>18}")
+    for name, (width, height) in RESOLUTIONS.items():
+        frame = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+        preprocessor = Preprocessor(size, size, letterbox=args.letterbox)
+
+        legacy = measure(lambda: legacy_prepare_input(frame, size, size), args.iterations)
+        reused = measure(lambda: preprocessor(frame, "RGB"), args.iterations)
+        for label, (ms, peak) in (("legacy", legacy), ("preprocessor", reused)):
+            print(f"{name:<10} {label:<13} {ms:>9.3f} {peak / 1e6:>15.2f} MB")
+        print(f"{name:<10} {'speedup':<13} {legacy[0] / reused[0]:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
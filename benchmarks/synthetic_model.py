@@ -0,0 +1,115 @@
+"""
+Builds a small YOLO-shaped ONNX model locally, so benchmarks run without network access.
+
+The graph is a five-layer stride-32 conv backbone with a 1x1 detection head and random
+weights. Its outputs match the layouts the decoder handles:
+    end2end: [batch, K, 6] rows of (x1, y1, x2, y2, score, class_id) in input pixels,
+             the top K anchors by score (K = min(300, anchors)), like YOLOv10 exports
+    raw:     [batch, 4 + classes, anchors] rows of (cx, cy, w, h, class scores...), like YOLOv8
+The detections are meaningless, but the tensor sizes, the layout and a realistic number of
+above-threshold rows go through the same preprocessing, session.run and decoding as the
+real model.
+
+Usage: python benchmarks/synthetic_model.py out.onnx [--layout end2end|raw] [--input-size 640]
+"""
+import argparse
+
+import numpy as np
+
+LAYOUTS = ("end2end", "raw")
+BACKBONE_CHANNELS = (16, 32, 64, 64, 64)
+
+
+def build_model(path, layout="end2end", input_size=640, num_classes=80, seed=0):
+    """ Writes the model to path and returns path. The batch dimension is dynamic. """
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout {layout!r}, expected one of {LAYOUTS}.")
+    rng = np.random.default_rng(seed)
+    nodes, initializers = [], []
+
+    def constant(name, array):
+        initializers.append(numpy_helper.from_array(np.asarray(array), name))
+        return name
+
+    x, in_channels = "images", 3
+    for i, out_channels in enumerate(BACKBONE_CHANNELS):
+        # He-initialized so activations keep their scale through the random layers
+        weight = rng.normal(0, np.sqrt(2 / (9 * in_channels)), size=(out_channels, in_channels, 3, 3))
+        nodes.append(helper.make_node("Conv", [x, constant(f"conv{i}.w", weight.astype(np.float32))], [f"conv{i}"],
+                                      kernel_shape=[3, 3], strides=[2, 2], pads=[1, 1, 1, 1]))
+        nodes.append(helper.make_node("Relu", [f"conv{i}"], [f"relu{i}"]))
+        x, in_channels = f"relu{i}", out_channels
+
+    rows = 4 + num_classes
+    head_weight = rng.normal(0, 2.0 / np.sqrt(in_channels), size=(rows, in_channels, 1, 1)).astype(np.float32)
+    # A strongly negative class bias leaves only a handful of anchors above typical thresholds
+    head_bias = np.zeros(rows, dtype=np.float32)
+    head_bias[4:] = -5.0
+    nodes.append(helper.make_node("Conv", [x, constant("head.w", head_weight), constant("head.b", head_bias)], ["head"]))
+    nodes.append(helper.make_node("Reshape", ["head", constant("head.shape", np.array([0, rows, -1], dtype=np.int64))], ["head_flat"]))
+    nodes.append(helper.make_node("Sigmoid", ["head_flat"], ["head_sigmoid"]))
+    # Box rows become pixel centers and sizes, class rows stay probabilities
+    row_scale = np.ones((1, rows, 1), dtype=np.float32)
+    row_scale[0, :2] = input_size
+    row_scale[0, 2:4] = input_size / 4
+    raw_name = "output0" if layout == "raw" else "raw"
+    nodes.append(helper.make_node("Mul", ["head_sigmoid", constant("row_scale", row_scale)], [raw_name]))
+
+    anchors = (input_size // 32) ** 2
+    if layout == "raw":
+        output_shape = ["batch", rows, anchors]
+    else:
+        top_k = min(300, anchors)
+        output_shape = ["batch", top_k, 6]
+
+        def axes(*values):
+            return constant(f"axes_{len(initializers)}", np.array(values, dtype=np.int64))
+
+        nodes += [
+            helper.make_node("Transpose", ["raw"], ["anchors"], perm=[0, 2, 1]),
+            helper.make_node("Slice", ["anchors", axes(0), axes(2), axes(2)], ["centers"]),
+            helper.make_node("Slice", ["anchors", axes(2), axes(4), axes(2)], ["sizes"]),
+            helper.make_node("Slice", ["anchors", axes(4), axes(rows), axes(2)], ["class_scores"]),
+            helper.make_node("Mul", ["sizes", constant("half", np.float32(0.5))], ["half_sizes"]),
+            helper.make_node("Sub", ["centers", "half_sizes"], ["top_left"]),
+            helper.make_node("Add", ["centers", "half_sizes"], ["bottom_right"]),
+            helper.make_node("Concat", ["top_left", "bottom_right"], ["xyxy"], axis=2),
+            helper.make_node("ReduceMax", ["class_scores"], ["scores"], axes=[2], keepdims=0),
+            helper.make_node("ArgMax", ["class_scores"], ["labels"], axis=2, keepdims=0),
+            helper.make_node("Cast", ["labels"], ["labels_float"], to=TensorProto.FLOAT),
+            helper.make_node("TopK", ["scores", axes(top_k)], ["top_scores", "top_indices"], axis=1),
+            helper.make_node("Unsqueeze", ["top_indices", axes(2)], ["top_indices_3d"]),
+            helper.make_node("Shape", ["xyxy"], ["xyxy_shape"]),
+            helper.make_node("Slice", ["xyxy_shape", axes(0), axes(1), axes(0)], ["batch_dim"]),
+            helper.make_node("Concat", ["batch_dim", axes(top_k, 4)], ["box_index_shape"], axis=0),
+            helper.make_node("Expand", ["top_indices_3d", "box_index_shape"], ["box_indices"]),
+            helper.make_node("GatherElements", ["xyxy", "box_indices"], ["top_boxes"], axis=1),
+            helper.make_node("GatherElements", ["labels_float", "top_indices"], ["top_labels"], axis=1),
+            helper.make_node("Unsqueeze", ["top_scores", axes(2)], ["top_scores_3d"]),
+            helper.make_node("Unsqueeze", ["top_labels", axes(2)], ["top_labels_3d"]),
+            helper.make_node("Concat", ["top_boxes", "top_scores_3d", "top_labels_3d"], ["output0"], axis=2),
+        ]
+
+    graph = helper.make_graph(
+        nodes, f"synthetic_yolo_{layout}",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, ["batch", 3, input_size, input_size])],
+        [helper.make_tensor_value_info("output0", TensorProto.FLOAT, output_shape)],
+        initializer=initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    onnx.save(model, path)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--layout", choices=LAYOUTS, default="end2end")
+    parser.add_argument("--input-size", type=int, default=640)
+    args = parser.parse_args()
+    print(build_model(args.path, args.layout, args.input_size))
@@ -0,0 +1,66 @@
+"""
+Throughput of the multi-process worker pool against in-process detector sessions.
+
+For each worker count N the same frames are run from 2N concurrent streams through
+    threads  N YOLOv10 sessions in this process behind BatchingDetector (batching off)
+    workers  WorkerPoolDetector with N worker processes
+with every session or worker on a budget of one core, so the fps column shows how
+each backend scales with cores. The speedup is relative to the same backend with
+one session or worker. Expect the worker pool to keep scaling where the threaded
+backend flattens once the Python parts of preprocessing and decoding saturate the
+GIL; on a host with fewer cores than workers neither can scale.
+
+Usage: python benchmarks/workers_bench.py [--model model.onnx] [--workers 1,2,4] [--frames 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import metrics  # noqa: E402
+from batching import BatchingDetector  # noqa: E402
+from inference import YOLOv10  # noqa: E402
+from pipeline_bench import run_scenario, synthetic_frames  # noqa: E402
+from runtime_profile import ExecutionProfile, available_cores  # noqa: E402
+from synthetic_model import build_model  # noqa: E402
+from workers import WorkerPoolDetector  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="ONNX model to use instead of a generated synthetic one")
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--resolution", default="1280x720")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--conf", type=float, default=0.3)
+    args = parser.parse_args()
+
+    model_path = args.model or build_model(os.path.join(tempfile.mkdtemp(prefix="workers_bench_"), "model.onnx"))
+    width, height = (int(v) for v in args.resolution.lower().split("x"))
+    frames = synthetic_frames(width, height, 48)
+    profile = ExecutionProfile(intra_op_num_threads=1)
+    print(f"{available_cores()} cores available, {args.resolution} frames, one core per session or worker")
+
+    baseline_fps = {}
+    for count in [int(c) for c in args.workers.split(",") if c]:
+        backends = {
+            "threads": lambda: BatchingDetector([YOLOv10(model_path, profile=profile) for _ in range(count)],
+                                                max_batch_size=1, max_wait_ms=0),
+            "workers": lambda: WorkerPoolDetector(model_path, workers=count, profile=profile),
+        }
+        for name, create in backends.items():
+            detector = create()
+            call = lambda frame, _: len(detector.detect_objects(frame, args.conf, channel_order="RGB")[0])
+            result = run_scenario(call, frames, 2 * count, args.frames, warmup=2 * count, registry=metrics.registry)
+            detector.close()
+            speedup = result["fps"] / baseline_fps.setdefault(name, result["fps"])
+            print(f"{name:8s} x{count:<3d} {result['fps']:8.1f} fps  p50 {result['p50_ms']:7.2f} ms  "
+                  f"p99 {result['p99_ms']:7.2f} ms  speedup {speedup:4.2f}")
+
+
+if __name__ == "__main__":
+    main()
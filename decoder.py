@@ -0,0 +1,138 @@
+import numpy as np
+
+# [N, 6] rows of x1, y1, x2, y2, score, class_id (YOLOv10 end-to-end export)
+LAYOUT_END2END = "end2end"
+# [4 + classes, anchors]: cx, cy, w, h followed by per-class scores (YOLOv8 style head)
+LAYOUT_RAW = "raw"
+# [anchors, 4 + classes]: the same head, transposed
+LAYOUT_RAW_TRANSPOSED = "raw_transposed"
+
+
+def detect_layout(output_shape, num_classes):
+    """ Infers the output layout from an output shape such as get_output_details()[0]['shape']. """
+    rows, cols = output_shape[-2:]
+    if cols == 6 and rows != 4 + num_classes:
+        return LAYOUT_END2END
+    if rows == 4 + num_classes:
+        return LAYOUT_RAW
+    if cols == 4 + num_classes:
+        return LAYOUT_RAW_TRANSPOSED
+    return None
+
+
+class DetectionDecoder:
+    """
+    Turns one frame's raw model output into (boxes, scores, class_ids) in frame pixels.
+
+    The layout is read from the session's output details, and whether boxes are
+    normalized or in input pixels is decided once per model by calibrate(); both fall
+    back to the first output decoded when not known beforehand. Every layout
+    is decoded with a single confidence mask, an optional top-k cutoff and a single
+    affine rescale that undoes the resize/letterbox done by the Preprocessor.
+
+    class_mask, a boolean array indexed by class id, restricts decoding to the classes
+    it selects. For the raw layouts the score rows of other classes are never read,
+    so a box is assigned its best-scoring selected class.
+
+    crop, a ZoneCrop, says the frame was a crop around zones: boxes are shifted back to
+    the full frame and only those centered in a zone are kept.
+    """
+
+    def __init__(self, output_details, input_width, input_height, num_classes=80,
+                 max_detections=300, boxes_normalized=None):
+        self.input_width = input_width
+        self.input_height = input_height
+        self.num_classes = num_classes
+        self.max_detections = max_detections
+        # None means not known yet: calibrate() settles it once, from a whole output of the model
+        self.boxes_normalized = boxes_normalized
+        self.layout = detect_layout(output_details[0]['shape'], num_classes)
+
+    def calibrate(self, output):
+        """
+        Settles the layout and the box units of the model from one whole output tensor, e.g.
+        of a probe run at load time. Units are decided over the boxes of every row, not just
+        detections: coordinates that all stay within a couple of units are normalized (edge
+        boxes can overshoot 1.0 a little), anything larger is in input pixels, as is an
+        all-zero output. An explicit boxes_normalized is kept as given.
+        """
+        output = output.reshape(output.shape[-2:])
+        if self.layout is None:
+            self.layout = detect_layout(output.shape, self.num_classes)
+            if self.layout is None:
+                raise ValueError(f"Unrecognized model output shape {output.shape}")
+        if self.boxes_normalized is None:
+            boxes = output[:4] if self.layout == LAYOUT_RAW else output[:, :4]
+            extent = float(np.abs(boxes).max(initial=0.0))
+            self.boxes_normalized = 0.0 < extent <= 2.0
+        return self
+
+    def decode(self, output, conf_threshold, geometry, class_mask=None, crop=None):
+        output = output.reshape(output.shape[-2:])
+        if self.layout is None or self.boxes_normalized is None:
+            # Without a probe run, the first output decoded calibrates the decoder for good
+            self.calibrate(output)
+
+        if self.layout == LAYOUT_END2END:
+            boxes, scores, class_ids = self._decode_end2end(output, conf_threshold, class_mask)
+        elif self.layout == LAYOUT_RAW:
+            boxes, scores, class_ids = self._decode_raw(output, conf_threshold, class_mask)
+        else:
+            boxes, scores, class_ids = self._decode_raw(output.T, conf_threshold, class_mask)
+
+        if scores.shape[0] == 0:
+            return empty_detections()
+        boxes = self._rescale(boxes, geometry)
+        if crop is not None:
+            return crop.restore(boxes, scores, class_ids)
+        return boxes, scores, class_ids
+
+    def _top_k(self, scores, keep):
+        """ Indices of `keep` sorted by descending score, capped at max_detections. """
+        if self.max_detections and keep.shape[0] > self.max_detections:
+            part = np.argpartition(-scores[keep], self.max_detections - 1)[:self.max_detections]
+            keep = keep[part]
+        return keep[np.argsort(-scores[keep], kind="stable")]
+
+    def _decode_end2end(self, output, conf_threshold, class_mask):
+        scores = output[:, 4]
+        keep = np.flatnonzero(scores > conf_threshold)
+        if class_mask is not None:
+            keep = keep[class_mask[output[keep, 5].astype(np.int64)]]
+        keep = self._top_k(scores, keep)
+        rows = output[keep]
+        return rows[:, :4], rows[:, 4], rows[:, 5].astype(np.int64)
+
+    def _decode_raw(self, output, conf_threshold, class_mask):
+        # Reduce over the class rows without transposing the whole output
+        class_scores = output[4:4 + self.num_classes]
+        if class_mask is not None:
+            selected = np.flatnonzero(class_mask)
+            if selected.shape[0] == 0:
+                return empty_detections()
+            class_scores = class_scores[selected]
+        scores = class_scores.max(axis=0)
+        keep = self._top_k(scores, np.flatnonzero(scores > conf_threshold))
+        class_ids = class_scores[:, keep].argmax(axis=0)
+        if class_mask is not None:
+            class_ids = selected[class_ids]
+
+        cx, cy, w, h = output[:4, keep]
+        half_w, half_h = w / 2, h / 2
+        boxes = np.stack((cx - half_w, cy - half_h, cx + half_w, cy + half_h), axis=1)
+        return boxes, scores[keep], class_ids
+
+    def _rescale(self, boxes, geometry):
+        """ Maps xyxy boxes from model output space to frame pixels with one multiply-add. """
+        scale_x, scale_y, pad_x, pad_y = geometry[:4]
+        unit_x = self.input_width if self.boxes_normalized else 1.0
+        unit_y = self.input_height if self.boxes_normalized else 1.0
+        gain = np.array([unit_x / scale_x, unit_y / scale_y] * 2, dtype=boxes.dtype)
+        offset = np.array([pad_x / scale_x, pad_y / scale_y] * 2, dtype=boxes.dtype)
+        boxes *= gain
+        boxes -= offset
+        return boxes
+
+
+def empty_detections():
+    return np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
@@ -0,0 +1,168 @@
+"""
+Detection event ingestion for the ingest_detection_events callable.
+
+Nothing here imports Firebase: Firestore is reached only through the db object passed
+in (collection(), document(), batch()), so the batching, digest and email rate-limit
+logic runs the same against the Firestore client, the Firestore emulator or a local
+in-memory stand-in.
+"""
+from datetime import datetime, timezone
+
+# Upper bound on the events accepted in one call
+MAX_EVENTS_PER_CALL = 5000
+# Firestore accepts at most 500 writes per batch
+MAX_BATCH_WRITES = 500
+# Events are stored as an array per chunk document, well below the 1 MiB document limit
+EVENTS_PER_DOCUMENT = 1000
+# At most one notification email per user in this many seconds; the rest are pooled into the next one
+EMAIL_MIN_INTERVAL_S = 300
+# How often flush_pending_emails sends pooled counts no later ingest call came to send
+EMAIL_FLUSH_PERIOD_S = 60
+
+
+def normalize_events(raw_events, now):
+    """
+    Validates the events of a request and returns them as
+    {"class", "trackId", "timestamp", "camera"} dicts. Raises ValueError.
+    """
+    if not isinstance(raw_events, list) or not raw_events:
+        raise ValueError("Invalid 'events'; expected a non-empty list.")
+    if len(raw_events) > MAX_EVENTS_PER_CALL:
+        raise ValueError(f"Too many events; at most {MAX_EVENTS_PER_CALL} per call.")
+    events = []
+    for raw in raw_events:
+        if not isinstance(raw, dict):
+            raise ValueError("Invalid event; expected a dictionary.")
+        class_name = raw.get("class")
+        if not class_name or not isinstance(class_name, str):
+            raise ValueError("Missing or invalid 'class' in event.")
+        timestamp = raw.get("timestamp", now)
+        if isinstance(timestamp, bool) or not isinstance(timestamp, (int, float)):
+            raise ValueError("Invalid 'timestamp' in event; expected seconds since the epoch.")
+        track_id = raw.get("trackId")
+        if track_id is not None and (isinstance(track_id, bool) or not isinstance(track_id, int)):
+            raise ValueError("Invalid 'trackId' in event; expected an integer.")
+        events.append({
+            "class": class_name,
+            "trackId": track_id,
+            "timestamp": float(timestamp),
+            "camera": str(raw.get("camera") or "default"),
+        })
+    return events
+
+
+def digest_id(timestamp):
+    """ Id of the hourly digest document a timestamp falls into, e.g. 2024053117 (UTC). """
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y%m%d%H")
+
+
+def build_digests(events):
+    """ Event counts per hourly digest id, per camera and class. """
+    digests = {}
+    for event in events:
+        digest = digests.setdefault(digest_id(event["timestamp"]), {"events": 0, "counts": {}, "lastSeen": 0.0})
+        digest["events"] += 1
+        digest["lastSeen"] = max(digest["lastSeen"], event["timestamp"])
+        counts = digest["counts"].setdefault(event["camera"], {})
+        counts[event["class"]] = counts.get(event["class"], 0) + 1
+    return digests
+
+
+def write_events(db, uid, events, increment, received_at=None):
+    """
+    Stores events under users/{uid} and returns the number of document writes.
+
+    Events go into eventChunks documents of up to EVENTS_PER_DOCUMENT events each, and
+    the hourly digests are merged in with increment (firestore.Increment) so concurrent
+    calls add up. All writes are committed in batches of at most MAX_BATCH_WRITES.
+    """
+    user_ref = db.collection("users").document(uid)
+    writes = []
+    for start in range(0, len(events), EVENTS_PER_DOCUMENT):
+        chunk = events[start:start + EVENTS_PER_DOCUMENT]
+        writes.append((user_ref.collection("eventChunks").document(), {
+            "events": chunk,
+            "firstSeen": min(event["timestamp"] for event in chunk),
+            "lastSeen": max(event["timestamp"] for event in chunk),
+            "receivedAt": received_at,
+        }, False))
+    for key, digest in build_digests(events).items():
+        writes.append((user_ref.collection("digests").document(key), {
+            "events": increment(digest["events"]),
+            "counts": {camera: {class_name: increment(count) for class_name, count in counts.items()}
+                       for camera, counts in digest["counts"].items()},
+            "lastSeen": digest["lastSeen"],
+        }, True))
+
+    for start in range(0, len(writes), MAX_BATCH_WRITES):
+        batch = db.batch()
+        for ref, data, merge in writes[start:start + MAX_BATCH_WRITES]:
+            batch.set(ref, data, merge=merge)
+        batch.commit()
+    return len(writes)
+
+
+def notify_counts(events, preferences):
+    """ Events per class among those whose objectActions have notifyOnDetect set. """
+    actions = (preferences or {}).get("objectActions", {})
+    counts = {}
+    for event in events:
+        if actions.get(event["class"], {}).get("notifyOnDetect", False):
+            counts[event["class"]] = counts.get(event["class"], 0) + 1
+    return counts
+
+
+def plan_email(state, counts, now, min_interval=EMAIL_MIN_INTERVAL_S, deliverable=True):
+    """
+    Adds counts to the pending counts of the email state ({"lastSentAt", "pending",
+    "pendingSince"}) and decides whether to send. Returns (new_state, email), where email
+    is (counts, since) to send now, or None while the last email is less than
+    min_interval seconds old or there is no one to send it to (deliverable False).
+    Pending counts go out with the first call after that, or with flush_email if no call
+    comes.
+    """
+    state = state or {}
+    pending = dict(state.get("pending") or {})
+    for class_name, count in counts.items():
+        pending[class_name] = pending.get(class_name, 0) + count
+    if not pending:
+        return state, None
+    since = state.get("pendingSince") or now
+    last_sent = state.get("lastSentAt")
+    if not deliverable or last_sent is not None and now - last_sent < min_interval:
+        return {"lastSentAt": last_sent, "pending": pending, "pendingSince": since}, None
+    return {"lastSentAt": now, "pending": {}, "pendingSince": None}, (pending, since)
+
+
+def flush_email(state, now, min_interval=EMAIL_MIN_INTERVAL_S, deliverable=True):
+    """
+    For the scheduled flush: (new_state, email) as plan_email without new counts, so the
+    pending counts of a burst followed by silence are sent once min_interval has passed.
+    email is None while there are none pending or the last email is too recent.
+    """
+    return plan_email(state, {}, now, min_interval, deliverable)
+
+
+def restore_email(state, email, sent_at, last_sent):
+    """
+    The email state once email, taken from it at sent_at, failed to go out: its counts
+    are pending again, and unless another email went out since, the rate limit runs
+    from last_sent, the email before it.
+    """
+    state = state or {}
+    counts, since = email
+    pending = dict(state.get("pending") or {})
+    for class_name, count in counts.items():
+        pending[class_name] = pending.get(class_name, 0) + count
+    pending_since = min(since, state.get("pendingSince") or since)
+    last_sent_at = state.get("lastSentAt")
+    return {"lastSentAt": last_sent if last_sent_at == sent_at else last_sent_at, "pending": pending,
+            "pendingSince": pending_since}
+
+
+def email_message(counts, since):
+    """ Subject and body of a notification email summarizing counts. """
+    detected = ", ".join(f"{count} x {class_name}" for class_name, count in sorted(counts.items()))
+    subject = f"Object Detection Alert: {', '.join(sorted(counts))}"
+    started = datetime.fromtimestamp(since, timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+    return subject, f"Your application detected {detected} starting at {started}."
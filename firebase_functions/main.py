@@ -1,6 +1,11 @@
+import time
+
 import firebase_admin
-from firebase_admin import credentials, firestore
-from firebase_functions import https_fn, options
+from firebase_admin import auth, credentials, firestore
+from firebase_functions import https_fn, options, scheduler_fn
+
+from events import (EMAIL_FLUSH_PERIOD_S, email_message, flush_email, normalize_events, notify_counts, plan_email,
+                    restore_email, write_events)
 
 # It's good practice to initialize Firebase Admin SDK once per instance.
 # However, in a serverless environment, this might run per invocation if not warm.
@@ -24,6 +29,10 @@ except ValueError:
 #     cors=options.CorsOptions(cors_origins=["http://localhost:7860", "YOUR_FIREBASE_HOSTING_URL"], cors_methods=["get", "post", "options"])
 # )
 
+def preferences_version(last_updated):
+    """ The lastUpdated timestamp as the string clients hold as knownVersion. """
+    return last_updated.isoformat() if hasattr(last_updated, "isoformat") else last_updated
+
 @https_fn.on_call()
 def get_user_preferences(req: https_fn.CallableRequest) -> any:
     """
@@ -38,13 +47,20 @@ def get_user_preferences(req: https_fn.CallableRequest) -> any:
 
     uid = req.auth.uid
     db = firestore.client()
+    # Version the caller already holds; if it is still current only the marker is sent back
+    known_version = req.data.get("knownVersion") if isinstance(req.data, dict) else None
 
     try:
         pref_doc_ref = db.collection("users").document(uid).collection("preferences").document("user_preferences")
         prefs_doc = pref_doc_ref.get()
 
         if prefs_doc.exists:
-            return prefs_doc.to_dict()
+            prefs = prefs_doc.to_dict()
+            version = preferences_version(prefs.get("lastUpdated"))
+            if known_version and version == known_version:
+                return {"unchanged": True, "lastUpdated": version}
+            prefs["lastUpdated"] = version
+            return prefs
         else:
             # Define and return default preferences if none exist
             default_prefs = {
@@ -65,7 +81,8 @@ def get_user_preferences(req: https_fn.CallableRequest) -> any:
 def set_user_preferences(req: https_fn.CallableRequest) -> any:
     """
     Sets or updates user preferences in Firestore.
-    Data is passed in req.data.
+    Data is passed in req.data and merged into the stored preferences, so a partial
+    dict only changes the fields it contains.
     User is authenticated via Firebase Auth context.
     """
     if req.auth is None:
@@ -111,7 +128,10 @@ def set_user_preferences(req: https_fn.CallableRequest) -> any:
 
         update_prefs_in_transaction(db.transaction(), user_doc_ref, pref_doc_ref, data_to_set)
 
-        return {"message": "Preferences updated successfully."}
+        # Report the new version so the caller's cached copy stays current without a download
+        written = pref_doc_ref.get(field_paths=["lastUpdated"])
+        return {"message": "Preferences updated successfully.",
+                "lastUpdated": preferences_version(written.get("lastUpdated"))}
     except Exception as e:
         # Log the error for debugging
         print(f"Error setting preferences for UID {uid}: {str(e)}")
@@ -153,7 +173,11 @@ def send_email_notification(req: https_fn.CallableRequest) -> any:
             message="Missing or invalid 'body'."
         )
 
-    # Simulate sending email
+    deliver_email(recipient_email, subject, body)
+    return {"message": f"Email simulation successful for: {recipient_email}"}
+
+def deliver_email(recipient_email, subject, body):
+    """ Simulates sending an email; shared by send_email_notification and ingest_detection_events. """
     print("---- SIMULATING EMAIL SEND ----")
     print(f"TO: {recipient_email}")
     print(f"SUBJECT: {subject}")
@@ -175,7 +199,133 @@ def send_email_notification(req: https_fn.CallableRequest) -> any:
     # })
     # print(f"Mail document created with ID: {mail_doc_ref[1].id} (simulation only)")
 
-    return {"message": f"Email simulation successful for: {recipient_email}"}
+@https_fn.on_call()
+def ingest_detection_events(req: https_fn.CallableRequest) -> any:
+    """
+    Stores a batch of detection events and sends rate-limited notification emails.
+    Expects events in req.data: a list of {"class", "trackId", "timestamp", "camera"}.
+    One call replaces what would otherwise be one send_email_notification call per
+    detection: events are written with batched writes into a few chunk and hourly
+    digest documents, and emails are pooled to at most one per EMAIL_MIN_INTERVAL_S.
+    User should be authenticated.
+    """
+    if req.auth is None:
+        raise https_fn.HttpsError(
+            code=https_fn.FunctionsErrorCode.UNAUTHENTICATED,
+            message="Authentication required to ingest events."
+        )
+
+    try:
+        raw_events = req.data.get("events") if isinstance(req.data, dict) else None
+        events = normalize_events(raw_events, time.time())
+    except ValueError as e:
+        raise https_fn.HttpsError(
+            code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT,
+            message=str(e)
+        )
+
+    try:
+        return ingest_events(firestore.client(), req.auth.uid, events, req.auth.token.get("email"))
+    except Exception as e:
+        # Log the error for debugging
+        print(f"Error ingesting events for UID {req.auth.uid}: {str(e)}")
+        raise https_fn.HttpsError(
+            code=https_fn.FunctionsErrorCode.INTERNAL,
+            message="An internal error occurred while ingesting events."
+        )
+
+def ingest_events(db, uid, events, default_email=None, now=None):
+    """ Writes events for uid to db and sends the email they make due, if any. """
+    now = time.time() if now is None else now
+    writes = write_events(db, uid, events, firestore.Increment, received_at=firestore.SERVER_TIMESTAMP)
+
+    user_ref = db.collection("users").document(uid)
+    prefs_doc = user_ref.collection("preferences").document("user_preferences").get()
+    preferences = prefs_doc.to_dict() if prefs_doc.exists else {}
+    counts = notify_counts(events, preferences)
+    recipient_email = preferences.get("notificationEmail") or default_email
+    sent = False
+    if counts:
+        state_ref = user_ref.collection("notificationState").document("email")
+        # Without a recipient the counts stay pending until there is one
+        email, last_sent = take_email(db, state_ref, lambda state: plan_email(state, counts, now,
+                                                                              deliverable=bool(recipient_email)))
+        writes += 1
+        if email is not None:
+            sent = send_email(db, state_ref, email, recipient_email, now, last_sent)
+
+    return {"accepted": len(events), "writes": writes, "emailSent": sent}
+
+def take_email(db, state_ref, plan):
+    """
+    Applies plan, state -> (new_state, email), to the email state in a transaction, so
+    concurrent calls neither lose pending counts nor both send. Returns (email, the
+    lastSentAt before it).
+    """
+    @firestore.transactional
+    def update_email_state(transaction, ref):
+        snapshot = ref.get(transaction=transaction)
+        current = snapshot.to_dict() if snapshot.exists else {}
+        state, due = plan(current)
+        if state != current:
+            transaction.set(ref, state)
+        return due, current.get("lastSentAt")
+
+    return update_email_state(db.transaction(), state_ref)
+
+def send_email(db, state_ref, email, recipient_email, sent_at, last_sent):
+    """ Delivers an email taken by take_email, or puts its counts back as pending if that fails. """
+    try:
+        deliver_email(recipient_email, *email_message(*email))
+        return True
+    except Exception as e:
+        print(f"Error sending notification email to {recipient_email}, keeping its counts pending: {str(e)}")
+
+        @firestore.transactional
+        def restore(transaction, ref):
+            snapshot = ref.get(transaction=transaction)
+            transaction.set(ref, restore_email(snapshot.to_dict() if snapshot.exists else None, email, sent_at,
+                                               last_sent))
+
+        restore(db.transaction(), state_ref)
+        return False
+
+@scheduler_fn.on_schedule(schedule=f"every {EMAIL_FLUSH_PERIOD_S // 60} minutes")
+def flush_pending_emails(event: scheduler_fn.ScheduledEvent) -> None:
+    """
+    Sends the notification counts held back by the email rate limit once it allows,
+    for users whose detections stopped before another ingest_detection_events call
+    could send them. Queries the email states with pending counts across users, which
+    needs the collection group index on pendingSince in firestore.indexes.json.
+    """
+    flush_emails(firestore.client())
+
+def flush_emails(db, now=None):
+    """ Sends every pending email that is due; returns how many were sent. """
+    now = time.time() if now is None else now
+    sent = 0
+    for snapshot in db.collection_group("notificationState").where("pendingSince", ">", 0).stream():
+        if flush_email(snapshot.to_dict(), now)[1] is None:
+            continue
+        # Left pending, not dropped, while the user has no address to send to
+        recipient_email = notification_recipient(db, snapshot.reference.parent.parent.id)
+        if not recipient_email:
+            continue
+        # Transactional, so an ingest call sending the same counts meanwhile does not send them twice
+        email, last_sent = take_email(db, snapshot.reference, lambda state: flush_email(state, now))
+        if email is not None and send_email(db, snapshot.reference, email, recipient_email, now, last_sent):
+            sent += 1
+    return sent
+
+def notification_recipient(db, uid):
+    """ The notificationEmail of uid's preferences, else the email of the account, else None. """
+    prefs_doc = db.collection("users").document(uid).collection("preferences").document("user_preferences").get()
+    if prefs_doc.exists and (prefs_doc.to_dict() or {}).get("notificationEmail"):
+        return prefs_doc.to_dict()["notificationEmail"]
+    try:
+        return auth.get_user(uid).email
+    except auth.UserNotFoundError:
+        return None
 
 # For local testing with Firebase Emulator Suite:
 # 1. Install Firebase CLI: `npm install -g firebase-tools`
@@ -1,7 +1,13 @@
-import cv2
+import threading
+
 import numpy as np
 import onnxruntime
-import time
+
+import metrics
+from decoder import DetectionDecoder
+from preprocess import Preprocessor
+from runtime_profile import ExecutionProfile
+from zones import merge_detections
 
 # COCO class names
 class_names = [
@@ -16,128 +22,182 @@ class_names = [
     "scissors", "teddy bear", "hair drier", "toothbrush"
 ]
 
-# Generate colors for bounding boxes
+# Generate colors for bounding boxes (drawn by renderer.OverlayRenderer)
 rng = np.random.default_rng(3)
 colors = rng.uniform(0, 255, size=(len(class_names), 3))
 
 
-def draw_box(image, box, color, thickness=2):
-    """ Draws a box on an image with a given color and thickness. """
-    x1, y1, x2, y2 = box.astype(int)
-    cv2.rectangle(image, (x1, y1), (x2, y2), color, thickness)
-
-
-def draw_text(image, text, box, color, font_size=0.5, text_thickness=1):
-    """ Draws text on an image with a given color and font size. """
-    x1, y1, x2, y2 = box.astype(int)
-    cv2.putText(image, text, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, font_size, color, text_thickness, cv2.LINE_AA)
-
-
-def draw_detections(image, boxes, scores, class_ids, mask_alpha=0.4):
-    """ Draws detections on an image. """
-    det_img = image.copy()
-    img_height, img_width = det_img.shape[:2]
-    font_size = min(img_width, img_height) * 0.0006
-    text_thickness = int(min(img_width, img_height) * 0.001)
-
-    for box, score, class_id in zip(boxes, scores, class_ids):
-        color = colors[class_id]
-        draw_box(det_img, box, color)
-        label = f"{class_names[class_id]}: {score:.2f}"
-        draw_text(det_img, label, box, color, font_size, text_thickness)
-    return det_img
-
-
 class YOLOv10:
-    def __init__(self, path):
+    """
+    YOLOv10 detector on one ONNX Runtime session.
+
+    Detection calls are reentrant: frame geometry travels with each call instead of
+    living on the instance, and the reused input, batch and output buffers are kept per
+    thread, so any number of threads may call detect_objects concurrently.
+    """
+
+    def __init__(self, path, letterbox=False, profile=None, optimized_model_filepath=None):
+        self.profile = profile or ExecutionProfile()
+        # When set, ONNX Runtime writes the graph it optimized for this session to that path
+        self.optimized_model_filepath = optimized_model_filepath
+        self.path = path
         self.session, self.input_name, self.output_name, self.input_width, self.input_height, self.input_shape = self.initialize_model(path)
         # self.draw_detections_helper assignment removed
+        self.preprocessor = Preprocessor(self.input_width, self.input_height, letterbox=letterbox)
+        self.decoder = DetectionDecoder(self.get_output_details(self.session), self.input_width, self.input_height,
+                                        num_classes=len(class_names))
+        # One run on a flat gray input settles the output layout and box units for the model's lifetime
+        probe_batch = self.input_shape[0] if isinstance(self.input_shape[0], int) else 1
+        probe = np.full((probe_batch, 3, self.input_height, self.input_width), 0.5, dtype=np.float32)
+        self.decoder.calibrate(self.session.run([self.output_name], {self.input_name: probe})[0])
+        # Per thread: the batch input tensor, and IO bindings with their preallocated outputs per batch size
+        self._local = threading.local()
 
     def initialize_model(self, path):
-        session = onnxruntime.InferenceSession(path, providers=onnxruntime.get_available_providers())
+        session = onnxruntime.InferenceSession(path, sess_options=self.profile.session_options(self.optimized_model_filepath),
+                                               providers=self.profile.resolved_providers())
         input_details = self.get_input_details(session)
         output_details = self.get_output_details(session)
 
         input_name = input_details[0]['name']
         input_shape = input_details[0]['shape']
-        input_width = input_shape[2]
-        input_height = input_shape[3] # Corrected typo from input_h eight
+        # NCHW layout
+        input_height = input_shape[2]
+        input_width = input_shape[3]
 
         output_name = output_details[0]['name']
         return session, input_name, output_name, input_width, input_height, input_shape
 
-    def detect_objects(self, image, conf_threshold=0.3):
-        input_tensor = self.prepare_input(image)
+    def detect_objects(self, image, conf_threshold=0.3, channel_order="BGR", class_mask=None, zones=None):
+        """
+        class_mask, a boolean array by class id, limits the detections to those classes.
+        zones, a ZoneSet, limits detection to crops around the zones and keeps the
+        detections centered in a zone; boxes are still in frame pixels.
+        """
+        if zones is not None:
+            crops = zones.crops(image)
+            if len(crops) > 1 and self.supports_batching:
+                return self.detect_objects_batch([image], conf_threshold, channel_order, class_mask, [zones])[0]
+            return merge_detections([self._detect(view, conf_threshold, channel_order, class_mask, crop)
+                                     for view, crop in crops])
+        return self._detect(image, conf_threshold, channel_order, class_mask)
+
+    def _detect(self, image, conf_threshold, channel_order, class_mask, crop=None):
+        with metrics.stage("preprocess"):
+            input_tensor, geometry = self.prepare_input(image, channel_order)
         # Now returns raw detections: boxes, scores, class_ids
-        boxes, scores, class_ids = self.inference(image, input_tensor, conf_threshold)
+        boxes, scores, class_ids = self.inference(input_tensor, geometry, conf_threshold, class_mask, crop)
         return boxes, scores, class_ids
 
-    def prepare_input(self, image):
-        self.img_height, self.img_width = image.shape[:2]
-        input_img = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        input_img = cv2.resize(input_img, (self.input_width, self.input_height))
-        input_img = input_img / 255.0
-        input_img = input_img.transpose(2, 0, 1)
-        input_tensor = input_img[np.newaxis, :, :, :].astype(np.float32)
-        return input_tensor
-
-    def inference(self, image, input_tensor, conf_threshold=0.3):
-        start = time.perf_counter()
-        outputs = self.session.run([self.output_name], {self.input_name: input_tensor})
-
-        boxes, scores, class_ids = self.process_output(outputs[0], conf_threshold)
-
-        # No longer draw detections here, return raw data
-        # output_image = self.draw_detections_internal(image.copy(), boxes, scores, class_ids) # Pass a copy of the image
-
-        print(f"Inference time: {(time.perf_counter() - start)*1000:.2f} ms")
+    @property
+    def supports_batching(self):
+        # Exports with a fixed batch dimension of 1 can only take one frame per run
+        batch_dim = self.input_shape[0]
+        return not isinstance(batch_dim, int) or batch_dim > 1
+
+    def detect_objects_batch(self, images, conf_thresholds=0.3, channel_orders="BGR", class_masks=None, zones=None):
+        """
+        Runs one session.run over several frames and returns (boxes, scores, class_ids) per frame.
+        zones holds a ZoneSet or None per frame; every crop of a frame's zones is a batch item.
+        """
+        if np.isscalar(conf_thresholds):
+            conf_thresholds = [conf_thresholds] * len(images)
+        if isinstance(channel_orders, str):
+            channel_orders = [channel_orders] * len(images)
+        if class_masks is None or isinstance(class_masks, np.ndarray):
+            class_masks = [class_masks] * len(images)
+        if zones is None:
+            zones = [None] * len(images)
+        if not self.supports_batching:
+            return [self.detect_objects(image, conf, order, mask, frame_zones)
+                    for image, conf, order, mask, frame_zones
+                    in zip(images, conf_thresholds, channel_orders, class_masks, zones)]
+
+        # (frame index, image or crop, crop) per batch item
+        items = []
+        for index, (image, frame_zones) in enumerate(zip(images, zones)):
+            if frame_zones is None:
+                items.append((index, image, None))
+            else:
+                items.extend((index, view, crop) for view, crop in frame_zones.crops(image))
+
+        local = self._local
+        batch_tensor = getattr(local, "batch_tensor", None)
+        if batch_tensor is None or batch_tensor.shape[0] < len(items):
+            batch_tensor = local.batch_tensor = np.empty((len(items), 3, self.input_height, self.input_width),
+                                                         dtype=np.float32)
+        input_tensor = batch_tensor[:len(items)]
+        geometries = []
+        for i, (index, image, _) in enumerate(items):
+            with metrics.stage("preprocess"):
+                _, geometry = self.prepare_input(image, channel_orders[index], out=input_tensor[i])
+            geometries.append(geometry)
+        with metrics.stage("inference"):
+            output = self.run_session(input_tensor)
+
+        results = [[] for _ in images]
+        for i, ((index, _, crop), geometry) in enumerate(zip(items, geometries)):
+            with metrics.stage("decode"):
+                results[index].append(self.process_output(output[i:i + 1], conf_thresholds[index], geometry,
+                                                          class_masks[index], crop))
+        return [merge_detections(frame_results) for frame_results in results]
+
+    def prepare_input(self, image, channel_order="BGR", out=None):
+        """ Returns (input_tensor, geometry). The tensor is a reused per-thread buffer, valid until the thread's next call. """
+        return self.preprocessor(image, channel_order, out)
+
+    def inference(self, input_tensor, geometry, conf_threshold=0.3, class_mask=None, crop=None):
+        # Per-stage timings are recorded in metrics instead of printed per frame
+        with metrics.stage("inference"):
+            output = self.run_session(input_tensor)
+
+        with metrics.stage("decode"):
+            boxes, scores, class_ids = self.process_output(output, conf_threshold, geometry, class_mask, crop)
         # Return raw detections
         return boxes, scores, class_ids
 
 
-    def process_output(self, output, conf_threshold=0.3):
-        predictions = np.squeeze(output).T
-
-        # Filter out detections with low confidence
-        scores = np.max(predictions[:, 4:], axis=1)
-        predictions = predictions[scores > conf_threshold, :]
-        scores = scores[scores > conf_threshold]
-
-        if scores.shape[0] == 0:
-            return np.array([]), np.array([]), np.array([])
-
-        class_ids = np.argmax(predictions[:, 4:], axis=1)
-        boxes = self.extract_boxes(predictions)
-        return boxes, scores, class_ids
-
-    def extract_boxes(self, predictions):
-        # Extract boxes from predictions
-        boxes = predictions[:, :4]
-
-        # Scale boxes to original image dimensions
-        boxes = self.rescale_boxes(boxes)
-
-        # Convert boxes to xyxy format
-        # x_center, y_center, width, height -> x1, y1, x2, y2
-        x1 = boxes[:, 0] - boxes[:, 2] / 2
-        y1 = boxes[:, 1] - boxes[:, 3] / 2
-        x2 = boxes[:, 0] + boxes[:, 2] / 2
-        y2 = boxes[:, 1] + boxes[:, 3] / 2
-        boxes = np.column_stack((x1, y1, x2, y2))
-        return boxes
-
-    def rescale_boxes(self, boxes):
-        # Rescale boxes to original image dimensions
-        # input_shape = np.array([self.input_width, self.input_height, self.input_width, self.input_height])
-        # boxes = np.divide(boxes, input_shape, dtype=np.float32) # This was for yolov8, yolov10 output is already 0-1
-
-        # For YOLOv10, the output format is [x_center, y_center, width, height] (normalized to 0-1)
-        # So, we just need to multiply by original image dimensions
-        boxes[:, 0] *= self.img_width
-        boxes[:, 1] *= self.img_height
-        boxes[:, 2] *= self.img_width
-        boxes[:, 3] *= self.img_height
-        return boxes
+    def run_session(self, input_tensor):
+        """
+        session.run through IO binding: the input tensor is bound in place, without a copy,
+        and the output is written into a buffer reused across calls. The returned array is
+        only valid until the calling thread's next call with the same batch size.
+        """
+        input_tensor = np.ascontiguousarray(input_tensor, dtype=np.float32)
+        batch_size = input_tensor.shape[0]
+        bindings = self.bindings
+        binding = bindings.get(batch_size)
+        if binding is None:
+            binding = bindings[batch_size] = self.create_binding(batch_size)
+        io_binding, output = binding
+        io_binding.bind_input(self.input_name, "cpu", 0, np.float32, input_tensor.shape, input_tensor.ctypes.data)
+        self.session.run_with_iobinding(io_binding)
+        if output is None:
+            return io_binding.copy_outputs_to_cpu()[0]
+        return output
+
+    @property
+    def bindings(self):
+        """ The calling thread's IO bindings and output buffers, by batch size. """
+        bindings = getattr(self._local, "bindings", None)
+        if bindings is None:
+            bindings = self._local.bindings = {}
+        return bindings
+
+    def create_binding(self, batch_size):
+        io_binding = self.session.io_binding()
+        output_details = self.get_output_details(self.session)[0]
+        shape = [batch_size] + list(output_details['shape'][1:])
+        if output_details['type'] != 'tensor(float)' or not all(isinstance(dim, int) for dim in shape):
+            # Symbolic output dimensions are only known after a run, so let ONNX Runtime allocate
+            io_binding.bind_output(self.output_name, "cpu")
+            return io_binding, None
+        output = np.empty(shape, dtype=np.float32)
+        io_binding.bind_output(self.output_name, "cpu", 0, np.float32, shape, output.ctypes.data)
+        return io_binding, output
+
+    def process_output(self, output, conf_threshold, geometry, class_mask=None, crop=None):
+        return self.decoder.decode(output, conf_threshold, geometry, class_mask, crop)
 
     def get_input_details(self, session):
         model_inputs = session.get_inputs()
@@ -0,0 +1,116 @@
+import math
+import time
+
+import cv2
+import numpy as np
+
+# Mean keyframe score within this much of the confidence threshold forces the next keyframe. Wider
+# margins fire on ordinary hard scenes and collapse the interval (benchmarks/keyframe_bench.py)
+MARGIN = 0.02
+
+
+class KeyframeScheduler:
+    """
+    Decides, per frame, whether the detector runs (keyframe) or tracks are propagated instead.
+
+    The interval between keyframes adapts so the detector's average cost per frame stays
+    within a budget: either latency_budget_ms of detector time per frame, or cpu_budget,
+    the fraction of the stream's frame period the detector may use. A keyframe is forced
+    early when the scene changes (mean absolute difference of a small grayscale thumbnail
+    against the last keyframe) or when detection confidence drops: by confidence_drop
+    against the last keyframe, or to within confidence_margin of the confidence threshold
+    the detector ran with, so the floor follows the threshold instead of sitting just
+    above it.
+    """
+
+    def __init__(self, latency_budget_ms=None, cpu_budget=None, min_interval=1, max_interval=8,
+                 scene_change_threshold=12.0, confidence_margin=MARGIN, confidence_drop=0.15,
+                 thumbnail_size=(64, 36), smoothing=0.2):
+        self.latency_budget_ms = latency_budget_ms
+        self.cpu_budget = cpu_budget
+        self.min_interval = max(1, min_interval)
+        self.max_interval = max(self.min_interval, max_interval)
+        self.scene_change_threshold = scene_change_threshold
+        self.confidence_margin = confidence_margin
+        self.confidence_drop = confidence_drop
+        self.thumbnail_size = thumbnail_size
+        self.smoothing = smoothing
+
+        self.interval = self.min_interval
+        self.keyframes = 0
+        self.propagated = 0
+        self.forced = 0
+
+        self._since_keyframe = 0
+        self._force_next = True
+        self._detector_ms = None
+        self._frame_period_ms = None
+        self._last_frame_time = None
+        self._last_confidence = None
+        self._keyframe_thumbnail = None
+        self._thumbnail = None
+
+    def should_run(self, image):
+        """ Call once per frame, before deciding whether to run the detector on it. """
+        now = time.perf_counter()
+        if self._last_frame_time is not None:
+            self._frame_period_ms = self._ewma(self._frame_period_ms, (now - self._last_frame_time) * 1000)
+        self._last_frame_time = now
+
+        self._thumbnail = self._make_thumbnail(image)
+        run = self._force_next or self._since_keyframe + 1 >= self.interval
+        if not run and self._keyframe_thumbnail is not None:
+            change = cv2.absdiff(self._thumbnail, self._keyframe_thumbnail).mean()
+            if change > self.scene_change_threshold:
+                run = True
+                self.forced += 1
+
+        if run:
+            self._since_keyframe = 0
+            self._force_next = False
+            self._keyframe_thumbnail = self._thumbnail
+            self.keyframes += 1
+        else:
+            self._since_keyframe += 1
+            self.propagated += 1
+        return run
+
+    def record_keyframe(self, detector_ms, scores, conf_threshold=0.0):
+        """ Feeds back the cost and confidence of the detector run that should_run asked for, at conf_threshold. """
+        self._detector_ms = self._ewma(self._detector_ms, detector_ms)
+        self.interval = self._target_interval()
+
+        confidence = float(np.mean(scores)) if len(scores) else None
+        if confidence is not None:
+            dropped = self._last_confidence is not None and self._last_confidence - confidence > self.confidence_drop
+            if dropped or confidence < conf_threshold + self.confidence_margin:
+                # Propagating uncertain boxes compounds errors, so look again on the next frame
+                self._force_next = True
+                self.forced += 1
+        self._last_confidence = confidence
+
+    @property
+    def compute_ratio(self):
+        """ Fraction of frames that ran the detector. """
+        total = self.keyframes + self.propagated
+        return self.keyframes / total if total else 1.0
+
+    def _target_interval(self):
+        budget_ms = self.latency_budget_ms
+        if self.cpu_budget is not None and self._frame_period_ms:
+            cpu_budget_ms = self.cpu_budget * self._frame_period_ms
+            budget_ms = cpu_budget_ms if budget_ms is None else min(budget_ms, cpu_budget_ms)
+        if not budget_ms or self._detector_ms is None:
+            return self.interval
+        interval = math.ceil(self._detector_ms / budget_ms)
+        return int(min(self.max_interval, max(self.min_interval, interval)))
+
+    def _ewma(self, current, sample):
+        return sample if current is None else current + self.smoothing * (sample - current)
+
+    def _make_thumbnail(self, image):
+        small = cv2.resize(image, self.thumbnail_size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            # Channel order does not matter for a change measure, so average instead of converting
+            small = small.mean(axis=2, dtype=np.float32).astype(np.uint8)
+        return small
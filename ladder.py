@@ -0,0 +1,210 @@
+import time
+
+from model_loader import FAILED
+
+
+class QualityLadder:
+    """
+    Detector variants ordered from the cheapest rung to the most accurate one: the same
+    model exported at smaller input sizes, smaller models, or both.
+
+    Each rung is a ModelLoader that loads (and warms up, and wraps) its variant in the
+    background; a rung may reuse a loader the app already has. Every YOLOv10 reads its
+    input size from its own graph and preprocesses and decodes with it, so boxes come
+    back in frame pixels whichever rung ran. detector() serves the rung a stream's
+    LadderController chose, or while that one loads the nearest loaded rung below it
+    (above it if none below is loaded).
+    """
+
+    def __init__(self, loaders, names=None):
+        if not loaders:
+            raise ValueError("A quality ladder needs at least one rung.")
+        self.loaders = list(loaders)
+        self.names = list(names) if names is not None else [f"rung{i}" for i in range(len(self.loaders))]
+        if len(self.names) != len(self.loaders):
+            raise ValueError("A quality ladder needs one name per rung.")
+
+    def __len__(self):
+        return len(self.loaders)
+
+    def index(self, name_or_level):
+        """ The level of a rung given its name or level. """
+        if isinstance(name_or_level, int) or str(name_or_level).lstrip("-").isdigit():
+            level = int(name_or_level)
+            if not -len(self) <= level < len(self):
+                raise ValueError(f"No rung {level} in a ladder of {len(self)}.")
+            return level % len(self)
+        if name_or_level not in self.names:
+            raise ValueError(f"Unknown rung {name_or_level!r}, expected one of {self.names}.")
+        return self.names.index(name_or_level)
+
+    def ready(self, level):
+        return self.loaders[level].ready
+
+    def failed(self, level):
+        """ Whether the rung failed to load, so it never serves a stream. """
+        return self.loaders[level].state == FAILED
+
+    @property
+    def any_ready(self):
+        return any(loader.ready for loader in self.loaders)
+
+    def detector(self, level):
+        """ (level, model) of the rung that serves a stream at level, or (None, None) while none is loaded. """
+        for candidate in [*range(level, -1, -1), *range(level + 1, len(self))]:
+            model = self.loaders[candidate].model
+            if model is not None:
+                return candidate, model
+        return None, None
+
+    def input_size(self, level):
+        """ (width, height) the rung's model runs at, None until it is loaded. """
+        detector = self.loaders[level].detector
+        return None if detector is None else (detector.input_width, detector.input_height)
+
+    def cost_ratio(self, from_level, to_level):
+        """
+        Expected latency of to_level relative to from_level, from their input pixels; 1.0
+        while either is unknown. Rungs that differ in model size as well cost more than
+        this says, which the controller's backoff absorbs.
+        """
+        from_size, to_size = self.input_size(from_level), self.input_size(to_level)
+        if from_size is None or to_size is None:
+            return 1.0
+        return (to_size[0] * to_size[1]) / (from_size[0] * from_size[1])
+
+    def queue_depth(self, level):
+        return getattr(self.loaders[level].model, "queue_depth", 0)
+
+
+class LadderController:
+    """
+    Moves one stream along a QualityLadder so its detector keeps up with target_fps.
+
+    Each detector run of the stream reports its latency (queueing in the shared batcher
+    included) and the queue depth of the detector that ran it. With the smoothed
+    latency above the frame budget, 1000 / target_fps ms, or more than max_queue_depth
+    frames queued, for down_after runs in a row, the stream steps down a rung. It steps
+    up only after min_dwell seconds on its rung and up_after runs in a row in which the
+    next rung's expected latency (this one's scaled by QualityLadder.cost_ratio) stays
+    under up_ratio of the budget with a short queue. A rung left because it was over
+    budget is not retried for backoff seconds, doubled on each repeat up to max_backoff,
+    so a stream on the edge settles instead of oscillating; the backoff is forgotten
+    once the stream has held the rung for as long.
+
+    While the stream's rung loads, a fallback rung serves it. Runs on the fallback count
+    toward stepping down, since the stream's rung costs at least as much as a cheaper
+    fallback, but never toward stepping up. Rungs that failed to load are skipped on the
+    way down, and a stream whose rung failed moves to the rung serving it.
+    """
+
+    def __init__(self, ladder, target_fps=15.0, start_level=None, up_ratio=0.6, down_after=5, up_after=30,
+                 max_queue_depth=8, min_dwell=5.0, backoff=30.0, max_backoff=600.0, smoothing=0.2,
+                 clock=time.monotonic):
+        self.ladder = ladder
+        self.target_fps = target_fps
+        self.up_ratio = up_ratio
+        self.down_after = max(1, down_after)
+        self.up_after = max(1, up_after)
+        self.max_queue_depth = max_queue_depth
+        self.min_dwell = min_dwell
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.smoothing = smoothing
+        self.clock = clock
+
+        self.level = len(ladder) - 1 if start_level is None else ladder.index(start_level)
+        self.latency_ms = None
+        self.transitions_up = 0
+        self.transitions_down = 0
+
+        self._over = 0
+        self._under = 0
+        self._since = clock()
+        self._backoff = {}
+        self._retry_after = {}
+
+    @property
+    def budget_ms(self):
+        return 1000.0 / self.target_fps
+
+    def record(self, latency_ms, queue_depth=0, level=None):
+        """
+        Feeds back one detector run of the stream, on level if a rung other than the stream's
+        own served it; returns (from_level, to_level) if the stream changed rung, else None.
+        """
+        now = self.clock()
+        if level is not None and level != self.level:
+            if self.ladder.failed(self.level):
+                return self._move(level - self.level, now)
+            return self._record_fallback(latency_ms, queue_depth, now)
+        self.latency_ms = latency_ms if self.latency_ms is None else \
+            self.latency_ms + self.smoothing * (latency_ms - self.latency_ms)
+        budget_ms = self.budget_ms
+
+        if self.latency_ms > budget_ms or queue_depth > self.max_queue_depth:
+            self._over += 1
+            self._under = 0
+            down = self._lower()
+            if self._over >= self.down_after and down is not None:
+                return self._move(down - self.level, now)
+            return None
+
+        self._over = 0
+        held = now - self._since
+        if self.level in self._backoff and held >= self._backoff[self.level]:
+            del self._backoff[self.level]
+        if self._can_step_up(now, held, budget_ms, queue_depth):
+            self._under += 1
+            if self._under >= self.up_after:
+                return self._move(self._higher() - self.level, now)
+        else:
+            self._under = 0
+        return None
+
+    def _record_fallback(self, latency_ms, queue_depth, now):
+        # Raw latency: the smoothed one belongs to the stream's own rung once it loads
+        self._under = 0
+        if latency_ms > self.budget_ms or queue_depth > self.max_queue_depth:
+            self._over += 1
+            down = self._lower()
+            if self._over >= self.down_after and down is not None:
+                return self._move(down - self.level, now)
+        else:
+            self._over = 0
+        return None
+
+    def _lower(self):
+        """ The nearest rung below the stream's that did not fail to load, None if there is none. """
+        return next((level for level in range(self.level - 1, -1, -1) if not self.ladder.failed(level)), None)
+
+    def _higher(self):
+        """ The nearest rung above the stream's that did not fail to load, None if there is none. """
+        return next((level for level in range(self.level + 1, len(self.ladder)) if not self.ladder.failed(level)), None)
+
+    def _can_step_up(self, now, held, budget_ms, queue_depth):
+        up = self._higher()
+        if up is None or not self.ladder.ready(up):
+            return False
+        if held < self.min_dwell or now < self._retry_after.get(up, 0.0):
+            return False
+        if queue_depth > self.max_queue_depth // 2:
+            return False
+        return self.latency_ms * self.ladder.cost_ratio(self.level, up) < self.up_ratio * budget_ms
+
+    def _move(self, step, now):
+        from_level = self.level
+        if step < 0:
+            self.transitions_down += 1
+            backoff = min(self.max_backoff, 2 * self._backoff[from_level]) if from_level in self._backoff \
+                else self.backoff
+            self._backoff[from_level] = backoff
+            self._retry_after[from_level] = now + backoff
+        else:
+            self.transitions_up += 1
+        self.level = from_level + step
+        # Latency on the new rung is measured afresh rather than carried over
+        self.latency_ms = None
+        self._over = self._under = 0
+        self._since = now
+        return from_level, self.level
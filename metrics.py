@@ -0,0 +1,197 @@
+import bisect
+import os
+import threading
+import time
+
+# Set METRICS_ENABLED=0 to turn every timer and counter into a no-op
+ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+
+# Upper bounds in milliseconds, Prometheus-style cumulative buckets are derived at render time
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+def _escape_label_value(value):
+    """ A label value as the text exposition format requires: backslash, double quote and newline escaped. """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    # Values come from clients (stream ids) and file names (rungs), so any of them may need escaping
+    return "{" + ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in labels) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        """ Upper bound of the bucket holding the q-th quantile (coarse, bucket resolution). """
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    """
+    Minimal in-process metrics store with Prometheus text exposition.
+
+    Histograms, counters and gauges are keyed by name plus a sorted tuple of label
+    pairs. Collectors are callables run at scrape time that return
+    (name, labels_dict, value) gauge samples, for state owned by other components
+    such as queue depths.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.help = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        return histogram
+
+    def inc(self, name, amount=1, **labels):
+        if not ENABLED:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        if not ENABLED:
+            return
+        self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def forget(self, **labels):
+        """ Drops the recorded series carrying all of the given labels, e.g. those of a closed stream. """
+        wanted = set(labels.items())
+        with self._lock:
+            for series in (self.histograms, self.counters, self.gauges):
+                for key in [key for key in series if wanted <= set(key[1])]:
+                    del series[key]
+
+    def reset(self):
+        """ Drops recorded histograms, counters and gauges; collectors stay registered. """
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
+
+    def render(self):
+        """ Returns all metrics in the Prometheus text exposition format. """
+        lines = []
+        emitted = set()
+
+        def header(name, kind):
+            if name not in emitted:
+                emitted.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            header(name, "histogram")
+            with histogram._lock:
+                counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        for (name, labels), value in sorted(self.counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        gauges = dict(self.gauges)
+        for collector in self.collectors:
+            try:
+                for name, labels, value in collector():
+                    gauges[(name, tuple(sorted(labels.items())))] = value
+            except Exception as e:
+                print(f"Metrics collector {collector} failed: {e}")
+        for (name, labels), value in sorted(gauges.items()):
+            header(name, "gauge")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+registry.describe("stage_latency_ms", "Latency of one pipeline stage for one frame (or one batch for inference).")
+registry.describe("frames_total", "Frames handled by the detection handler.")
+registry.describe("frames_skipped_total", "Frames that did not run the detector, by reason.")
+
+
+class _StageTimer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe((time.perf_counter() - self.start) * 1000)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def stage(name, **labels):
+    """ Context manager that records the wall time of a pipeline stage in stage_latency_ms. """
+    if not ENABLED:
+        return _NULL_TIMER
+    return _StageTimer(registry.histogram("stage_latency_ms", stage=name, **labels))
+
+
+def render():
+    if not ENABLED:
+        return "# metrics disabled (METRICS_ENABLED=0)\n"
+    return registry.render()
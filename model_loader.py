@@ -0,0 +1,283 @@
+"""
+Background model loading for fast cold starts.
+
+Usage: python model_loader.py [--offline]
+Downloads the model into the Hugging Face cache and saves its optimized graph, e.g. while
+building a container image, so later starts need neither the network nor graph optimization.
+"""
+import argparse
+import hashlib
+import os
+import platform
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import onnxruntime
+from huggingface_hub import hf_hub_download
+from huggingface_hub.errors import LocalEntryNotFoundError
+
+from inference import YOLOv10
+from quantize import DEFAULT_VARIANT_DIR, PRECISIONS, quantize_dynamic_model, variant_path
+from runtime_profile import ExecutionProfile, available_cores
+
+DEFAULT_REPO_ID = "onnx-community/yolov10n"
+DEFAULT_FILENAME = "onnx/model.onnx"
+DEFAULT_OPTIMIZED_DIR = os.path.join(os.path.expanduser("~"), ".cache", "fastrtc-object-detect", "optimized")
+
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+def _cpu_flags():
+    # Optimized graphs can depend on the instruction sets of the CPU they were built on
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith("flags"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return ""
+
+
+# The graph and profile for detectors loaded outside this process, e.g. by worker processes
+ModelSource = namedtuple("ModelSource", ["path", "profile"])
+
+
+class ModelLoader:
+    """
+    Resolves, loads and warms up the detector on a background thread.
+
+    The model path is local_path if given, else the Hugging Face cache, and only then a
+    download (never with offline=True). For an INT8 precision the matching variant from
+    quantize.py is loaded instead; the dynamic one is created on first use. The graph
+    ONNX Runtime optimizes on the first load is saved under optimized_dir, keyed by the
+    source model, ONNX Runtime version, optimization level, providers and CPU, and later
+    loads read it back with graph optimization disabled. After warmup_runs inferences on a warmup_frame_size frame
+    (and one batch of warmup_batch_size frames, if the model batches) the detector, wrapped
+    by wrap if given, is published as .model and the loader reports ready.
+
+    With sessions > 1 that many detectors are loaded, each with its own InferenceSession
+    and, unless the profile sets one, an equal share of the cores as its thread budget.
+    wrap then receives the list of detectors; without wrap .model is the first one.
+    With sessions=0 no session is created here: wrap receives the ModelSource detectors
+    elsewhere should load, the cached optimized graph if there is one, and .detector
+    stays None.
+    """
+
+    def __init__(self, repo_id=DEFAULT_REPO_ID, filename=DEFAULT_FILENAME, local_path=None, cache_dir=None,
+                 offline=False, precision="fp32", variant_dir=DEFAULT_VARIANT_DIR, profile=None, letterbox=False,
+                 optimized_dir=DEFAULT_OPTIMIZED_DIR, warmup_runs=3, warmup_frame_size=(640, 480),
+                 warmup_batch_size=1, sessions=1, wrap=None):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision!r}, expected one of {PRECISIONS}.")
+        self.repo_id = repo_id
+        self.filename = filename
+        self.local_path = local_path
+        self.cache_dir = cache_dir
+        self.offline = offline
+        self.precision = precision
+        self.variant_dir = variant_dir
+        self.profile = profile or ExecutionProfile()
+        self.letterbox = letterbox
+        self.optimized_dir = optimized_dir
+        self.warmup_runs = warmup_runs
+        self.warmup_frame_size = warmup_frame_size
+        self.warmup_batch_size = warmup_batch_size
+        self.sessions = max(0, int(sessions))
+        self.wrap = wrap
+
+        self.model = None
+        self.detector = None
+        self.detectors = []
+        self.model_path = None
+        self.state = LOADING
+        self.error = None
+        self.used_optimized_cache = False
+        self.timings = {}
+
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """ Starts loading in the background and returns immediately. """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="model-loader", daemon=True)
+            self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        """ Blocks until the model is ready and returns it; raises if loading failed or timed out. """
+        self.start()
+        if not self._ready.wait(timeout):
+            raise TimeoutError(f"Model not ready after {timeout} s")
+        if self.state == FAILED:
+            raise RuntimeError(f"Model failed to load: {self.error}")
+        return self.model
+
+    @property
+    def ready(self):
+        return self.state == READY
+
+    def status(self):
+        """ Readiness details for the /ready probe. """
+        return {
+            "state": self.state,
+            "error": self.error,
+            "model_path": self.model_path,
+            "precision": self.precision,
+            "sessions": self.sessions,
+            "optimized_cache_hit": self.used_optimized_cache,
+            "timings_s": {stage: round(seconds, 3) for stage, seconds in self.timings.items()},
+        }
+
+    def resolve_model_path(self):
+        if self.local_path:
+            if not os.path.exists(self.local_path):
+                raise FileNotFoundError(f"Model file {self.local_path} does not exist")
+            return self.local_path
+        try:
+            # A cached copy is used without the revision check hf_hub_download otherwise does over the network
+            return hf_hub_download(repo_id=self.repo_id, filename=self.filename, cache_dir=self.cache_dir,
+                                   local_files_only=True)
+        except LocalEntryNotFoundError:
+            if self.offline:
+                raise
+        return hf_hub_download(repo_id=self.repo_id, filename=self.filename, cache_dir=self.cache_dir)
+
+    def resolve_variant(self, model_path):
+        """ The path of the configured precision of the model at model_path. """
+        path = variant_path(model_path, self.precision, self.variant_dir)
+        if os.path.exists(path):
+            return path
+        if self.precision == "int8-dynamic":
+            # Dynamic quantization needs no calibration data, so the variant can be made here
+            return quantize_dynamic_model(model_path, path)
+        raise FileNotFoundError(f"No {self.precision} variant at {path}. Create it with "
+                                f"`python quantize.py static {model_path} --calibration-dir FRAMES`.")
+
+    def optimized_path(self, model_path):
+        stat = os.stat(model_path)
+        key = "|".join([
+            os.path.abspath(model_path), str(stat.st_size), str(stat.st_mtime_ns), onnxruntime.__version__,
+            self.profile.graph_optimization_level, ",".join(self.profile.resolved_providers()),
+            platform.machine(), _cpu_flags(),
+        ])
+        digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+        name = os.path.splitext(os.path.basename(model_path))[0]
+        return os.path.join(self.optimized_dir, f"{name}-{digest}.onnx")
+
+    def session_profile(self):
+        """ The profile of each detector session; without a thread count in the profile they split the cores. """
+        if self.sessions <= 1 or self.profile.intra_op_num_threads:
+            return self.profile
+        return self.profile.copy(intra_op_num_threads=max(1, available_cores() // self.sessions))
+
+    def model_source(self, model_path, profile=None):
+        """ The graph a detector loaded elsewhere should read: the cached optimized one if any, else the model. """
+        profile = profile or self.profile
+        if self.optimized_dir and profile.graph_optimization_level != "disable":
+            optimized_path = self.optimized_path(model_path)
+            if os.path.exists(optimized_path):
+                self.used_optimized_cache = True
+                return ModelSource(optimized_path, profile.copy(graph_optimization_level="disable"))
+        return ModelSource(model_path, profile)
+
+    def load_detector(self, model_path, profile=None):
+        profile = profile or self.profile
+        if not self.optimized_dir or profile.graph_optimization_level == "disable":
+            return YOLOv10(model_path, letterbox=self.letterbox, profile=profile)
+
+        optimized_path = self.optimized_path(model_path)
+        if os.path.exists(optimized_path):
+            try:
+                # The graph is already optimized, so skip ONNX Runtime's optimization passes
+                detector = YOLOv10(optimized_path, letterbox=self.letterbox,
+                                   profile=profile.copy(graph_optimization_level="disable"))
+                self.used_optimized_cache = True
+                return detector
+            except Exception as e:
+                print(f"Discarding unusable optimized model {optimized_path}: {e}")
+                os.remove(optimized_path)
+
+        try:
+            os.makedirs(self.optimized_dir, exist_ok=True)
+            temp_path = f"{optimized_path}.{os.getpid()}.tmp"
+            detector = YOLOv10(model_path, letterbox=self.letterbox, profile=profile,
+                               optimized_model_filepath=temp_path)
+            # Renamed into place only once complete, so a crash never leaves a truncated cache entry
+            os.replace(temp_path, optimized_path)
+            return detector
+        except OSError as e:
+            print(f"Could not cache the optimized model in {self.optimized_dir}: {e}")
+            return YOLOv10(model_path, letterbox=self.letterbox, profile=profile)
+
+    def warmup(self, detector):
+        width, height = self.warmup_frame_size
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        for _ in range(self.warmup_runs):
+            detector.detect_objects(frame, channel_order="RGB")
+        if self.warmup_batch_size > 1 and detector.supports_batching:
+            detector.detect_objects_batch([frame] * self.warmup_batch_size, channel_orders="RGB")
+
+    def _run(self):
+        try:
+            start = time.perf_counter()
+            self.model_path = self.resolve_variant(self.resolve_model_path())
+            self.timings["resolve"] = time.perf_counter() - start
+
+            if self.sessions == 0:
+                # Detectors load elsewhere and warm up there; publish what they should load
+                source = self.model_source(self.model_path)
+                self.model = self.wrap(source) if self.wrap else source
+                self.state = READY
+                print(f"Model source ready in {sum(self.timings.values()):.2f} s: {source.path}")
+                return
+
+            start = time.perf_counter()
+            profile = self.session_profile()
+            detectors = [self.load_detector(self.model_path, profile)]
+            # The first load writes the optimized graph the other sessions then read back
+            cache_hit = self.used_optimized_cache
+            detectors += [self.load_detector(self.model_path, profile) for _ in range(self.sessions - 1)]
+            self.used_optimized_cache = cache_hit
+            self.timings["session"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for detector in detectors:
+                self.warmup(detector)
+            self.timings["warmup"] = time.perf_counter() - start
+
+            self.detectors = detectors
+            self.detector = detectors[0]
+            if self.wrap:
+                self.model = self.wrap(detectors if self.sessions > 1 else detectors[0])
+            else:
+                self.model = detectors[0]
+            self.state = READY
+            print(f"Model ready in {sum(self.timings.values()):.2f} s {self.status()['timings_s']}")
+        except Exception as e:
+            self.state = FAILED
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"Model loading failed: {self.error}")
+        finally:
+            self._ready.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="Local model path instead of the Hugging Face model")
+    parser.add_argument("--offline", action="store_true", help="Only use the Hugging Face cache")
+    parser.add_argument("--precision", choices=PRECISIONS, default="fp32")
+    parser.add_argument("--profile", help="Execution profile JSON saved by runtime_profile.py")
+    parser.add_argument("--sessions", type=int, default=1, help="Detector sessions to load")
+    args = parser.parse_args()
+
+    loader = ModelLoader(local_path=args.model, offline=args.offline, precision=args.precision,
+                         profile=ExecutionProfile.load(args.profile) if args.profile else None,
+                         sessions=args.sessions)
+    loader.wait()
+    print(loader.status())
@@ -0,0 +1,96 @@
+import time
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Cheap change detector placed in front of the model so static scenes skip inference.
+
+    Each frame is shrunk to a small grayscale thumbnail and compared against a running
+    average background. A frame counts as motion when more than min_changed_fraction of
+    the (optionally masked) thumbnail pixels differ from the background by more than
+    pixel_threshold. A frame is let through at least every refresh_interval seconds so
+    cached detections do not go stale indefinitely.
+
+    Regions are polygons in normalized [0, 1] frame coordinates, e.g.
+    [[[0.1, 0.2], [0.5, 0.2], [0.5, 0.9], [0.1, 0.9]]]; only pixels inside them count.
+    """
+
+    def __init__(self, thumbnail_width=160, pixel_threshold=25, min_changed_fraction=0.002,
+                 learning_rate=0.05, refresh_interval=30.0, regions=None):
+        self.thumbnail_width = thumbnail_width
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_fraction = min_changed_fraction
+        self.learning_rate = learning_rate
+        self.refresh_interval = refresh_interval
+        self.regions = regions or []
+
+        self.inferred_frames = 0
+        self.skipped_frames = 0
+        self.last_changed_fraction = 0.0
+
+        self._background = None
+        self._mask = None
+        self._mask_area = 0
+        self._last_pass = 0.0
+
+    def has_motion(self, image):
+        """ True if the frame should go through the detector, False if the last detections still hold. """
+        gray = self._thumbnail(image)
+        now = time.monotonic()
+        if self._background is None or self._background.shape != gray.shape:
+            self._reset(gray)
+            return self._passed(now)
+
+        diff = cv2.absdiff(gray, self._background)
+        changed = diff > self.pixel_threshold
+        if self._mask is not None:
+            changed &= self._mask
+        self.last_changed_fraction = np.count_nonzero(changed) / self._mask_area
+        # Slow running average, so gradual lighting changes fold into the background
+        cv2.accumulateWeighted(gray, self._background, self.learning_rate)
+
+        if self.last_changed_fraction > self.min_changed_fraction or now - self._last_pass >= self.refresh_interval:
+            return self._passed(now)
+        self.skipped_frames += 1
+        return False
+
+    def set_regions(self, regions):
+        self.regions = regions or []
+        self._background = None
+
+    @property
+    def skip_ratio(self):
+        total = self.inferred_frames + self.skipped_frames
+        return self.skipped_frames / total if total else 0.0
+
+    def _passed(self, now):
+        self._last_pass = now
+        self.inferred_frames += 1
+        return True
+
+    def _thumbnail(self, image):
+        img_height, img_width = image.shape[:2]
+        size = (self.thumbnail_width, max(1, round(img_height * self.thumbnail_width / img_width)))
+        # Strided subsampling first keeps the area-average resize off the full-resolution frame
+        step = max(1, img_width // (2 * self.thumbnail_width))
+        small = cv2.resize(image[::step, ::step], size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+        small = cv2.GaussianBlur(small, (5, 5), 0)
+        return small.astype(np.float32)
+
+    def _reset(self, gray):
+        self._background = gray.copy()
+        self._mask = None
+        self._mask_area = gray.size
+        if self.regions:
+            height, width = gray.shape
+            mask = np.zeros((height, width), dtype=np.uint8)
+            scale = np.array([width, height], dtype=np.float32)
+            polygons = [np.round(np.asarray(region, dtype=np.float32) * scale).astype(np.int32) for region in self.regions]
+            cv2.fillPoly(mask, polygons, 1)
+            self._mask = mask.astype(bool)
+            self._mask_area = max(1, int(np.count_nonzero(self._mask)))
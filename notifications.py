@@ -0,0 +1,243 @@
+import json
+import queue
+import threading
+import time
+
+import requests
+
+
+class NotificationDispatcher:
+    """
+    Sends detection notifications from a background thread so the frame path never waits on HTTP.
+
+    notify() only does a cooldown check and a non-blocking put on a bounded queue, under a
+    lock as it is called from every stream's thread. The worker drains the queue,
+    coalesces the events that arrive within coalesce_window seconds into a single
+    message per recipient, and posts it with a pooled requests.Session. When the queue is full new events are dropped and counted.
+    """
+
+    def __init__(self, url, auth_token, cooldown=60.0, coalesce_window=2.0, max_queue=256,
+                 timeout=10, simulate=False, session=None):
+        self.url = url
+        self.auth_token = auth_token
+        self.cooldown = cooldown
+        self.coalesce_window = coalesce_window
+        self.timeout = timeout
+        # Log the payload instead of posting it, used while the function URL is still a placeholder
+        self.simulate = simulate
+
+        self.session = session or requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {auth_token}", "Content-Type": "application/json"})
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.suppressed = 0
+        self.sent = 0
+        self.failed = 0
+
+        self._last_notified = {}
+        # Guards _last_notified and the counters notify() updates
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+        self._thread.start()
+
+    def notify(self, class_name, recipient_email, count=1):
+        """ Queues a detection event without blocking. Returns False if it was suppressed or dropped. """
+        # Called from every stream's thread: the cooldown check and its update are one step, so two
+        # streams never both get past it
+        with self._lock:
+            now = time.monotonic()
+            last = self._last_notified.get(class_name)
+            if last is not None and now - last < self.cooldown:
+                self.suppressed += 1
+                return False
+            try:
+                self._queue.put_nowait((class_name, recipient_email, count, time.time()))
+            except queue.Full:
+                self.dropped += 1
+                return False
+            self._last_notified[class_name] = now
+            self.enqueued += 1
+            return True
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "suppressed": self.suppressed,
+            "sent": self.sent,
+            "failed": self.failed,
+            "queue_depth": self.queue_depth,
+        }
+
+    def close(self, timeout=None):
+        """ Flushes what is queued and stops the worker. """
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None, True
+        events = [first]
+        deadline = time.monotonic() + self.coalesce_window
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                event = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                return events, False
+            if event is None:
+                return events, True
+            events.append(event)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            events, stop = self._collect()
+            if not events:
+                continue
+            by_recipient = {}
+            for class_name, recipient_email, count, timestamp in events:
+                if not recipient_email:
+                    print(f"No notification email configured. Cannot send notification for {class_name}.")
+                    continue
+                counts, first_seen = by_recipient.setdefault(recipient_email, ({}, timestamp))
+                counts[class_name] = counts.get(class_name, 0) + count
+            for recipient_email, (counts, first_seen) in by_recipient.items():
+                self._send(recipient_email, counts, first_seen)
+
+    def _send(self, recipient_email, counts, first_seen):
+        detected = ", ".join(f"{count} x {class_name}" for class_name, count in sorted(counts.items()))
+        subject = f"Object Detection Alert: {', '.join(sorted(counts))}"
+        body = (f"Your application detected {detected} "
+                f"starting at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(first_seen))}.")
+        payload = {"data": {"recipient_email": recipient_email, "subject": subject, "body": body}}
+        if self.simulate:
+            print(f"Note: Email Firebase URL is a placeholder. Simulating send of {json.dumps(payload)}")
+            self.sent += 1
+            return
+        try:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            self.sent += 1
+        except requests.exceptions.RequestException as e:
+            self.failed += 1
+            print(f"Error calling email notification function for {detected}: {e}")
+
+
+class EventUploader:
+    """
+    Uploads detection events to the ingest_detection_events function in batches.
+
+    record() is a non-blocking put on a bounded queue, like NotificationDispatcher.notify().
+    The worker collects events for flush_interval seconds (or until max_batch are waiting)
+    and posts them in one call, so a busy scene costs one function invocation per interval
+    instead of one per detection. The function stores them and sends the emails. A batch
+    that fails to upload is retried with the next one while the queue has room.
+    """
+
+    def __init__(self, url, auth_token, flush_interval=5.0, max_batch=1000, max_queue=10000,
+                 timeout=10, simulate=False, session=None):
+        self.url = url
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.timeout = timeout
+        # Log the batch instead of posting it, used while the function URL is still a placeholder
+        self.simulate = simulate
+
+        self.session = session or requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {auth_token}", "Content-Type": "application/json"})
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.uploaded = 0
+        self.batches = 0
+        self.failed = 0
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="event-uploader", daemon=True)
+        self._thread.start()
+
+    def record(self, class_name, track_id, camera, timestamp=None):
+        """ Queues a detection event without blocking. Returns False if it was dropped. """
+        event = {"class": class_name, "trackId": track_id, "camera": camera,
+                 "timestamp": time.time() if timestamp is None else timestamp}
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "uploaded": self.uploaded,
+            "batches": self.batches,
+            "failed": self.failed,
+            "queue_depth": self.queue_depth,
+        }
+
+    def close(self, timeout=None):
+        """ Uploads what is queued and stops the worker. """
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        pending = []
+        stop = False
+        while not stop or pending:
+            deadline = time.monotonic() + self.flush_interval
+            while not stop and len(pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    event = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if event is None:
+                    stop = True
+                    break
+                pending.append(event)
+            if not pending:
+                continue
+            batch = pending[:self.max_batch]
+            if self._upload(batch):
+                pending = pending[len(batch):]
+            elif stop:
+                self.dropped += len(pending)
+                pending = []
+            else:
+                if len(pending) > self.max_queue:
+                    # Keep retrying the newest events only, so an outage cannot grow memory without bound
+                    self.dropped += len(pending) - self.max_queue
+                    pending = pending[-self.max_queue:]
+                time.sleep(self.flush_interval)
+
+    def _upload(self, events):
+        payload = {"data": {"events": events}}
+        if self.simulate:
+            print(f"Note: Events Firebase URL is a placeholder. Simulating upload of {len(events)} events")
+        else:
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout)
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                self.failed += 1
+                print(f"Error calling event ingestion function with {len(events)} events: {e}")
+                return False
+        self.batches += 1
+        self.uploaded += len(events)
+        return True
@@ -0,0 +1,95 @@
+"""
+Compact per-frame detection records for clients that draw the overlay on their own video.
+
+A record is little-endian binary, laid out so every array starts at an offset aligned
+to its element size and can be read with a typed-array view (see public/overlay.js):
+
+    offset  type            field
+    0       uint8           version (RECORD_VERSION)
+    1       uint8           flags (FLAG_* bits)
+    2       uint16          n, number of detections
+    4       uint32          sequence number of the frame in its stream
+    8       uint16          frame width, pixels
+    10      uint16          frame height, pixels
+    12      uint16          k, number of class counts
+    14      uint16          reserved (0)
+    16      uint32[n]       track id per detection, 0 if untracked
+    ..      uint32[k]       counts (distinct objects seen) of the counted classes
+    ..      int16[n, 4]     boxes x1, y1, x2, y2 in frame pixels
+    ..      uint16[k]       class id of each count
+    ..      uint8[n]        class id per detection
+    ..      uint8[n]        score per detection, quantized to 1/255
+
+That is 16 + 14 n + 6 k bytes: a frame with ten detections and two counts takes 168
+bytes, where the annotated frame it replaces is a full video frame to encode and send.
+"""
+import struct
+
+import numpy as np
+
+RECORD_VERSION = 1
+# The detections were carried forward from an earlier frame (keyframe interval or static scene)
+FLAG_REUSED = 1
+# The model is still loading; the record has no detections
+FLAG_LOADING = 2
+
+_HEADER = struct.Struct("<BBHIHHHH")
+HEADER_SIZE = _HEADER.size
+
+
+def record_size(detections, counts=0):
+    return HEADER_SIZE + 14 * detections + 6 * counts
+
+
+def encode_detections(sequence, frame_width, frame_height, boxes, scores, class_ids, track_ids=None,
+                      counts=None, flags=0):
+    """
+    The record of one frame's detections. track_ids may be None (all untracked); counts is
+    a {class id: count} dict. Boxes are rounded and clamped to int16, scores to 1/255.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    n = boxes.shape[0]
+    counts = counts or {}
+    k = len(counts)
+    out = bytearray(record_size(n, k))
+    _HEADER.pack_into(out, 0, RECORD_VERSION, flags, n, sequence & 0xFFFFFFFF,
+                      min(frame_width, 0xFFFF), min(frame_height, 0xFFFF), k, 0)
+
+    def column(offset, dtype, values, count):
+        view = np.frombuffer(out, dtype=dtype, count=count, offset=offset)
+        view[...] = values
+        return offset + view.nbytes
+
+    offset = HEADER_SIZE
+    offset = column(offset, "<u4", 0 if track_ids is None else np.asarray(track_ids).reshape(-1), n)
+    offset = column(offset, "<u4", np.minimum(np.fromiter(counts.values(), dtype=np.int64, count=k), 0xFFFFFFFF), k)
+    offset = column(offset, "<i2", np.clip(np.rint(boxes), -32768, 32767).reshape(-1), 4 * n)
+    offset = column(offset, "<u2", np.fromiter(counts.keys(), dtype=np.int64, count=k), k)
+    offset = column(offset, "u1", np.asarray(class_ids).reshape(-1), n)
+    column(offset, "u1", np.rint(np.clip(np.asarray(scores, dtype=np.float32).reshape(-1), 0, 1) * 255), n)
+    return bytes(out)
+
+
+def decode_detections(record):
+    """ The fields of a record as a dict of NumPy arrays and ints; raises ValueError if it is malformed. """
+    if len(record) < HEADER_SIZE:
+        raise ValueError("Detection record shorter than its header")
+    version, flags, n, sequence, width, height, k, _ = _HEADER.unpack_from(record, 0)
+    if version != RECORD_VERSION:
+        raise ValueError(f"Unsupported detection record version {version}")
+    if len(record) != record_size(n, k):
+        raise ValueError(f"Detection record of {len(record)} bytes, expected {record_size(n, k)}")
+    fields = {"flags": flags, "sequence": sequence, "width": width, "height": height}
+    offset = HEADER_SIZE
+    for name, dtype, count in (("track_ids", "<u4", n), ("counts", "<u4", k), ("boxes", "<i2", 4 * n),
+                               ("count_class_ids", "<u2", k), ("class_ids", "u1", n), ("scores", "u1", n)):
+        fields[name] = np.frombuffer(record, dtype=dtype, count=count, offset=offset)
+        offset += fields[name].nbytes
+    fields["boxes"] = fields["boxes"].reshape(n, 4)
+    fields["scores"] = fields["scores"] / np.float32(255)
+    return fields
+
+
+def frame_record(record):
+    """ The record prefixed with its uint32 length, for sending records back to back over a byte stream. """
+    return struct.pack("<I", len(record)) + record
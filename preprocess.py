@@ -0,0 +1,96 @@
+import threading
+
+import cv2
+import numpy as np
+
+# Index of the R, G and B planes for each supported frame channel order
+CHANNEL_INDICES = {
+    "RGB": (0, 1, 2),
+    "BGR": (2, 1, 0),
+}
+
+
+class Preprocessor:
+    """
+    Turns uint8 HWC frames into the normalized NCHW float32 tensor the model expects.
+
+    The resized frame and the output tensor are allocated once per thread and reused,
+    so a frame costs one resize plus one fused scale-and-cast pass per channel, and
+    concurrent callers never share a buffer. The channel order of the incoming frame
+    is handled by picking the source plane for each output channel, so no color
+    conversion is needed.
+    """
+
+    def __init__(self, input_width, input_height, letterbox=False, pad_value=114):
+        self.input_width = input_width
+        self.input_height = input_height
+        self.letterbox = letterbox
+        self.pad_value = pad_value
+
+        self._norm = np.float32(1.0 / 255.0)
+        self._local = threading.local()
+        self._geometry_cache = {}
+
+    def geometry_for(self, img_width, img_height):
+        """
+        Returns (scale_x, scale_y, pad_x, pad_y, resized_width, resized_height) mapping frame
+        pixels to model input pixels: input = frame * scale + pad.
+        """
+        key = (img_width, img_height)
+        geometry = self._geometry_cache.get(key)
+        if geometry is None:
+            if self.letterbox:
+                scale = min(self.input_width / img_width, self.input_height / img_height)
+                resized_width = max(1, int(round(img_width * scale)))
+                resized_height = max(1, int(round(img_height * scale)))
+                pad_x = (self.input_width - resized_width) // 2
+                pad_y = (self.input_height - resized_height) // 2
+                geometry = (scale, scale, pad_x, pad_y, resized_width, resized_height)
+            else:
+                geometry = (self.input_width / img_width, self.input_height / img_height,
+                            0, 0, self.input_width, self.input_height)
+            self._geometry_cache[key] = geometry
+        return geometry
+
+    def __call__(self, image, channel_order="BGR", out=None):
+        """
+        Writes the preprocessed frame into `out` (shape (3, H, W) or (1, 3, H, W)), or into
+        the calling thread's internal tensor when `out` is None, and returns (tensor, geometry).
+        """
+        try:
+            src_channels = CHANNEL_INDICES[channel_order]
+        except KeyError:
+            raise ValueError(f"Unsupported channel order '{channel_order}', expected one of {list(CHANNEL_INDICES)}")
+
+        img_height, img_width = image.shape[:2]
+        geometry = self.geometry_for(img_width, img_height)
+        scale_x, scale_y, pad_x, pad_y, resized_width, resized_height = geometry
+
+        local = self._local
+        tensor = out
+        if tensor is None:
+            if getattr(local, "tensor", None) is None:
+                local.tensor = np.empty((1, 3, self.input_height, self.input_width), dtype=np.float32)
+            tensor = local.tensor
+        planes = tensor.reshape(3, self.input_height, self.input_width)
+
+        if (img_width, img_height) == (resized_width, resized_height):
+            resized = image
+        else:
+            if getattr(local, "resized", None) is None or local.resized.shape[:2] != (resized_height, resized_width):
+                local.resized = np.empty((resized_height, resized_width, 3), dtype=np.uint8)
+            resized = cv2.resize(image, (resized_width, resized_height), dst=local.resized,
+                                 interpolation=cv2.INTER_LINEAR)
+
+        if self.letterbox:
+            # Only the border strips are written, the resized frame covers the rest
+            pad = self.pad_value / 255.0
+            planes[:, :pad_y, :] = pad
+            planes[:, pad_y + resized_height:, :] = pad
+            planes[:, pad_y:pad_y + resized_height, :pad_x] = pad
+            planes[:, pad_y:pad_y + resized_height, pad_x + resized_width:] = pad
+
+        region = planes[:, pad_y:pad_y + resized_height, pad_x:pad_x + resized_width]
+        for dst_channel, src_channel in enumerate(src_channels):
+            np.multiply(resized[:, :, src_channel], self._norm, out=region[dst_channel], casting="unsafe")
+        return tensor, geometry
@@ -0,0 +1,197 @@
+// Detections-only client: sends the camera to the detection server over WebRTC and draws
+// the detections from the binary records it streams back (overlay.py) over the local video.
+// The server address defaults to this page's origin; set another with ?server=https://host,
+// and the camera name with ?camera=front-door.
+
+const HEADER_SIZE = 16;
+const FLAG_REUSED = 1;
+const FLAG_LOADING = 2;
+
+const params = new URLSearchParams(typeof location === "undefined" ? "" : location.search);
+const server = (params.get("server") || "").replace(/\/$/, "");
+
+// Page elements; absent when the module is imported outside a browser, e.g. to test decodeRecord
+const page = typeof document === "undefined" ? null : document;
+const video = page && page.getElementById("video");
+const canvas = page && page.getElementById("overlay");
+const status = page && page.getElementById("status");
+const slider = page && page.getElementById("conf");
+// Zones of the Settings tab apply by this name, which stays the same across connections
+const cameraInput = page && page.getElementById("camera");
+if (cameraInput) cameraInput.value = params.get("camera") || "";
+const context2d = canvas && canvas.getContext("2d");
+
+let classNames = [];
+let latest = null;
+let webrtcId = null;
+let bytesReceived = 0;
+let recordsReceived = 0;
+
+// Decodes one record (an ArrayBuffer holding exactly one record) into typed-array views
+export function decodeRecord(buffer) {
+  const view = new DataView(buffer);
+  const version = view.getUint8(0);
+  if (version !== 1) throw new Error(`Unsupported detection record version ${version}`);
+  const n = view.getUint16(2, true);
+  const k = view.getUint16(12, true);
+  if (buffer.byteLength !== HEADER_SIZE + 14 * n + 6 * k) throw new Error("Malformed detection record");
+  let offset = HEADER_SIZE;
+  const take = (ArrayType, count) => {
+    const array = new ArrayType(buffer, offset, count);
+    offset += array.byteLength;
+    return array;
+  };
+  return {
+    flags: view.getUint8(1),
+    sequence: view.getUint32(4, true),
+    width: view.getUint16(8, true),
+    height: view.getUint16(10, true),
+    count: n,
+    trackIds: take(Uint32Array, n),
+    counts: take(Uint32Array, k),
+    boxes: take(Int16Array, 4 * n),
+    countClassIds: take(Uint16Array, k),
+    classIds: take(Uint8Array, n),
+    scores: take(Uint8Array, n),
+  };
+}
+
+// Splits a byte stream of uint32-length-prefixed records; calls onRecord with each record's own ArrayBuffer
+export async function readRecords(body, onRecord) {
+  const reader = body.getReader();
+  let pending = new Uint8Array(0);
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) return;
+    bytesReceived += value.byteLength;
+    const joined = new Uint8Array(pending.byteLength + value.byteLength);
+    joined.set(pending);
+    joined.set(value, pending.byteLength);
+    let offset = 0;
+    while (joined.byteLength - offset >= 4) {
+      const length = new DataView(joined.buffer, offset, 4).getUint32(0, true);
+      if (joined.byteLength - offset - 4 < length) break;
+      // A copy starts at offset 0, so the typed-array views of the record are aligned
+      onRecord(joined.slice(offset + 4, offset + 4 + length).buffer);
+      offset += 4 + length;
+    }
+    pending = joined.slice(offset);
+  }
+}
+
+function classColor(classId) {
+  return `hsl(${(classId * 47) % 360}, 90%, 50%)`;
+}
+
+function draw() {
+  const width = video.clientWidth;
+  const height = video.clientHeight;
+  if (canvas.width !== width || canvas.height !== height) {
+    canvas.width = width;
+    canvas.height = height;
+  }
+  context2d.clearRect(0, 0, width, height);
+  if (latest && latest.width && latest.height) {
+    // The video element letterboxes the camera frame; map frame pixels into the shown area
+    const scale = Math.min(width / latest.width, height / latest.height);
+    const left = (width - latest.width * scale) / 2;
+    const top = (height - latest.height * scale) / 2;
+    context2d.lineWidth = 2;
+    context2d.font = "13px sans-serif";
+    context2d.globalAlpha = latest.flags & FLAG_REUSED ? 0.7 : 1.0;
+    for (let i = 0; i < latest.count; i++) {
+      const x1 = left + latest.boxes[4 * i] * scale;
+      const y1 = top + latest.boxes[4 * i + 1] * scale;
+      const x2 = left + latest.boxes[4 * i + 2] * scale;
+      const y2 = top + latest.boxes[4 * i + 3] * scale;
+      const classId = latest.classIds[i];
+      const track = latest.trackIds[i] ? ` #${latest.trackIds[i]}` : "";
+      const label = `${classNames[classId] || classId} ${Math.round(latest.scores[i] / 2.55)}%${track}`;
+      context2d.strokeStyle = context2d.fillStyle = classColor(classId);
+      context2d.strokeRect(x1, y1, x2 - x1, y2 - y1);
+      const labelWidth = context2d.measureText(label).width + 6;
+      context2d.fillRect(x1, Math.max(0, y1 - 18), labelWidth, 18);
+      context2d.fillStyle = "#fff";
+      context2d.fillText(label, x1 + 3, Math.max(13, y1 - 5));
+    }
+    context2d.globalAlpha = 1.0;
+    context2d.fillStyle = "#0f0";
+    context2d.font = "16px sans-serif";
+    for (let i = 0; i < latest.counts.length; i++) {
+      const name = classNames[latest.countClassIds[i]] || latest.countClassIds[i];
+      context2d.fillText(`${name}: ${latest.counts[i]}`, 10, 24 + 20 * i);
+    }
+  }
+  requestAnimationFrame(draw);
+}
+
+async function sendInput() {
+  if (!webrtcId) return;
+  await fetch(`${server}/detections/input`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ webrtc_id: webrtcId, conf_threshold: Number(slider.value), camera: cameraInput.value.trim() }),
+  });
+}
+
+function reportStatus(started) {
+  const seconds = (performance.now() - started) / 1000;
+  const loading = latest && latest.flags & FLAG_LOADING ? ", model loading" : "";
+  status.textContent = `${recordsReceived} records, ${(bytesReceived / seconds / 1024).toFixed(1)} KiB/s ` +
+    `(${recordsReceived ? Math.round(bytesReceived / recordsReceived) : 0} B/record)${loading}`;
+}
+
+async function start() {
+  classNames = await (await fetch(`${server}/detections/classes`)).json();
+  const camera = await navigator.mediaDevices.getUserMedia({ video: true, audio: false });
+  video.srcObject = camera;
+
+  const pc = new RTCPeerConnection({ iceServers: [{ urls: "stun:stun.l.google.com:19302" }] });
+  camera.getTracks().forEach((track) => pc.addTrack(track, camera));
+  // The server only processes frames once the connection has a data channel
+  const channel = pc.createDataChannel("text");
+  channel.onmessage = (event) => {
+    const message = JSON.parse(event.data);
+    if (message.type === "send_input") sendInput();
+  };
+
+  await pc.setLocalDescription(await pc.createOffer());
+  await new Promise((resolve) => {
+    if (pc.iceGatheringState === "complete") return resolve();
+    pc.addEventListener("icegatheringstatechange", () => pc.iceGatheringState === "complete" && resolve());
+  });
+  webrtcId = Math.random().toString(36).slice(2);
+  const answer = await (await fetch(`${server}/webrtc/offer`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ sdp: pc.localDescription.sdp, type: pc.localDescription.type, webrtc_id: webrtcId }),
+  })).json();
+  if (answer.status === "failed") throw new Error(answer.meta.error);
+  await pc.setRemoteDescription(answer);
+  await sendInput();
+  slider.addEventListener("change", sendInput);
+  cameraInput.addEventListener("change", sendInput);
+
+  const response = await fetch(`${server}/detections/records?webrtc_id=${webrtcId}`);
+  if (!response.ok) throw new Error(`Record stream failed: ${response.status}`);
+  const started = performance.now();
+  setInterval(() => reportStatus(started), 1000);
+  requestAnimationFrame(draw);
+  await readRecords(response.body, (buffer) => {
+    const record = decodeRecord(buffer);
+    // Records can only arrive in order on one stream; keep the newest
+    if (!latest || record.sequence >= latest.sequence) latest = record;
+    recordsReceived++;
+  });
+  status.textContent = "Stream ended";
+}
+
+if (video) {
+  document.getElementById("start").addEventListener("click", (event) => {
+    event.target.disabled = true;
+    start().catch((error) => {
+      status.textContent = `Error: ${error.message}`;
+      event.target.disabled = false;
+    });
+  });
+}
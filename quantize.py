@@ -0,0 +1,311 @@
+"""
+INT8 variants of the detector and a report comparing them against fp32.
+
+Usage:
+    python quantize.py dynamic MODEL.onnx [--output PATH]
+    python quantize.py static MODEL.onnx --calibration-dir frames/ [--max-frames 200] [--output PATH]
+    python quantize.py compare MODEL.onnx VARIANT.onnx [VARIANT.onnx ...] --frames frames/ [--report report.json]
+
+Variants are written to YOLO_VARIANT_DIR (default ~/.cache/fastrtc-object-detect/variants) under
+a name derived from the source model's content, which is where the app looks for them when
+YOLO_PRECISION is int8-dynamic or int8-static. Frame folders hold .jpg/.png images from the camera
+the model will serve; calibration and comparison should use frames like the ones it will see.
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from inference import YOLOv10
+from tracker import iou_matrix
+
+PRECISIONS = ("fp32", "int8-dynamic", "int8-static")
+DEFAULT_VARIANT_DIR = os.environ.get(
+    "YOLO_VARIANT_DIR", os.path.join(os.path.expanduser("~"), ".cache", "fastrtc-object-detect", "variants"))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+CALIBRATION_METHODS = ("minmax", "percentile", "entropy")
+# Only the compute-heavy ops are quantized. The detection head's box/score concat and the
+# end-to-end postprocessing stay fp32, where a shared INT8 range would flatten the scores.
+QUANTIZED_OP_TYPES = ["Conv", "MatMul"]
+
+
+def variant_path(model_path, precision, directory=DEFAULT_VARIANT_DIR):
+    """ Where the given precision of a model lives; fp32 is the model itself. """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {PRECISIONS}.")
+    if precision == "fp32":
+        return model_path
+    with open(model_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(directory, f"{stem}-{digest}.{precision}.onnx")
+
+
+def list_frames(directory, max_frames=None):
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                   if name.lower().endswith(IMAGE_EXTENSIONS))
+    if not paths:
+        raise FileNotFoundError(f"No {'/'.join(IMAGE_EXTENSIONS)} frames in {directory}")
+    if max_frames and len(paths) > max_frames:
+        # Spread the sample over the whole folder rather than taking the first frames of a sequence
+        paths = [paths[i] for i in np.linspace(0, len(paths) - 1, max_frames).astype(int)]
+    return paths
+
+
+def load_frames(directory, max_frames=None):
+    """ BGR frames, as cv2.imread returns them. """
+    return [cv2.imread(path) for path in list_frames(directory, max_frames)]
+
+
+def _calibration_reader_class():
+    from onnxruntime.quantization import CalibrationDataReader
+
+    class FrameCalibrationReader(CalibrationDataReader):
+        """ Feeds frames from a folder through the app's own preprocessing to the calibrator. """
+
+        def __init__(self, input_name, preprocessor, paths):
+            self.input_name = input_name
+            self.preprocessor = preprocessor
+            self.paths = paths
+            self.index = 0
+
+        def get_next(self):
+            if self.index >= len(self.paths):
+                return None
+            frame = cv2.imread(self.paths[self.index])
+            self.index += 1
+            tensor, _ = self.preprocessor(frame, "BGR")
+            # The preprocessor reuses its output buffer, the calibrator may keep the tensor
+            return {self.input_name: tensor.copy()}
+
+        def rewind(self):
+            self.index = 0
+
+    return FrameCalibrationReader
+
+
+def quantize_dynamic_model(model_path, output_path=None):
+    """ Weights to INT8 ahead of time, activations quantized per inference. Needs no calibration data. """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    output_path = output_path or variant_path(model_path, "int8-dynamic")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    # ConvInteger, which dynamically quantized convolutions run as on CPU, takes unsigned weights
+    quantize_dynamic(model_path, output_path, weight_type=QuantType.QUInt8, op_types_to_quantize=QUANTIZED_OP_TYPES)
+    return output_path
+
+
+def quantize_static_model(model_path, calibration_dir, output_path=None, max_frames=200, letterbox=False,
+                          per_channel=True, method="minmax"):
+    """ Weights and activations to INT8 (QDQ format), with activation ranges calibrated on local frames. """
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    if method not in CALIBRATION_METHODS:
+        raise ValueError(f"Unknown calibration method {method!r}, expected one of {CALIBRATION_METHODS}.")
+    output_path = output_path or variant_path(model_path, "int8-static")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+    detector = YOLOv10(model_path, letterbox=letterbox)
+    reader = _calibration_reader_class()(detector.input_name, detector.preprocessor,
+                                         list_frames(calibration_dir, max_frames))
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Shape inference and graph cleanup first, as the quantizer expects
+        prepared_path = os.path.join(work_dir, "prepared.onnx")
+        quant_pre_process(model_path, prepared_path)
+        quantize_static(
+            prepared_path, output_path, reader,
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=per_channel,
+            op_types_to_quantize=QUANTIZED_OP_TYPES,
+            calibrate_method={"minmax": CalibrationMethod.MinMax, "percentile": CalibrationMethod.Percentile,
+                              "entropy": CalibrationMethod.Entropy}[method],
+        )
+    return output_path
+
+
+def match_frame(reference, candidate, iou_threshold):
+    """
+    Matches one frame's candidate detections to the reference ones, class by class, in
+    descending candidate score. Returns (true_positive flags in candidate order, IoUs of the matches).
+    """
+    ref_boxes, _, ref_classes = reference
+    boxes, scores, classes = candidate
+    true_positive = np.zeros(len(scores), dtype=bool)
+    matched_iou = []
+    if not len(scores) or not len(ref_classes):
+        return true_positive, matched_iou
+    iou = iou_matrix(np.asarray(boxes, dtype=np.float32), np.asarray(ref_boxes, dtype=np.float32))
+    iou[np.asarray(classes)[:, None] != np.asarray(ref_classes)[None, :]] = 0
+    taken = np.zeros(len(ref_classes), dtype=bool)
+    for i in np.argsort(-np.asarray(scores), kind="stable"):
+        overlaps = np.where(taken, 0, iou[i])
+        j = int(np.argmax(overlaps))
+        if overlaps[j] >= iou_threshold:
+            taken[j] = True
+            true_positive[i] = True
+            matched_iou.append(float(overlaps[j]))
+    return true_positive, matched_iou
+
+
+def average_precision(true_positive, scores, num_reference):
+    """ Area under the precision/recall curve with all-point interpolation (VOC2010 and later). """
+    if num_reference == 0:
+        return None
+    if not len(scores):
+        return 0.0
+    order = np.argsort(-np.asarray(scores), kind="stable")
+    hits = np.cumsum(true_positive[order])
+    recall = hits / num_reference
+    precision = hits / np.arange(1, len(order) + 1)
+    recall = np.concatenate(([0.0], recall, [1.0]))
+    precision = np.concatenate(([1.0], precision, [0.0]))
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    return float(np.sum((recall[1:] - recall[:-1]) * precision[1:]))
+
+
+def agreement(reference_detections, candidate_detections, iou_threshold=0.5):
+    """ How closely a variant reproduces the reference detections, with the reference taken as ground truth. """
+    per_class = {}
+    all_iou = []
+    for reference, candidate in zip(reference_detections, candidate_detections):
+        true_positive, matched_iou = match_frame(reference, candidate, iou_threshold)
+        all_iou += matched_iou
+        for class_id in set(np.asarray(reference[2]).tolist()) | set(np.asarray(candidate[2]).tolist()):
+            entry = per_class.setdefault(class_id, {"tp": [], "scores": [], "references": 0})
+            selected = np.asarray(candidate[2]) == class_id
+            entry["tp"].append(true_positive[selected])
+            entry["scores"].append(np.asarray(candidate[1])[selected])
+            entry["references"] += int(np.count_nonzero(np.asarray(reference[2]) == class_id))
+
+    ap = {}
+    for class_id, entry in per_class.items():
+        value = average_precision(np.concatenate(entry["tp"]), np.concatenate(entry["scores"]), entry["references"])
+        if value is not None:
+            ap[class_id] = value
+    true_positives = sum(int(np.count_nonzero(np.concatenate(e["tp"]))) for e in per_class.values())
+    predictions = sum(len(np.concatenate(e["tp"])) for e in per_class.values())
+    references = sum(e["references"] for e in per_class.values())
+    return {
+        # Mean AP over classes at iou_threshold (mAP50 at the default 0.5)
+        "map": round(float(np.mean(list(ap.values()))), 4) if ap else None,
+        "precision": round(true_positives / predictions, 4) if predictions else None,
+        "recall": round(true_positives / references, 4) if references else None,
+        "mean_iou": round(float(np.mean(all_iou)), 4) if all_iou else None,
+    }
+
+
+def benchmark_variant(model_path, frames, conf_threshold=0.3, letterbox=False, warmup=3, batch_size=8):
+    """ Latency, throughput and detections of one model over the frames. """
+    detector = YOLOv10(model_path, letterbox=letterbox)
+    for frame in frames[:warmup]:
+        detector.detect_objects(frame, conf_threshold)
+
+    detections, latencies = [], []
+    for frame in frames:
+        start = time.perf_counter()
+        boxes, scores, class_ids = detector.detect_objects(frame, conf_threshold)
+        latencies.append((time.perf_counter() - start) * 1000)
+        detections.append((boxes.copy(), scores.copy(), class_ids.copy()))
+
+    result = {
+        "path": model_path,
+        "size_mb": round(os.path.getsize(model_path) / 2**20, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "fps": round(1000 * len(frames) / float(np.sum(latencies)), 2),
+        "detections_per_frame": round(float(np.mean([len(d[1]) for d in detections])), 2),
+    }
+    if detector.supports_batching and len(frames) >= batch_size:
+        start = time.perf_counter()
+        batches = range(0, len(frames) - batch_size + 1, batch_size)
+        for i in batches:
+            detector.detect_objects_batch(frames[i:i + batch_size], conf_threshold)
+        result["batch_fps"] = round(len(batches) * batch_size / (time.perf_counter() - start), 2)
+    return result, detections
+
+
+def compare_models(model_paths, frames, conf_threshold=0.3, iou_threshold=0.5, letterbox=False):
+    """
+    Runs every model over the same frames and reports each one's latency, throughput and
+    detection agreement with the first model, the reference (normally the fp32 export).
+    """
+    report = {"frames": len(frames), "conf_threshold": conf_threshold, "iou_threshold": iou_threshold, "variants": {}}
+    reference_detections = None
+    for name, path in model_paths.items():
+        result, detections = benchmark_variant(path, frames, conf_threshold, letterbox)
+        if reference_detections is None:
+            reference_detections = detections
+            report["reference"] = name
+        else:
+            result["agreement"] = agreement(reference_detections, detections, iou_threshold)
+        report["variants"][name] = result
+    return report
+
+
+def _variant_name(path):
+    for precision in PRECISIONS[1:]:
+        if path.endswith(f".{precision}.onnx"):
+            return precision
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    dynamic = commands.add_parser("dynamic", help="Dynamic INT8 quantization")
+    dynamic.add_argument("model")
+    dynamic.add_argument("--output")
+
+    static = commands.add_parser("static", help="Static INT8 quantization calibrated on a folder of frames")
+    static.add_argument("model")
+    static.add_argument("--calibration-dir", required=True)
+    static.add_argument("--max-frames", type=int, default=200)
+    static.add_argument("--method", choices=CALIBRATION_METHODS, default="minmax")
+    static.add_argument("--per-tensor", action="store_true", help="One weight scale per tensor instead of per channel")
+    static.add_argument("--letterbox", action="store_true", help="Calibrate on letterboxed frames (YOLO_LETTERBOX=1)")
+    static.add_argument("--output")
+
+    compare = commands.add_parser("compare", help="Latency, throughput and agreement against the first model")
+    compare.add_argument("models", nargs="+", help="Reference (fp32) model first, then the variants")
+    compare.add_argument("--frames", required=True, help="Folder of frames")
+    compare.add_argument("--max-frames", type=int, default=200)
+    compare.add_argument("--conf", type=float, default=0.3)
+    compare.add_argument("--iou", type=float, default=0.5)
+    compare.add_argument("--letterbox", action="store_true")
+    compare.add_argument("--report", help="Write the report as JSON to this path")
+
+    args = parser.parse_args()
+    if args.command == "dynamic":
+        print(quantize_dynamic_model(args.model, args.output))
+    elif args.command == "static":
+        print(quantize_static_model(args.model, args.calibration_dir, args.output, args.max_frames, args.letterbox,
+                                    per_channel=not args.per_tensor, method=args.method))
+    else:
+        frames = load_frames(args.frames, args.max_frames)
+        names = {}
+        for path in args.models:
+            name = _variant_name(path)
+            names[name if name not in names else f"{name}#{len(names)}"] = path
+        report = compare_models(names, frames, args.conf, args.iou, args.letterbox)
+        for name, result in report["variants"].items():
+            summary = ", ".join(f"{key} {value}" for key, value in result.get("agreement", {}).items())
+            print(f"{name:16s} {result['size_mb']:7.2f} MB  p50 {result['p50_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms  "
+                  f"{result['fps']:7.1f} fps  batch {result.get('batch_fps', '-')} fps  "
+                  f"{result['detections_per_frame']} det/frame  {summary}")
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+class _Clip:
+    """ A clip being assembled: its time span, the JPEG frames so far and the triggers merged into it. """
+
+    def __init__(self, stream_id, start, end, frames):
+        self.stream_id = stream_id
+        self.start = start
+        self.end = end
+        self.frames = list(frames)
+        self.bytes = sum(len(data) for _, data in self.frames)
+        self.triggers = []
+        self.truncated = False
+
+
+class _Ring:
+    """ Pre-roll buffer of one stream: (timestamp, JPEG bytes) pairs, oldest first. """
+
+    def __init__(self):
+        self.frames = deque()
+        self.bytes = 0
+        self.clip = None
+        self.last_frame = 0.0
+
+
+class ClipRecorder:
+    """
+    Records clips with pre- and post-roll around recordOnDetect triggers.
+
+    add_frame() samples each stream at up to fps frames per second, downscales the frame
+    by scale and queues it; that is all the frame path pays. An encoder thread
+    JPEG-compresses queued frames into a per-stream ring holding the last pre_roll
+    seconds, at most max_stream_bytes of compressed frames per stream (ring plus clip
+    being assembled). A trigger starts a clip from the ring contents and keeps it open
+    until post_roll seconds after the latest trigger, so triggers that overlap are merged
+    into one clip of at most max_clip_seconds. Finished clips are written to output_dir
+    as video plus a JSON sidecar by a writer thread, which then deletes clips older than
+    retention seconds and the oldest ones beyond max_disk_bytes. When the encoder falls
+    max_backlog frames behind, new frames are dropped and counted.
+
+    Clips also end, and idle streams are released, by clock() (wall time by default).
+    Frames stamped with another timeline, e.g. positions in a video file, need a clock
+    on that timeline, or one that never advances (lambda: 0.0) together with end_stream().
+    """
+
+    def __init__(self, output_dir, pre_roll=5.0, post_roll=5.0, fps=10.0, scale=0.5, jpeg_quality=80,
+                 max_stream_bytes=32 * 2**20, max_clip_seconds=120.0, max_backlog=64,
+                 retention=72 * 3600.0, max_disk_bytes=2 * 2**30, idle_timeout=60.0, clock=time.time):
+        self.output_dir = output_dir
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.fps = fps
+        self.scale = scale
+        self.jpeg_quality = jpeg_quality
+        self.max_stream_bytes = max_stream_bytes
+        self.max_clip_seconds = max_clip_seconds
+        self.max_backlog = max_backlog
+        self.retention = retention
+        self.max_disk_bytes = max_disk_bytes
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+
+        self.frames_buffered = 0
+        self.frames_dropped = 0
+        self.frames_evicted = 0
+        self.triggers = 0
+        self.triggers_merged = 0
+        self.clips_written = 0
+        self.clips_truncated = 0
+        self.clips_failed = 0
+
+        # Frame path only: when each stream was last sampled
+        self._last_sample = {}
+        # Encoder thread only
+        self._rings = {}
+        self._buffer_bytes = 0
+        self._queue = queue.Queue()
+        self._finished = queue.Queue()
+        self._closed = False
+        self._encoder = threading.Thread(target=self._run_encoder, name="clip-encoder", daemon=True)
+        self._writer = threading.Thread(target=self._run_writer, name="clip-writer", daemon=True)
+        self._encoder.start()
+        self._writer.start()
+
+    def add_frame(self, stream_id, image, image_order="RGB", timestamp=None):
+        """ Offers a frame to the stream's buffer without blocking. Returns whether it was taken. """
+        timestamp = time.time() if timestamp is None else timestamp
+        last = self._last_sample.get(stream_id)
+        if last is not None and timestamp - last < 1.0 / self.fps:
+            return False
+        if self._closed or self._queue.qsize() >= self.max_backlog:
+            self.frames_dropped += 1
+            return False
+        self._last_sample[stream_id] = timestamp
+        if self.scale != 1.0:
+            frame = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        else:
+            frame = image.copy()
+        self._queue.put(("frame", stream_id, timestamp, (frame, image_order)))
+        return True
+
+    def trigger(self, stream_id, reason, timestamp=None):
+        """ Requests a clip of stream_id around timestamp (default now); reason is stored with it. """
+        if not self._closed:
+            self._queue.put(("trigger", stream_id, time.time() if timestamp is None else timestamp, reason))
+
+    def end_stream(self, stream_id):
+        """ Ends the stream's open clip at the frames buffered so far and releases its buffer. """
+        if not self._closed:
+            self._queue.put(("end", stream_id, None, None))
+
+    @property
+    def backlog(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "backlog": self.backlog,
+            "clips_pending": self._finished.qsize(),
+            "buffer_bytes": self._buffer_bytes,
+            "frames_buffered": self.frames_buffered,
+            "frames_dropped": self.frames_dropped,
+            "frames_evicted": self.frames_evicted,
+            "triggers": self.triggers,
+            "triggers_merged": self.triggers_merged,
+            "clips_written": self.clips_written,
+            "clips_truncated": self.clips_truncated,
+            "clips_failed": self.clips_failed,
+        }
+
+    def close(self):
+        """ Ends open clips at the frames buffered so far, writes them and stops both threads. """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._encoder.join()
+            self._writer.join()
+
+    def _run_encoder(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                kind, stream_id, timestamp, payload = item
+                if kind == "frame":
+                    self._on_frame(stream_id, timestamp, *payload)
+                elif kind == "trigger":
+                    self._on_trigger(stream_id, timestamp, payload)
+                else:
+                    self._release(stream_id)
+            self._finish_due(self.clock())
+        self._finish_due(float("inf"))
+        self._finished.put(None)
+
+    def _ring(self, stream_id):
+        ring = self._rings.get(stream_id)
+        if ring is None:
+            ring = self._rings[stream_id] = _Ring()
+        return ring
+
+    def _on_frame(self, stream_id, timestamp, frame, image_order):
+        if image_order == "RGB":
+            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            self.frames_dropped += 1
+            return
+        data = encoded.tobytes()
+        ring = self._ring(stream_id)
+        if ring.clip is not None and timestamp > ring.clip.end:
+            self._finish(ring)
+        ring.frames.append((timestamp, data))
+        ring.bytes += len(data)
+        ring.last_frame = timestamp
+        self._buffer_bytes += len(data)
+        self.frames_buffered += 1
+
+        clip = ring.clip
+        if clip is not None:
+            clip.frames.append((timestamp, data))
+            clip.bytes += len(data)
+        while ring.frames and ring.frames[0][0] < timestamp - self.pre_roll:
+            self._evict(ring)
+        while ring.frames and ring.bytes + (clip.bytes if clip else 0) > self.max_stream_bytes:
+            if clip is not None:
+                # Out of memory for this stream: end the clip here rather than lose its start
+                clip.truncated = True
+                self._finish(ring)
+                clip = None
+                continue
+            self._evict(ring)
+            self.frames_evicted += 1
+
+    def _evict(self, ring):
+        _, data = ring.frames.popleft()
+        ring.bytes -= len(data)
+        self._buffer_bytes -= len(data)
+
+    def _on_trigger(self, stream_id, timestamp, reason):
+        self.triggers += 1
+        ring = self._ring(stream_id)
+        clip = ring.clip
+        if clip is not None and timestamp > clip.end:
+            self._finish(ring)
+            clip = None
+        if clip is not None:
+            self.triggers_merged += 1
+            clip.end = max(clip.end, min(timestamp + self.post_roll, clip.start + self.max_clip_seconds))
+        else:
+            start = timestamp - self.pre_roll
+            clip = ring.clip = _Clip(stream_id, start, timestamp + self.post_roll,
+                                     (frame for frame in ring.frames if frame[0] >= start))
+        clip.triggers.append((timestamp, reason))
+
+    def _finish(self, ring):
+        clip, ring.clip = ring.clip, None
+        self._finished.put(clip)
+
+    def _finish_due(self, now):
+        for stream_id, ring in list(self._rings.items()):
+            if ring.clip is not None and now > ring.clip.end:
+                self._finish(ring)
+            if ring.clip is None and now - ring.last_frame > self.idle_timeout:
+                # The stream went away: release its pre-roll buffer
+                self._release(stream_id)
+
+    def _release(self, stream_id):
+        ring = self._rings.pop(stream_id, None)
+        if ring is not None:
+            if ring.clip is not None:
+                self._finish(ring)
+            self._buffer_bytes -= ring.bytes
+
+    def _run_writer(self):
+        while True:
+            clip = self._finished.get()
+            if clip is None:
+                return
+            if not clip.frames:
+                continue
+            try:
+                self._write(clip)
+                self.clips_written += 1
+                self.clips_truncated += clip.truncated
+            except Exception as e:
+                self.clips_failed += 1
+                print(f"Writing clip of stream {clip.stream_id} failed: {e}")
+            self._apply_retention()
+
+    def _write(self, clip):
+        os.makedirs(self.output_dir, exist_ok=True)
+        first_time = clip.frames[0][0]
+        stream = re.sub(r"[^A-Za-z0-9_.-]", "_", str(clip.stream_id))
+        name = f"{stream}_{time.strftime('%Y%m%d-%H%M%S', time.localtime(first_time))}_{int(first_time * 1000) % 1000:03d}"
+        first = cv2.imdecode(np.frombuffer(clip.frames[0][1], dtype=np.uint8), cv2.IMREAD_COLOR)
+        height, width = first.shape[:2]
+        duration = clip.frames[-1][0] - first_time
+        # Frames are sampled at up to fps; play them back at the rate they were actually taken
+        fps = min(self.fps, max(1.0, (len(clip.frames) - 1) / duration)) if duration > 0 else self.fps
+
+        for extension, fourcc in ((".mp4", "mp4v"), (".avi", "MJPG")):
+            temp_path = os.path.join(self.output_dir, f".{name}{extension}")
+            writer = cv2.VideoWriter(temp_path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+            if writer.isOpened():
+                break
+        else:
+            raise RuntimeError("no video codec available")
+        try:
+            for _, data in clip.frames:
+                frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if frame.shape[:2] != (height, width):
+                    frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                writer.write(frame)
+        finally:
+            writer.release()
+        os.replace(temp_path, os.path.join(self.output_dir, name + extension))
+
+        with open(os.path.join(self.output_dir, name + ".json"), "w") as f:
+            json.dump({
+                "stream": str(clip.stream_id),
+                "start": first_time,
+                "end": clip.frames[-1][0],
+                "frames": len(clip.frames),
+                "fps": fps,
+                "truncated": clip.truncated,
+                "triggers": [{"time": timestamp, "reason": reason} for timestamp, reason in clip.triggers],
+            }, f)
+
+    def _apply_retention(self):
+        clips = []
+        for entry in os.scandir(self.output_dir):
+            if entry.name.startswith(".") or not entry.name.endswith((".mp4", ".avi", ".json")):
+                continue
+            stat = entry.stat()
+            clips.append((stat.st_mtime, stat.st_size, entry.path))
+        clips.sort()
+        total = sum(size for _, size, _ in clips)
+        now = time.time()
+        for mtime, size, path in clips:
+            if now - mtime <= self.retention and total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
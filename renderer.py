@@ -0,0 +1,108 @@
+import threading
+
+import cv2
+import numpy as np
+
+import metrics
+from inference import class_names, colors
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+class OverlayRenderer:
+    """
+    Draws detections and count overlays straight into display-sized output frames.
+
+    The frame is resized once into a reused output buffer (converting the color order
+    only if the input differs from the output), boxes are scaled to the output size,
+    and everything is drawn at display resolution. Labels are formatted and measured
+    once per (class, score bucket) and served from a cache afterwards.
+
+    Each thread gets its own small ring of output buffers, so a returned frame stays
+    valid while the caller encodes it, until num_buffers more frames are rendered by
+    the same thread.
+    """
+
+    def __init__(self, output_size=(640, 480), color_order="RGB", num_buffers=3, score_step=0.01):
+        self.output_size = output_size
+        self.color_order = color_order
+        self.num_buffers = num_buffers
+        self.score_step = score_step
+
+        width, height = output_size
+        self.font_size = max(0.4, min(width, height) * 0.001)
+        self.text_thickness = 1
+        self.box_thickness = 2
+        # The palette is defined for BGR drawing, flip it once for RGB output
+        palette = colors if color_order == "BGR" else colors[:, ::-1]
+        self.colors = [tuple(float(c) for c in color) for color in palette]
+        self.count_color = (0, 255, 0)
+
+        self._labels = {}
+        self._local = threading.local()
+
+    def render(self, image, boxes, scores, class_ids, counts=None, image_order="RGB", stream=None):
+        """
+        Returns the display frame with the given frame-space detections and counts drawn on it.
+        stream, if given, labels the stage timings with the stream the frame belongs to.
+        """
+        out = self._next_buffer()
+        width, height = self.output_size
+        labels = {} if stream is None else {"stream": stream}
+        with metrics.stage("resize", **labels):
+            if image.shape[1] == width and image.shape[0] == height:
+                np.copyto(out, image)
+            else:
+                cv2.resize(image, self.output_size, dst=out, interpolation=cv2.INTER_LINEAR)
+        if image_order != self.color_order:
+            with metrics.stage("color_conversion", **labels):
+                cv2.cvtColor(out, cv2.COLOR_BGR2RGB, dst=out)
+
+        with metrics.stage("draw", **labels):
+            self._draw(out, image.shape[1], image.shape[0], boxes, scores, class_ids, counts)
+        return out
+
+    def _draw(self, out, frame_width, frame_height, boxes, scores, class_ids, counts):
+        width, height = self.output_size
+        if len(boxes):
+            scale = np.array([width / frame_width, height / frame_height] * 2, dtype=np.float32)
+            display_boxes = np.rint(np.asarray(boxes, dtype=np.float32) * scale).astype(np.int32).tolist()
+            for (x1, y1, x2, y2), score, class_id in zip(display_boxes, scores, class_ids):
+                class_id = int(class_id)
+                color = self.colors[class_id]
+                cv2.rectangle(out, (x1, y1), (x2, y2), color, self.box_thickness)
+                label, (text_width, text_height) = self._label(class_id, score)
+                text_y = y1 - 5 if y1 - 5 - text_height >= 0 else y1 + text_height + 5
+                cv2.putText(out, label, (x1, text_y), FONT, self.font_size, color, self.text_thickness, cv2.LINE_AA)
+
+        if counts:
+            y_offset = 30
+            for class_name, count in counts.items():
+                cv2.putText(out, f"{class_name}: {count}", (10, y_offset), FONT, 0.8, self.count_color, 2)
+                y_offset += 30
+
+    def blank(self):
+        """ An empty display frame, for when no camera frame is available yet. """
+        out = self._next_buffer()
+        out.fill(0)
+        return out
+
+    def _label(self, class_id, score):
+        bucket = int(round(score / self.score_step))
+        key = (class_id, bucket)
+        cached = self._labels.get(key)
+        if cached is None:
+            label = f"{class_names[class_id]}: {bucket * self.score_step:.2f}"
+            text_size, _ = cv2.getTextSize(label, FONT, self.font_size, self.text_thickness)
+            cached = self._labels[key] = (label, text_size)
+        return cached
+
+    def _next_buffer(self):
+        local = self._local
+        buffers = getattr(local, "buffers", None)
+        if buffers is None:
+            width, height = self.output_size
+            buffers = local.buffers = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(self.num_buffers)]
+            local.index = 0
+        local.index = (local.index + 1) % len(buffers)
+        return buffers[local.index]
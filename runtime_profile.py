@@ -0,0 +1,181 @@
+"""
+ONNX Runtime execution profiles: thread counts, execution mode, graph optimization level
+and CPU memory arena settings for a detector session, plus a tuner that sweeps them.
+
+Usage: python runtime_profile.py MODEL.onnx [--output ort_profile.json] [--max-threads N]
+       [--batch-size 1] [--iterations 30]
+The fastest profile is saved as JSON; point ORT_PROFILE at it to use it in app.py.
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+import onnxruntime
+
+EXECUTION_MODES = {
+    "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+OPTIMIZATION_LEVELS = {
+    "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def available_cores():
+    """ Cores this process may run on. Unlike os.cpu_count this respects taskset/cpuset affinity. """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class ExecutionProfile:
+    """
+    Settings for one InferenceSession.
+
+    intra_op_num_threads is the detector's thread budget. None means every core this
+    process may use; ONNX Runtime's own default counts all physical cores of the host,
+    which oversubscribes shared nodes when several sessions or containers run side by
+    side. allow_spinning=False makes idle pool threads sleep instead of busy-waiting
+    for the next frame, trading a little latency for CPU left to other work.
+    """
+
+    FIELDS = ("intra_op_num_threads", "inter_op_num_threads", "execution_mode", "graph_optimization_level",
+              "enable_cpu_mem_arena", "enable_mem_pattern", "allow_spinning", "providers")
+
+    def __init__(self, intra_op_num_threads=None, inter_op_num_threads=1, execution_mode="sequential",
+                 graph_optimization_level="all", enable_cpu_mem_arena=True, enable_mem_pattern=True,
+                 allow_spinning=True, providers=None):
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode {execution_mode!r}, expected one of {list(EXECUTION_MODES)}.")
+        if graph_optimization_level not in OPTIMIZATION_LEVELS:
+            raise ValueError(f"Unknown graph optimization level {graph_optimization_level!r}, "
+                             f"expected one of {list(OPTIMIZATION_LEVELS)}.")
+        self.intra_op_num_threads = intra_op_num_threads
+        self.inter_op_num_threads = inter_op_num_threads
+        self.execution_mode = execution_mode
+        self.graph_optimization_level = graph_optimization_level
+        self.enable_cpu_mem_arena = enable_cpu_mem_arena
+        self.enable_mem_pattern = enable_mem_pattern
+        self.allow_spinning = allow_spinning
+        self.providers = providers
+
+    def session_options(self, optimized_model_filepath=None):
+        """ SessionOptions for this profile; optimized_model_filepath makes the session save its optimized graph. """
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_num_threads or available_cores()
+        options.inter_op_num_threads = self.inter_op_num_threads
+        options.execution_mode = EXECUTION_MODES[self.execution_mode]
+        options.graph_optimization_level = OPTIMIZATION_LEVELS[self.graph_optimization_level]
+        options.enable_cpu_mem_arena = self.enable_cpu_mem_arena
+        options.enable_mem_pattern = self.enable_mem_pattern
+        spinning = "1" if self.allow_spinning else "0"
+        options.add_session_config_entry("session.intra_op.allow_spinning", spinning)
+        options.add_session_config_entry("session.inter_op.allow_spinning", spinning)
+        if optimized_model_filepath:
+            options.optimized_model_filepath = optimized_model_filepath
+        return options
+
+    def resolved_providers(self):
+        return self.providers or onnxruntime.get_available_providers()
+
+    def copy(self, **changes):
+        return self.from_dict({**self.to_dict(), **changes})
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        unknown = set(data) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown execution profile fields: {sorted(unknown)}")
+        return cls(**data)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        # Files written by save() keep the tuning results next to the profile
+        return cls.from_dict(data.get("profile", data))
+
+    def save(self, path, tuning=None):
+        data = {"profile": self.to_dict()}
+        if tuning is not None:
+            data["tuning"] = tuning
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+
+    def __repr__(self):
+        settings = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.FIELDS if field != "providers")
+        return f"ExecutionProfile({settings})"
+
+
+def candidate_profiles(max_threads):
+    """ The profiles tune() tries: thread counts up to max_threads crossed with the other settings. """
+    thread_counts = sorted({t for t in (1, 2, 4, 8, 16, 32) if t < max_threads} | {max_threads})
+    for threads, level, arena, spinning in itertools.product(thread_counts, ("extended", "all"), (True, False), (True, False)):
+        yield ExecutionProfile(intra_op_num_threads=threads, graph_optimization_level=level,
+                               enable_cpu_mem_arena=arena, enable_mem_pattern=arena, allow_spinning=spinning)
+    if max_threads >= 2:
+        # Parallel mode only pays off for graphs with independent branches, so try a single split
+        yield ExecutionProfile(intra_op_num_threads=max(1, max_threads // 2), inter_op_num_threads=2,
+                               execution_mode="parallel")
+
+
+def tune(model_path, max_threads=None, batch_size=1, iterations=30, warmup=5, candidates=None, log=print):
+    """
+    Times YOLOv10.run_session under each candidate profile on this host.
+
+    Returns [(p50_ms, profile)] sorted fastest first. The input is a random tensor, since
+    inference cost does not depend on the pixel values.
+    """
+    from inference import YOLOv10
+
+    max_threads = max_threads or available_cores()
+    results = []
+    for profile in candidates or candidate_profiles(max_threads):
+        detector = YOLOv10(model_path, profile=profile)
+        input_tensor = np.random.default_rng(0).random(
+            (batch_size, 3, detector.input_height, detector.input_width), dtype=np.float32)
+        for _ in range(warmup):
+            detector.run_session(input_tensor)
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            detector.run_session(input_tensor)
+            timings.append((time.perf_counter() - start) * 1000)
+        p50 = float(np.percentile(timings, 50))
+        results.append((p50, profile))
+        log(f"{p50:8.2f} ms  {profile}")
+    results.sort(key=lambda result: result[0])
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model")
+    parser.add_argument("--output", default="ort_profile.json")
+    parser.add_argument("--max-threads", type=int, default=None,
+                        help="Thread budget of one detector (default: all cores this process may use)")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--iterations", type=int, default=30)
+    args = parser.parse_args()
+
+    ranked = tune(args.model, args.max_threads, args.batch_size, args.iterations)
+    best_ms, best = ranked[0]
+    best.save(args.output, tuning={
+        "model": os.path.abspath(args.model),
+        "batch_size": args.batch_size,
+        "available_cores": available_cores(),
+        "p50_ms": round(best_ms, 3),
+        "ranking": [{"p50_ms": round(ms, 3), "profile": profile.to_dict()} for ms, profile in ranked[:5]],
+    })
+    print(f"Fastest: {best_ms:.2f} ms p50 with {best}")
+    print(f"Saved to {args.output}")
@@ -0,0 +1,84 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+
+class DetectionContext:
+    """
+    Per-stream state of the detection pipeline.
+
+    Everything that depends on the frames of one camera lives here rather than in module
+    globals: its tracker (and hence counts), keyframe scheduler, motion gate, quality
+    ladder controller and the watched detections reused on skipped frames. Frames of one
+    stream are handled one at a time under lock, while different streams run in parallel.
+    """
+
+    def __init__(self, stream_id, tracker, keyframes=None, motion_gate=None, ladder=None):
+        self.stream_id = stream_id
+        self.tracker = tracker
+        self.keyframes = keyframes
+        self.motion_gate = motion_gate
+        self.ladder = ladder
+        # Name the client gave its camera; unlike stream_id it is the same on every connection
+        self.camera = None
+        self.object_counts = {}
+        self.last_watched_detections = ([], [], [], [])
+        # Frames received, numbering the detection records of the stream
+        self.sequence = 0
+        self.frame_size = None
+        self.last_seen = time.monotonic()
+        self.lock = threading.Lock()
+        # Frames of the stream waiting for or in its pipeline; the stream has at most one of them
+        # in the shared detector at a time, so this is its queue
+        self.queue_depth = 0
+        self._queue_lock = threading.Lock()
+
+    @contextmanager
+    def queued(self):
+        """ Counts a frame in queue_depth from when it arrives until the stream's pipeline is done with it. """
+        with self._queue_lock:
+            self.queue_depth += 1
+        try:
+            yield
+        finally:
+            with self._queue_lock:
+                self.queue_depth -= 1
+
+
+class ContextRegistry:
+    """
+    Creates a DetectionContext per stream id on first use and forgets it after
+    idle_timeout seconds without frames, together with the metric series labelled
+    with its stream.
+    """
+
+    def __init__(self, factory, idle_timeout=300.0):
+        self.factory = factory
+        self.idle_timeout = idle_timeout
+        self._contexts = {}
+        self._lock = threading.Lock()
+
+    def get(self, stream_id):
+        now = time.monotonic()
+        with self._lock:
+            context = self._contexts.get(stream_id)
+            if context is None:
+                self._expire(now)
+                context = self._contexts[stream_id] = self.factory(stream_id)
+            context.last_seen = now
+        return context
+
+    def contexts(self):
+        with self._lock:
+            return list(self._contexts.values())
+
+    def __len__(self):
+        return len(self._contexts)
+
+    def _expire(self, now):
+        for stream_id, context in list(self._contexts.items()):
+            if now - context.last_seen > self.idle_timeout:
+                del self._contexts[stream_id]
+                metrics.registry.forget(stream=stream_id)
@@ -0,0 +1,86 @@
+import numpy as np
+
+from zones import ZoneSet
+
+# Key of the zones that apply to streams without zones of their own
+ALL_STREAMS = "*"
+
+# Bits of CompiledSettings.actions, one per objectActions flag
+ACTION_COUNT = 1
+ACTION_NOTIFY = 2
+ACTION_RECORD = 4
+ACTION_BITS = {"count": ACTION_COUNT, "notifyOnDetect": ACTION_NOTIFY, "recordOnDetect": ACTION_RECORD}
+
+
+class CompiledSettings:
+    """
+    User settings compiled into lookup arrays indexed by class id.
+
+    watched is a boolean mask of the classes to keep and actions holds the ACTION_*
+    bits of each class, so filtering a frame is one boolean index and per-action
+    counts are one np.bincount, with no per-box dict lookups. Only classes offered
+    in the UI can be watched. Instances are never modified after compile(): an
+    update compiles a new one and swaps the reference, so a frame that read the
+    reference once sees a single consistent version throughout.
+
+    zones maps stream ids (or ALL_STREAMS) to the ZoneSet detection is limited to.
+    """
+
+    def __init__(self, source, watched, actions, counted_ids, notification_email, zones=None):
+        self.source = source
+        self.watched = watched
+        self.actions = actions
+        # Counted classes in UI order, for the count overlay
+        self.counted_ids = counted_ids
+        self.notification_email = notification_email
+        self.zones = zones or {}
+        # Whether any class records, so frames are only buffered for clips when needed
+        self.recording = bool((actions & ACTION_RECORD).any())
+        for array in (watched, actions, counted_ids):
+            array.flags.writeable = False
+
+    @classmethod
+    def compile(cls, settings, class_names, ui_classes):
+        """
+        Compiles a settings dict (watchedObjects, objectActions, notificationEmail and
+        optionally zones, polygons of normalized points per stream id, see zones.py) for
+        class_names. Raises ValueError for malformed zones.
+        """
+        class_ids = {name: i for i, name in enumerate(class_names)}
+        watched = np.zeros(len(class_names), dtype=bool)
+        actions = np.zeros(len(class_names), dtype=np.uint8)
+        counted_ids = []
+        for name in ui_classes:
+            class_id = class_ids[name]
+            if not settings["watchedObjects"].get(name, False):
+                continue
+            watched[class_id] = True
+            for action, bit in ACTION_BITS.items():
+                if settings["objectActions"].get(name, {}).get(action, False):
+                    actions[class_id] |= bit
+            if actions[class_id] & ACTION_COUNT:
+                counted_ids.append(class_id)
+        zones = {}
+        for stream_id, polygons in (settings.get("zones") or {}).items():
+            stream_zones = ZoneSet.from_settings(polygons)
+            if stream_zones is not None:
+                zones[stream_id] = stream_zones
+        return cls(settings, watched, actions, np.array(counted_ids, dtype=np.int64),
+                   settings.get("notificationEmail"), zones)
+
+    def zones_for(self, stream_id):
+        """ The ZoneSet of stream_id, else the one for all streams, else None (whole frame). """
+        zones = self.zones.get(stream_id)
+        return zones if zones is not None else self.zones.get(ALL_STREAMS)
+
+    def filter(self, boxes, scores, class_ids):
+        """ The detections of watched classes, as arrays. """
+        class_ids = np.asarray(class_ids, dtype=np.int64)
+        keep = self.watched[class_ids]
+        return np.asarray(boxes)[keep], np.asarray(scores)[keep], class_ids[keep]
+
+    def action_counts(self, class_ids, action):
+        """ Detections per class id among class_ids whose class has the action bit set. """
+        class_ids = np.asarray(class_ids, dtype=np.int64)
+        selected = class_ids[(self.actions[class_ids] & action) != 0]
+        return np.bincount(selected, minlength=self.watched.shape[0])
@@ -0,0 +1,315 @@
+"""
+Cached, versioned client for the get_user_preferences/set_user_preferences callables.
+
+Usage: python settings_client.py --stub [--port 8085]
+Serves an in-memory stand-in for both callables (and send_email_notification and
+ingest_detection_events) on localhost, for development without Firebase. Point the app at it with
+GET_PREFS_URL=http://127.0.0.1:8085/get_user_preferences and
+SET_PREFS_URL=http://127.0.0.1:8085/set_user_preferences.
+"""
+import argparse
+import copy
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "fastrtc-object-detect", "settings.json")
+
+
+class SettingsError(Exception):
+    """ The preferences function answered with an error, or cannot be reached in offline mode. """
+
+
+def diff_settings(old, new):
+    """ The parts of new that differ from old; nested dicts are compared key by key. """
+    changes = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = diff_settings(previous, value)
+            if nested:
+                changes[key] = nested
+        elif key not in old or previous != value:
+            changes[key] = value
+    return changes
+
+
+def merge_settings(base, changes):
+    """ A copy of base with changes merged in, the way Firestore's set(merge=True) applies them. """
+    merged = copy.deepcopy(base)
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_settings(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+class SettingsClient:
+    """
+    Keeps the user's settings in memory, on disk and in sync with the server, off the frame path.
+
+    start() publishes the settings cached on disk (even expired ones, so a restart
+    without network still has them) and then polls get_url every poll_interval
+    seconds from a background thread, right away if the cache is older than ttl.
+    Each poll sends the lastUpdated version it holds; the server answers
+    {"unchanged": true} instead of the settings when it matches. save() sends only
+    the fields that differ from the last known server settings. Every new version is
+    written to cache_path and passed to on_change. Requests go through one pooled
+    requests.Session and are made without holding the settings lock, so a slow server
+    only delays the call waiting on it; with offline=True the server is never contacted.
+    """
+
+    def __init__(self, get_url, set_url, auth_token, cache_path=DEFAULT_CACHE_PATH, ttl=300.0,
+                 poll_interval=60.0, timeout=10, on_change=None, offline=False, session=None):
+        self.get_url = get_url
+        self.set_url = set_url
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.on_change = on_change
+        self.offline = offline
+
+        self.session = session or requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {auth_token}", "Content-Type": "application/json"})
+
+        self.settings = None
+        self.version = None
+        self.fetched_at = 0.0
+
+        self.downloads = 0
+        self.not_modified = 0
+        self.saves = 0
+        self.errors = 0
+
+        # Guards the settings and the cache file; never held across a request
+        self._lock = threading.Lock()
+        # Serializes saves, so each one diffs against the settings the previous one left
+        self._save_lock = threading.Lock()
+        # Bumped by every save, so a poll answered before it never overwrites it
+        self._generation = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """ Publishes the disk cache and starts polling; never waits on the network. """
+        self.load_cache()
+        if self._thread is None and not self.offline:
+            self._thread = threading.Thread(target=self._run, name="settings-client", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    @property
+    def expired(self):
+        return time.time() - self.fetched_at > self.ttl
+
+    def stats(self):
+        return {
+            "downloads": self.downloads,
+            "not_modified": self.not_modified,
+            "saves": self.saves,
+            "errors": self.errors,
+            "age_seconds": round(time.time() - self.fetched_at, 1) if self.fetched_at else None,
+        }
+
+    def load_cache(self):
+        """ Publishes the settings saved in cache_path, if any. Returns whether there were any. """
+        try:
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return False
+        with self._lock:
+            self.settings = cached["settings"]
+            self.version = cached.get("version")
+            self.fetched_at = cached.get("fetched_at", 0.0)
+            self._publish()
+        return True
+
+    def refresh(self):
+        """
+        Checks the server for newer settings and returns whether they changed. Raises
+        SettingsError or requests.RequestException if the server cannot be asked.
+        """
+        with self._lock:
+            version, generation = self.version, self._generation
+        # Asked without the lock, so save() and load_cache() never wait on a slow server
+        result = self._call(self.get_url, {"knownVersion": version} if version else {})
+        with self._lock:
+            if self._generation != generation:
+                # A save landed meanwhile and the answer may predate it; the next poll catches up
+                return False
+            self.fetched_at = time.time()
+            if result.get("unchanged") and self.settings is not None:
+                self.not_modified += 1
+                self._write_cache()
+                return False
+            version = result.pop("lastUpdated", None)
+            self.downloads += 1
+            changed = result != self.settings
+            self.settings, self.version = result, version
+            self._write_cache()
+            if changed:
+                self._publish()
+            return changed
+
+    def save(self, new_settings):
+        """
+        Sends the fields of new_settings that differ from the server's and returns them
+        ({} when there was nothing to send). Raises like refresh().
+        """
+        with self._save_lock:
+            with self._lock:
+                changes = diff_settings(self.settings or {}, new_settings)
+            if not changes:
+                return changes
+            result = self._call(self.set_url, changes)
+            with self._lock:
+                self._generation += 1
+                self.saves += 1
+                self.settings = merge_settings(self.settings or {}, changes)
+                # Without a version from the server the next poll downloads the settings once
+                self.version = result.get("lastUpdated")
+                self.fetched_at = time.time()
+                self._write_cache()
+                self._publish()
+            return changes
+
+    def _call(self, url, data):
+        if self.offline:
+            raise SettingsError("Settings function URL not configured (offline)")
+        response = self.session.post(url, json={"data": data}, timeout=self.timeout)
+        response.raise_for_status()
+        body = response.json()
+        if "error" in body:
+            raise SettingsError(body["error"])
+        return body.get("result", body)
+
+    def _publish(self):
+        if self.on_change is not None and self.settings is not None:
+            try:
+                self.on_change(copy.deepcopy(self.settings))
+            except Exception as e:
+                print(f"Applying settings failed: {e}")
+
+    def _write_cache(self):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump({"settings": self.settings, "version": self.version, "fetched_at": self.fetched_at}, f)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            print(f"Could not cache settings in {self.cache_path}: {e}")
+
+    def _run(self):
+        delay = 0.0 if self.expired else self.poll_interval
+        while not self._stop.wait(delay):
+            try:
+                self.refresh()
+                delay = self.poll_interval
+            except (SettingsError, requests.exceptions.RequestException, ValueError) as e:
+                self.errors += 1
+                # Back off while the server is unreachable, the cached settings stay in use
+                delay = min(max(delay, self.poll_interval) * 2, 16 * self.poll_interval)
+                print(f"Settings refresh failed, retrying in {delay:.0f} s: {e}")
+
+
+def _nested_array_path(value, path="data", in_array=False):
+    """ Where value holds an array directly inside an array, which Firestore does not store; None if nowhere. """
+    if isinstance(value, list):
+        if in_array:
+            return path
+        for i, item in enumerate(value):
+            nested = _nested_array_path(item, f"{path}[{i}]", in_array=True)
+            if nested is not None:
+                return nested
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            nested = _nested_array_path(item, f"{path}.{key}")
+            if nested is not None:
+                return nested
+    return None
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """ Callable-protocol stand-in for the functions of firebase_functions/main.py. """
+
+    preferences = None
+    events = []
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        data = json.loads(body or b"{}").get("data") or {}
+        name = self.path.strip("/").split("/")[-1]
+        with self.lock:
+            if name == "get_user_preferences":
+                result = self._get(data)
+            elif name == "set_user_preferences":
+                nested = _nested_array_path(data)
+                if nested is not None:
+                    # As Firestore, which rejects the whole write
+                    self._answer({"error": {"status": "INVALID_ARGUMENT",
+                                            "message": f"Cannot store an array directly inside an array ({nested})"}})
+                    return
+                result = self._set(data)
+            elif name == "send_email_notification":
+                result = {"message": f"Email simulation successful for: {data.get('recipient_email')}"}
+            elif name == "ingest_detection_events":
+                type(self).events.extend(data.get("events") or [])
+                result = {"accepted": len(data.get("events") or []), "writes": 0, "emailSent": False}
+            else:
+                self.send_error(404)
+                return
+        self._answer({"result": result})
+
+    def _answer(self, body):
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _get(self, data):
+        stored = type(self).preferences
+        if stored is None:
+            return {"watchedObjects": {}, "objectActions": {}, "notificationEmail": None}
+        if data.get("knownVersion") == stored["lastUpdated"]:
+            return {"unchanged": True, "lastUpdated": stored["lastUpdated"]}
+        return stored
+
+    def _set(self, data):
+        merged = merge_settings(type(self).preferences or {}, data)
+        merged["lastUpdated"] = datetime.now(timezone.utc).isoformat()
+        type(self).preferences = merged
+        return {"message": "Preferences updated successfully.", "lastUpdated": merged["lastUpdated"]}
+
+    def log_message(self, format, *args):
+        print(f"stub: {self.command} {self.path} {args[1] if len(args) > 1 else ''}")
+
+
+def serve_stub(port=8085):
+    server = ThreadingHTTPServer(("127.0.0.1", port), _StubHandler)
+    print(f"Preferences stub listening on http://127.0.0.1:{port}/get_user_preferences and /set_user_preferences")
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stub", action="store_true", required=True, help="Serve the local preferences stub")
+    parser.add_argument("--port", type=int, default=8085)
+    args = parser.parse_args()
+    serve_stub(args.port).serve_forever()
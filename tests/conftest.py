@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The app's modules sit at the top of the repository, the benchmark helpers (synthetic models, legacy
+# reference code) and the Firebase functions' logic next to them
+for path in (os.path.join(ROOT, "firebase_functions"), os.path.join(ROOT, "benchmarks"), ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
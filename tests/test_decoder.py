@@ -0,0 +1,93 @@
+"""
+DetectionDecoder against the legacy process_output, on the committed fixture of outputs
+recorded from ONNX Runtime (benchmarks/data/decoder_raw320.npz) and on synthetic outputs.
+"""
+import numpy as np
+import pytest
+
+from decoder import DetectionDecoder
+from decoder_bench import (FIXTURE_INPUT_SIZE, FIXTURE_PATH, FRAME_HEIGHT, FRAME_WIDTH, INPUT_SIZE, NUM_CLASSES,
+                           WATCHED_CLASSES, agrees, legacy_masked, synthetic_raw)
+
+
+def watched_mask():
+    mask = np.zeros(NUM_CLASSES, dtype=bool)
+    mask[list(WATCHED_CLASSES)] = True
+    return mask
+
+
+@pytest.fixture(scope="module")
+def fixture():
+    """ (outputs with boxes in input pixels, the same normalized, frame size, geometry) """
+    data = np.load(FIXTURE_PATH)
+    recorded = data["outputs"]
+    frame_size = tuple(int(v) for v in data["frame_size"])
+    normalized = recorded.copy()
+    normalized[:, :4] /= FIXTURE_INPUT_SIZE
+    geometry = (FIXTURE_INPUT_SIZE / frame_size[0], FIXTURE_INPUT_SIZE / frame_size[1], 0, 0)
+    return recorded, normalized, frame_size, geometry
+
+
+def calibrated(outputs):
+    return DetectionDecoder([{"shape": [1, *outputs.shape[1:]]}], FIXTURE_INPUT_SIZE, FIXTURE_INPUT_SIZE,
+                            num_classes=NUM_CLASSES).calibrate(outputs[0])
+
+
+def edge_frames(recorded):
+    """ Frames that used to flip per-frame unit detection: one tiny box at the origin, and no detections. """
+    tiny, empty = recorded[0].copy(), recorded[0].copy()
+    tiny[4:] = empty[4:] = 0.0
+    tiny[:4, 0] = (1.5, 1.5, 1.0, 1.0)
+    tiny[4 + 2, 0] = 0.9
+    tiny_normalized = tiny.copy()
+    tiny_normalized[:4] /= FIXTURE_INPUT_SIZE
+    return tiny, tiny_normalized, empty
+
+
+@pytest.mark.parametrize("units", ["pixels", "normalized"])
+def test_calibration_settles_the_box_units(fixture, units):
+    recorded, normalized, _, _ = fixture
+    decoder = calibrated(recorded if units == "pixels" else normalized)
+    assert decoder.boxes_normalized == (units == "normalized")
+
+
+@pytest.mark.parametrize("units", ["pixels", "normalized"])
+@pytest.mark.parametrize("conf_threshold", [0.05, 0.3])
+@pytest.mark.parametrize("masked", [False, True])
+def test_fixture_matches_the_legacy_decoder(fixture, units, conf_threshold, masked):
+    recorded, normalized, frame_size, geometry = fixture
+    tiny, tiny_normalized, empty = edge_frames(recorded)
+    outputs = recorded if units == "pixels" else normalized
+    frames = [*outputs, tiny if units == "pixels" else tiny_normalized, empty]
+    legacy_frames = [*normalized, tiny_normalized, empty]
+    class_mask = watched_mask() if masked else None
+
+    decoder = calibrated(outputs)
+    compared = 0
+    for frame, legacy_frame in zip(frames, legacy_frames):
+        legacy = legacy_masked(legacy_frame[None], conf_threshold, *frame_size, class_mask)
+        decoded = decoder.decode(frame[None].copy(), conf_threshold, geometry, class_mask)
+        assert agrees(legacy, decoded)
+        compared += len(decoded[1])
+    assert compared > 0
+    # The tiny box and the empty frame did not change the units
+    assert decoder.boxes_normalized == (units == "normalized")
+
+
+def test_all_zero_output_calibrates_as_pixels():
+    output = np.zeros((1, 4 + NUM_CLASSES, 100), dtype=np.float32)
+    decoder = DetectionDecoder([{"shape": list(output.shape)}], INPUT_SIZE, INPUT_SIZE, num_classes=NUM_CLASSES)
+    assert not decoder.calibrate(output).boxes_normalized
+
+
+@pytest.mark.parametrize("masked", [False, True])
+def test_synthetic_raw_outputs_match_the_legacy_decoder(masked):
+    rng = np.random.default_rng(0)
+    outputs = [synthetic_raw(rng) for _ in range(4)]
+    geometry = (INPUT_SIZE / FRAME_WIDTH, INPUT_SIZE / FRAME_HEIGHT, 0, 0)
+    class_mask = watched_mask() if masked else None
+    decoder = DetectionDecoder([{"shape": list(outputs[0].shape)}], INPUT_SIZE, INPUT_SIZE,
+                               num_classes=NUM_CLASSES).calibrate(outputs[0])
+    for output in outputs:
+        legacy = legacy_masked(output, 0.3, FRAME_WIDTH, FRAME_HEIGHT, class_mask)
+        assert agrees(legacy, decoder.decode(output.copy(), 0.3, geometry, class_mask))
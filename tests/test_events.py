@@ -0,0 +1,56 @@
+"""
+Email rate limiting of firebase_functions/events.py, and the ingest path of events_bench.py
+(write_events against an in-memory Firestore stand-in) end to end.
+"""
+import numpy as np
+
+from events import EMAIL_FLUSH_PERIOD_S, EMAIL_MIN_INTERVAL_S, flush_email, plan_email, restore_email
+from events_bench import CLASSES, ingest
+
+
+def test_counts_are_held_back_within_the_interval():
+    state, email = plan_email(None, {"person": 1}, 1000.0)
+    assert email == ({"person": 1}, 1000.0)
+    state, email = plan_email(state, {"person": 2, "car": 1}, 1010.0)
+    assert email is None
+    assert state == {"lastSentAt": 1000.0, "pending": {"person": 2, "car": 1}, "pendingSince": 1010.0}
+
+    state, email = flush_email(state, 1000.0 + EMAIL_MIN_INTERVAL_S - 1)
+    assert email is None
+    state, email = flush_email(state, 1000.0 + EMAIL_MIN_INTERVAL_S)
+    assert email == ({"person": 2, "car": 1}, 1010.0)
+    assert state == {"lastSentAt": 1000.0 + EMAIL_MIN_INTERVAL_S, "pending": {}, "pendingSince": None}
+
+
+def test_counts_stay_pending_without_a_recipient():
+    state, email = plan_email(None, {"dog": 1}, 1000.0, deliverable=False)
+    assert email is None
+    state, email = flush_email(state, 2000.0, deliverable=False)
+    assert email is None and state["pending"] == {"dog": 1}
+    state, email = flush_email(state, 3000.0)
+    assert email == ({"dog": 1}, 1000.0)
+
+
+def test_failed_email_is_restored():
+    state, email = plan_email({"lastSentAt": 100.0, "pending": {}}, {"cat": 2}, 1000.0)
+    # One more count arrives while the email is being sent, which then fails
+    state, _ = plan_email(state, {"cat": 1}, 1001.0)
+    state = restore_email(state, email, 1000.0, 100.0)
+    assert state == {"lastSentAt": 100.0, "pending": {"cat": 3}, "pendingSince": 1000.0}
+
+
+def test_restore_keeps_a_later_email():
+    state = restore_email({"lastSentAt": 1300.0, "pending": {}}, ({"cat": 2}, 990.0), 1000.0, 100.0)
+    assert state == {"lastSentAt": 1300.0, "pending": {"cat": 2}, "pendingSince": 990.0}
+
+
+def test_burst_then_silence_is_emailed_by_the_flush():
+    rng = np.random.default_rng(1)
+    events = sorted((float(t), "camera-0", str(rng.choice(CLASSES)), i)
+                    for i, t in enumerate(rng.uniform(0, 120, 40)))
+    _, _, _, unflushed, _ = ingest(events, 5.0)
+    _, _, sent_at, emailed, _ = ingest(events, 5.0, EMAIL_FLUSH_PERIOD_S, 1800)
+    assert unflushed < len(events)
+    assert emailed == len(events)
+    assert all(b - a <= EMAIL_MIN_INTERVAL_S + EMAIL_FLUSH_PERIOD_S for a, b in zip(sent_at, sent_at[1:]))
+    assert all(b - a >= EMAIL_MIN_INTERVAL_S for a, b in zip(sent_at, sent_at[1:]))
@@ -0,0 +1,137 @@
+"""
+QualityLadder rescaling per rung, and LadderController moves with stand-in loaders.
+"""
+import numpy as np
+import pytest
+
+from inference import YOLOv10
+from ladder import LadderController, QualityLadder
+from model_loader import FAILED, LOADING, READY
+from preprocess import Preprocessor
+
+SIZES = (320, 480, 640)
+# Fractions of the frame the marker box covers: x1, y1, x2, y2
+MARKER = np.array([0.25, 0.2, 0.6, 0.9], dtype=np.float32)
+
+
+def build_marker_model(path, layout, input_size, box, class_id=3):
+    """ A model that ignores its input and returns box (input pixels, x1 y1 x2 y2) with score 0.9. """
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    if layout == "end2end":
+        row = np.array([[[*box, 0.9, class_id]]], dtype=np.float32)
+        output_shape = ["batch", 1, 6]
+    else:
+        row = np.zeros((1, 84, 1), dtype=np.float32)
+        row[0, :4, 0] = [(box[0] + box[2]) / 2, (box[1] + box[3]) / 2, box[2] - box[0], box[3] - box[1]]
+        row[0, 4 + class_id, 0] = 0.9
+        output_shape = ["batch", 84, 1]
+    nodes = [
+        # Zero times the input's mean, so the output has the input's batch size
+        helper.make_node("ReduceMean", ["images"], ["mean"], axes=[1, 2, 3], keepdims=1),
+        helper.make_node("Reshape", ["mean", "shape"], ["mean3"]),
+        helper.make_node("Mul", ["mean3", "zero"], ["zeros"]),
+        helper.make_node("Add", ["zeros", "row"], ["output0"]),
+    ]
+    graph = helper.make_graph(
+        nodes, "marker",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, ["batch", 3, input_size, input_size])],
+        [helper.make_tensor_value_info("output0", TensorProto.FLOAT, output_shape)],
+        initializer=[numpy_helper.from_array(np.array([-1, 1, 1], dtype=np.int64), "shape"),
+                     numpy_helper.from_array(np.float32(0), "zero"), numpy_helper.from_array(row, "row")],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+    return path
+
+
+@pytest.mark.parametrize("frame_width, frame_height", [(640, 480), (1280, 720)])
+@pytest.mark.parametrize("letterbox", [False, True])
+@pytest.mark.parametrize("layout", ["end2end", "raw"])
+@pytest.mark.parametrize("input_size", SIZES)
+def test_each_rung_maps_boxes_back_to_the_frame(tmp_path, input_size, layout, letterbox, frame_width, frame_height):
+    frame_box = MARKER * [frame_width, frame_height, frame_width, frame_height]
+    scale_x, scale_y, pad_x, pad_y, _, _ = Preprocessor(input_size, input_size, letterbox) \
+        .geometry_for(frame_width, frame_height)
+    input_box = frame_box * [scale_x, scale_y, scale_x, scale_y] + [pad_x, pad_y, pad_x, pad_y]
+    path = build_marker_model(str(tmp_path / "marker.onnx"), layout, input_size, input_box)
+
+    detector = YOLOv10(path, letterbox=letterbox)
+    assert (detector.input_width, detector.input_height) == (input_size, input_size)
+    boxes, _, class_ids = detector.detect_objects(np.zeros((frame_height, frame_width, 3), dtype=np.uint8), 0.5)
+    assert len(boxes) == 1 and class_ids[0] == 3
+    # Within a pixel of the model input, projected back to the frame
+    assert np.abs(boxes[0] - frame_box).max() <= 1.0 / min(scale_x, scale_y)
+
+
+class _Loader:
+    """ Stands in for a ModelLoader in the given state. """
+
+    def __init__(self, state=READY):
+        self.state = state
+        self.model = object() if state == READY else None
+        self.detector = None
+
+    @property
+    def ready(self):
+        return self.state == READY
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def controller(*states, **kwargs):
+    ladder = QualityLadder([_Loader(state) for state in states])
+    return ladder, LadderController(ladder, target_fps=10.0, down_after=3, up_after=3, min_dwell=5.0,
+                                    clock=kwargs.pop("clock", _Clock()), **kwargs)
+
+
+def test_steps_down_when_over_budget():
+    _, ladder_controller = controller(READY, READY, READY)
+    assert [ladder_controller.record(150.0, level=2) for _ in range(3)] == [None, None, (2, 1)]
+    assert ladder_controller.transitions_down == 1
+
+
+def test_steps_up_after_the_dwell_and_not_into_the_backoff():
+    clock = _Clock()
+    _, ladder_controller = controller(READY, READY, clock=clock, backoff=30.0)
+    for _ in range(3):
+        ladder_controller.record(150.0, level=1)
+    assert ladder_controller.level == 0
+
+    clock.now = 10.0
+    assert [ladder_controller.record(10.0, level=0) for _ in range(5)] == [None] * 5
+    clock.now = 31.0
+    assert [ladder_controller.record(10.0, level=0) for _ in range(3)] == [None, None, (0, 1)]
+
+
+def test_failed_rung_moves_the_stream_to_its_fallback():
+    ladder, ladder_controller = controller(READY, READY, FAILED)
+    assert ladder.detector(2)[0] == 1
+    assert ladder_controller.record(10.0, level=1) == (2, 1)
+
+
+def test_overloaded_fallback_steps_a_loading_rung_down():
+    ladder, ladder_controller = controller(READY, READY, LOADING)
+    assert ladder.detector(2)[0] == 1
+    transitions = [ladder_controller.record(150.0, level=1) for _ in range(3)]
+    assert transitions == [None, None, (2, 1)]
+
+
+def test_fallback_runs_never_step_up():
+    clock = _Clock()
+    _, ladder_controller = controller(READY, LOADING, READY, clock=clock, start_level=1)
+    clock.now = 100.0
+    assert [ladder_controller.record(1.0, level=0) for _ in range(10)] == [None] * 10
+
+
+def test_failed_rungs_are_skipped_on_the_way_down():
+    _, ladder_controller = controller(READY, FAILED, READY)
+    assert [ladder_controller.record(150.0, level=2) for _ in range(3)] == [None, None, (2, 0)]
@@ -0,0 +1,71 @@
+"""
+NotificationDispatcher and EventUploader with a stand-in requests session.
+"""
+import threading
+
+from notifications import EventUploader, NotificationDispatcher
+
+
+class _Response:
+    def raise_for_status(self):
+        pass
+
+
+class _Session:
+    """ Records the payloads posted through it. """
+
+    def __init__(self):
+        self.headers = {}
+        self.posted = []
+
+    def post(self, url, json=None, timeout=None):
+        self.posted.append(json)
+        return _Response()
+
+
+def test_concurrent_notifications_pass_the_cooldown_once():
+    session = _Session()
+    dispatcher = NotificationDispatcher("http://functions/send", "token", cooldown=60.0, coalesce_window=0.0,
+                                        session=session)
+    barrier = threading.Barrier(8)
+    results = []
+
+    def notify():
+        barrier.wait()
+        results.append(dispatcher.notify("person", "user@example.com"))
+
+    threads = [threading.Thread(target=notify) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    dispatcher.close(5)
+    assert sorted(results) == [False] * 7 + [True]
+    assert (dispatcher.enqueued, dispatcher.suppressed, dispatcher.sent) == (1, 7, 1)
+    assert len(session.posted) == 1
+
+
+def test_classes_in_one_window_share_an_email():
+    session = _Session()
+    dispatcher = NotificationDispatcher("http://functions/send", "token", coalesce_window=5.0, session=session)
+    dispatcher.notify("person", "user@example.com", count=2)
+    dispatcher.notify("car", "user@example.com")
+    # Without a recipient nothing is sent
+    dispatcher.notify("dog", None)
+    dispatcher.close(5)
+    assert len(session.posted) == 1
+    data = session.posted[0]["data"]
+    assert data["recipient_email"] == "user@example.com"
+    assert data["subject"] == "Object Detection Alert: car, person"
+    assert "1 x car, 2 x person" in data["body"]
+
+
+def test_uploader_sends_the_queued_events_on_close():
+    session = _Session()
+    uploader = EventUploader("http://functions/ingest", "token", flush_interval=60.0, session=session)
+    for track_id in range(3):
+        assert uploader.record("person", track_id, "cam1", timestamp=1000.0 + track_id)
+    uploader.close(5)
+    events = [event for payload in session.posted for event in payload["data"]["events"]]
+    assert [event["trackId"] for event in events] == [0, 1, 2]
+    assert all(event["camera"] == "cam1" for event in events)
@@ -0,0 +1,53 @@
+"""
+Encoding and decoding of the detection records of overlay.py.
+"""
+import struct
+
+import numpy as np
+import pytest
+
+from overlay import FLAG_REUSED, decode_detections, encode_detections, frame_record, record_size
+from overlay_bench import synthetic_detections
+
+
+@pytest.mark.parametrize("count", [0, 1, 20])
+def test_records_round_trip(count):
+    count_ids = {0: 12, 2: 3}
+    for sequence, (boxes, scores, class_ids, track_ids) in enumerate(synthetic_detections(5, count, 640, 480)):
+        record = encode_detections(sequence, 640, 480, boxes, scores, class_ids, track_ids, count_ids)
+        assert len(record) == record_size(count, len(count_ids))
+
+        decoded = decode_detections(record)
+        assert decoded["sequence"] == sequence and (decoded["width"], decoded["height"]) == (640, 480)
+        assert np.abs(decoded["boxes"] - boxes).max(initial=0) <= 0.5
+        assert np.abs(decoded["scores"] - scores).max(initial=0) <= 0.5 / 255 + 1e-6
+        assert (decoded["class_ids"] == class_ids).all() and (decoded["track_ids"] == track_ids).all()
+        assert dict(zip(decoded["count_class_ids"].tolist(), decoded["counts"].tolist())) == count_ids
+
+
+def test_untracked_detections_and_flags():
+    record = encode_detections(7, 1280, 720, [[10, 20, 30, 40]], [0.5], [3], flags=FLAG_REUSED)
+    decoded = decode_detections(record)
+    assert decoded["flags"] == FLAG_REUSED
+    assert decoded["track_ids"].tolist() == [0]
+    assert decoded["boxes"].tolist() == [[10, 20, 30, 40]]
+
+
+def test_boxes_are_clamped_to_int16():
+    record = encode_detections(0, 640, 480, [[-40000, 0, 40000, 10]], [1.0], [0])
+    assert decode_detections(record)["boxes"].tolist() == [[-32768, 0, 32767, 10]]
+
+
+def test_malformed_records_are_rejected():
+    record = encode_detections(0, 640, 480, [[0, 0, 1, 1]], [1.0], [0])
+    with pytest.raises(ValueError):
+        decode_detections(record[:10])
+    with pytest.raises(ValueError):
+        decode_detections(record[:-1])
+    with pytest.raises(ValueError):
+        decode_detections(bytes([99]) + record[1:])
+
+
+def test_frame_record_prefixes_the_length():
+    record = encode_detections(0, 640, 480, [], [], [])
+    assert frame_record(record) == struct.pack("<I", len(record)) + record
@@ -0,0 +1,164 @@
+"""
+SettingsClient against the local preferences stub of settings_client.py.
+"""
+import threading
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from settings import CompiledSettings
+from settings_client import SettingsClient, SettingsError, _StubHandler
+from zones import ZoneSet, editable_zones, stored_zones
+
+CLASSES = ["person", "car", "dog"]
+SETTINGS = {"watchedObjects": {"person": True, "car": True}, "objectActions": {}, "notificationEmail": None}
+EDITED_ZONES = {
+    "*": [[[0.1, 0.5], [0.4, 0.5], [0.4, 1.0], [0.1, 1.0]]],
+    "cam1": [[[0.0, 0.0], [0.5, 0.0], [0.25, 0.5]], [[0.6, 0.6], [0.9, 0.6], [0.9, 0.9], [0.6, 0.9]]],
+}
+
+
+class _SlowGetHandler(_StubHandler):
+    """ Holds get_user_preferences answers until release is set, outside the stub's lock. """
+
+    release = threading.Event()
+    waiting = threading.Event()
+
+    def _answer(self, body):
+        if self.path.endswith("get_user_preferences"):
+            type(self).waiting.set()
+            type(self).release.wait(5)
+        super()._answer(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(handler):
+    handler.preferences = None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def stub():
+    server = serve(type("_QuietStubHandler", (_StubHandler,), {"log_message": lambda self, *args: None}))
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def client(base, tmp_path, name, **kwargs):
+    return SettingsClient(f"{base}/get_user_preferences", f"{base}/set_user_preferences", "token",
+                          cache_path=str(tmp_path / f"{name}.json"), **kwargs)
+
+
+def test_unchanged_settings_are_not_downloaded_again(stub, tmp_path):
+    client(stub, tmp_path, "writer").save(SETTINGS)
+    reader = client(stub, tmp_path, "reader")
+    assert reader.refresh()
+    assert not reader.refresh()
+    assert (reader.downloads, reader.not_modified) == (1, 1)
+    assert reader.settings == {**SETTINGS}
+
+
+def test_save_sends_only_the_changed_fields(stub, tmp_path):
+    writer = client(stub, tmp_path, "writer")
+    assert writer.save(SETTINGS) == SETTINGS
+    changed = {**SETTINGS, "watchedObjects": {"person": True, "car": False}}
+    assert writer.save(changed) == {"watchedObjects": {"car": False}}
+    assert writer.save(changed) == {}
+    assert writer.saves == 2
+
+    reader = client(stub, tmp_path, "reader")
+    reader.refresh()
+    assert reader.settings == changed
+
+
+def test_cached_settings_are_published_offline(stub, tmp_path):
+    client(stub, tmp_path, "writer").save(SETTINGS)
+    published = []
+    offline = client(stub, tmp_path, "writer", offline=True, on_change=published.append).start()
+    assert published == [SETTINGS]
+    with pytest.raises(SettingsError):
+        offline.refresh()
+
+
+def test_a_slow_refresh_does_not_hold_up_saves(tmp_path):
+    _SlowGetHandler.release.clear()
+    _SlowGetHandler.waiting.clear()
+    server = serve(_SlowGetHandler)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        settings_client = client(base, tmp_path, "slow")
+        result = []
+        refresh = threading.Thread(target=lambda: result.append(settings_client.refresh()))
+        refresh.start()
+        assert _SlowGetHandler.waiting.wait(5)
+
+        # Saved and published while the refresh still waits on the server
+        assert settings_client.save(SETTINGS) == SETTINGS
+        assert settings_client.settings == SETTINGS
+        assert refresh.is_alive()
+
+        _SlowGetHandler.release.set()
+        refresh.join(5)
+        # The answer may predate the save, so it is dropped
+        assert result == [False]
+        assert settings_client.settings == SETTINGS
+    finally:
+        _SlowGetHandler.release.set()
+        server.shutdown()
+        server.server_close()
+
+
+def test_nested_arrays_are_rejected(stub, tmp_path):
+    with pytest.raises(SettingsError, match="INVALID_ARGUMENT"):
+        client(stub, tmp_path, "raw").save({**SETTINGS, "zones": EDITED_ZONES})
+
+
+def assert_same_zones(loaded, expected):
+    """ The ZoneSets compiled from loaded and expected zones agree on points, filter and crop regions. """
+    rng = np.random.default_rng(0)
+    boxes = rng.uniform(0, 1, (200, 4)) * [1280, 720, 1280, 720]
+    boxes[:, 2:] = np.maximum(boxes[:, 2:], boxes[:, :2] + 1)
+    assert sorted(loaded) == sorted(expected)
+    for camera, polygons in expected.items():
+        got, want = ZoneSet.from_settings(loaded[camera]), ZoneSet.from_settings(polygons)
+        assert len(got.polygons) == len(want.polygons)
+        for got_points, want_points in zip(got.polygons, want.polygons):
+            assert np.array_equal(got_points, want_points)
+        assert np.array_equal(got.contains(boxes, 1280, 720), want.contains(boxes, 1280, 720))
+        assert [region for region, _ in got.regions(1280, 720)] == \
+            [region for region, _ in want.regions(1280, 720)]
+
+
+def test_zones_round_trip(stub, tmp_path):
+    client(stub, tmp_path, "writer").save({**SETTINGS, "zones": stored_zones(EDITED_ZONES)})
+    reader = client(stub, tmp_path, "reader")
+    assert reader.refresh()
+    loaded = reader.settings["zones"]
+    assert editable_zones(loaded) == EDITED_ZONES
+    assert_same_zones(loaded, EDITED_ZONES)
+    compiled = CompiledSettings.compile(reader.settings, CLASSES, CLASSES)
+    assert compiled.zones_for("cam1") is not None and compiled.zones_for("cam2") is not None
+
+
+def test_cleared_zones_are_removed_on_the_server(stub, tmp_path):
+    writer = client(stub, tmp_path, "writer")
+    writer.save({**SETTINGS, "zones": stored_zones(EDITED_ZONES)})
+
+    # Cleared as app.py does: the removed camera is saved as empty
+    edited = {"*": EDITED_ZONES["*"]}
+    cleared = stored_zones(edited)
+    for camera in EDITED_ZONES:
+        cleared.setdefault(camera, [])
+    writer.save({**SETTINGS, "zones": cleared})
+
+    reader = client(stub, tmp_path, "reader")
+    assert reader.refresh()
+    assert_same_zones({k: v for k, v in reader.settings["zones"].items() if v}, edited)
+    # cam1 falls back to the "*" zones
+    assert CompiledSettings.compile(reader.settings, CLASSES, CLASSES).zones_for("cam1") is not None
@@ -0,0 +1,36 @@
+"""
+ZoneSet crop regions and the point-in-polygon filter.
+"""
+import numpy as np
+
+from zones import ZoneSet, editable_zones, merge_detections, stored_zones
+
+CROSSING_STRIPS = [[[0.0, 0.45], [1.0, 0.45], [1.0, 0.55], [0.0, 0.55]],
+                   [[0.45, 0.0], [0.55, 0.0], [0.55, 1.0], [0.45, 1.0]]]
+
+
+def test_crossing_zones_share_a_crop():
+    zones = ZoneSet(CROSSING_STRIPS)
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    crossing = np.array([[300.0, 220.0, 340.0, 260.0]])
+    results = []
+    for crop, zone_crop in zones.crops(frame):
+        # A detector that finds the box wherever the crop shows its center
+        x, y = zone_crop.x, zone_crop.y
+        seen = crop.shape[1] > 320 - x >= 0 and crop.shape[0] > 240 - y >= 0
+        boxes = crossing[:int(seen)] - [x, y, x, y]
+        results.append(zone_crop.restore(boxes, np.full(len(boxes), 0.9), np.zeros(len(boxes), dtype=np.int64)))
+    boxes, _, _ = merge_detections(results)
+    assert len(zones.regions(640, 480)) == 1
+    assert len(boxes) == 1
+
+
+def test_contains_keeps_box_centers_inside_a_zone():
+    zones = ZoneSet([[[0.0, 0.0], [0.5, 0.0], [0.5, 0.5], [0.0, 0.5]]])
+    boxes = np.array([[10.0, 10.0, 50.0, 50.0], [300.0, 200.0, 400.0, 300.0], [200.0, 100.0, 400.0, 140.0]])
+    # Centers (30, 30), (350, 250) and (300, 120) in a 640x480 frame
+    assert zones.contains(boxes, 640, 480).tolist() == [True, False, True]
+
+
+def test_stored_zones_convert_back():
+    assert editable_zones(stored_zones({"cam1": CROSSING_STRIPS})) == {"cam1": CROSSING_STRIPS}
@@ -0,0 +1,277 @@
+import numpy as np
+
+TRACK_ENTER = "enter"
+TRACK_EXIT = "exit"
+
+
+def candidate_pairs(boxes_a, boxes_b):
+    """
+    Index pairs (i, j) whose x-extents may overlap, found by sorting boxes_b on x1 and
+    sweeping one searchsorted window per box in boxes_a. Pairs outside the window have
+    zero IoU, so only these need to be scored.
+    """
+    order = np.argsort(boxes_b[:, 0], kind="stable")
+    x1_sorted = boxes_b[order, 0]
+    max_width = (boxes_b[:, 2] - boxes_b[:, 0]).max()
+    lo = np.searchsorted(x1_sorted, boxes_a[:, 0] - max_width, side="left")
+    hi = np.searchsorted(x1_sorted, boxes_a[:, 2], side="left")
+    counts = np.maximum(hi - lo, 0)
+    rows = np.repeat(np.arange(boxes_a.shape[0]), counts)
+    offsets = np.arange(rows.shape[0]) - np.repeat(np.cumsum(counts) - counts, counts)
+    cols = order[np.repeat(lo, counts) + offsets]
+    return rows, cols
+
+
+def pairwise_iou(boxes_a, boxes_b):
+    """ IoU of aligned box pairs: boxes_a[k] against boxes_b[k]. """
+    inter_w = np.minimum(boxes_a[:, 2], boxes_b[:, 2]) - np.maximum(boxes_a[:, 0], boxes_b[:, 0])
+    inter_h = np.minimum(boxes_a[:, 3], boxes_b[:, 3]) - np.maximum(boxes_a[:, 1], boxes_b[:, 1])
+    inter = np.maximum(inter_w, 0) * np.maximum(inter_h, 0)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """ Dense pairwise IoU, shape (len(boxes_a), len(boxes_b)). """
+    iou = np.zeros((boxes_a.shape[0], boxes_b.shape[0]), dtype=np.float32)
+    if iou.size:
+        rows, cols = candidate_pairs(boxes_a, boxes_b)
+        iou[rows, cols] = pairwise_iou(boxes_a[rows], boxes_b[cols])
+    return iou
+
+
+def greedy_match(rows, cols, values, num_rows, num_cols):
+    """
+    Greedy one-to-one matching of candidate (row, col) pairs by descending value.
+    Returns the accepted (row_indices, col_indices).
+    """
+    order = np.argsort(-values, kind="stable")
+    rows, cols = rows[order], cols[order]
+    matched_rows, matched_cols = [], []
+    # A pair that is the best remaining candidate for both its row and its column is always
+    # taken by sequential greedy matching, so whole sets of them can be accepted per round
+    while rows.shape[0]:
+        best_for_row = np.zeros(rows.shape[0], dtype=bool)
+        best_for_row[np.unique(rows, return_index=True)[1]] = True
+        best_for_col = np.zeros(cols.shape[0], dtype=bool)
+        best_for_col[np.unique(cols, return_index=True)[1]] = True
+        take = best_for_row & best_for_col
+        matched_rows.append(rows[take])
+        matched_cols.append(cols[take])
+
+        used_rows = np.zeros(num_rows, dtype=bool)
+        used_rows[rows[take]] = True
+        used_cols = np.zeros(num_cols, dtype=bool)
+        used_cols[cols[take]] = True
+        remaining = ~(used_rows[rows] | used_cols[cols])
+        rows, cols = rows[remaining], cols[remaining]
+    if not matched_rows:
+        return rows, cols
+    return np.concatenate(matched_rows), np.concatenate(matched_cols)
+
+
+class IoUTracker:
+    """
+    SORT-style multi-object tracker that associates detections across frames by IoU.
+
+    Track state lives in parallel NumPy arrays (one row per live track) rather than
+    per-track objects, so prediction, association and bookkeeping are vectorized.
+    Motion is either a smoothed constant-velocity estimate or, with use_kalman, an
+    independent constant-velocity Kalman filter on each box coordinate.
+
+    A track is confirmed (gets counted and emits an "enter" event) after min_hits
+    matched frames and is dropped (emitting "exit" if it was confirmed) after
+    max_age frames without a match.
+    """
+
+    def __init__(self, num_classes, iou_threshold=0.3, max_age=30, min_hits=3, use_kalman=False,
+                 class_aware=True, velocity_smoothing=0.5):
+        self.num_classes = num_classes
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.use_kalman = use_kalman
+        self.class_aware = class_aware
+        self.velocity_smoothing = velocity_smoothing
+
+        self.boxes = np.empty((0, 4), dtype=np.float32)
+        self.velocities = np.empty((0, 4), dtype=np.float32)
+        # Per-coordinate 2x2 Kalman covariance stored as (var_pos, cov_pos_vel, var_vel)
+        self.covariances = np.empty((0, 4, 3), dtype=np.float32)
+        self.scores = np.empty(0, dtype=np.float32)
+        self.class_ids = np.empty(0, dtype=np.int64)
+        self.track_ids = np.empty(0, dtype=np.int64)
+        self.hits = np.empty(0, dtype=np.int32)
+        self.time_since_update = np.empty(0, dtype=np.int32)
+        self.confirmed = np.empty(0, dtype=bool)
+
+        self.unique_counts = np.zeros(num_classes, dtype=np.int64)
+        self.events = []
+        # Per detection of the latest update: the id of the track it matched or started
+        self.detection_track_ids = np.empty(0, dtype=np.int64)
+        self.frame_index = 0
+        self._frames_since_update = 0
+        self._next_id = 1
+
+    def __len__(self):
+        return self.track_ids.shape[0]
+
+    def reset(self):
+        self.__init__(self.num_classes, self.iou_threshold, self.max_age, self.min_hits, self.use_kalman,
+                      self.class_aware, self.velocity_smoothing)
+
+    def update(self, boxes, scores, class_ids):
+        """
+        Advances all tracks one frame and associates the new detections.
+        Returns (boxes, scores, class_ids, track_ids) of the confirmed tracks matched in this frame.
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        class_ids = np.asarray(class_ids, dtype=np.int64).reshape(-1)
+
+        self.events = []
+        self.frame_index += 1
+        self._frames_since_update = 0
+        self._predict()
+
+        track_idx, det_idx = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        if len(self) and boxes.shape[0]:
+            track_idx, det_idx = self._associate(boxes, class_ids)
+
+        self._correct(track_idx, boxes[det_idx])
+        self.scores[track_idx] = scores[det_idx]
+        self.hits[track_idx] += 1
+        self.time_since_update[track_idx] = 0
+
+        unmatched = np.ones(boxes.shape[0], dtype=bool)
+        unmatched[det_idx] = False
+        first_new_id = self._next_id
+        self._spawn(boxes[unmatched], scores[unmatched], class_ids[unmatched])
+        self.detection_track_ids = np.empty(boxes.shape[0], dtype=np.int64)
+        self.detection_track_ids[det_idx] = self.track_ids[track_idx]
+        self.detection_track_ids[unmatched] = np.arange(first_new_id, self._next_id)
+
+        self._confirm()
+        self._prune(missed_update=True)
+        return self.visible()
+
+    def predict(self):
+        """
+        Advances all tracks one frame on motion alone, without detections, e.g. between detector
+        keyframes. Returns (boxes, scores, class_ids, track_ids) of the tracks, tentative or
+        confirmed, that were matched in the latest update, moved to their predicted position.
+        """
+        self.events = []
+        self.frame_index += 1
+        self._frames_since_update += 1
+        self._predict()
+        self._prune()
+        mask = self.time_since_update == self._frames_since_update
+        return self.boxes[mask], self.scores[mask], self.class_ids[mask], self.track_ids[mask]
+
+    def visible(self):
+        """ Confirmed tracks that were matched in the latest update. """
+        mask = self.confirmed & (self.time_since_update == 0)
+        return self.boxes[mask], self.scores[mask], self.class_ids[mask], self.track_ids[mask]
+
+    def active_counts(self):
+        """ Number of confirmed tracks per class that are currently alive. """
+        return np.bincount(self.class_ids[self.confirmed], minlength=self.num_classes)
+
+    def _associate(self, boxes, class_ids):
+        rows, cols = candidate_pairs(self.boxes, boxes)
+        if self.class_aware:
+            same_class = self.class_ids[rows] == class_ids[cols]
+            rows, cols = rows[same_class], cols[same_class]
+        iou = pairwise_iou(self.boxes[rows], boxes[cols])
+        keep = iou >= self.iou_threshold
+        return greedy_match(rows[keep], cols[keep], iou[keep], len(self), boxes.shape[0])
+
+    def _predict(self):
+        if not len(self):
+            return
+        self.time_since_update += 1
+        self.boxes += self.velocities
+        if self.use_kalman:
+            q_pos, q_vel = self._process_noise()
+            var_p, cov_pv, var_v = (self.covariances[..., i] for i in range(3))
+            self.covariances[..., 0] = var_p + 2 * cov_pv + var_v + q_pos
+            self.covariances[..., 1] = cov_pv + var_v
+            self.covariances[..., 2] = var_v + q_vel
+
+    def _correct(self, track_idx, measured):
+        if track_idx.shape[0] == 0:
+            return
+        predicted = self.boxes[track_idx]
+        residual = measured - predicted
+        if self.use_kalman:
+            cov = self.covariances[track_idx]
+            var_p, cov_pv, var_v = cov[..., 0], cov[..., 1], cov[..., 2]
+            heights = np.maximum(measured[:, 3] - measured[:, 1], 1.0)[:, None]
+            innovation = var_p + (heights / 20.0) ** 2
+            gain_p = var_p / innovation
+            gain_v = cov_pv / innovation
+            self.boxes[track_idx] = predicted + gain_p * residual
+            self.velocities[track_idx] += gain_v * residual
+            self.covariances[track_idx] = np.stack(
+                ((1 - gain_p) * var_p, (1 - gain_p) * cov_pv, var_v - gain_v * cov_pv), axis=-1)
+        else:
+            # Residual accumulated over the frames the track went unseen, smoothed into the velocity
+            frames = self.time_since_update[track_idx][:, None].astype(np.float32)
+            alpha = self.velocity_smoothing
+            self.velocities[track_idx] += alpha * residual / np.maximum(frames, 1.0)
+            self.boxes[track_idx] = measured
+
+    def _spawn(self, boxes, scores, class_ids):
+        count = boxes.shape[0]
+        if count == 0:
+            return
+        new_ids = np.arange(self._next_id, self._next_id + count, dtype=np.int64)
+        self._next_id += count
+        heights = np.maximum(boxes[:, 3] - boxes[:, 1], 1.0)[:, None]
+        covariances = np.zeros((count, 4, 3), dtype=np.float32)
+        covariances[..., 0] = (heights / 10.0) ** 2
+        covariances[..., 2] = (heights / 4.0) ** 2
+
+        self.boxes = np.concatenate((self.boxes, boxes))
+        self.velocities = np.concatenate((self.velocities, np.zeros((count, 4), dtype=np.float32)))
+        self.covariances = np.concatenate((self.covariances, covariances))
+        self.scores = np.concatenate((self.scores, scores))
+        self.class_ids = np.concatenate((self.class_ids, class_ids))
+        self.track_ids = np.concatenate((self.track_ids, new_ids))
+        self.hits = np.concatenate((self.hits, np.ones(count, dtype=np.int32)))
+        self.time_since_update = np.concatenate((self.time_since_update, np.zeros(count, dtype=np.int32)))
+        self.confirmed = np.concatenate((self.confirmed, np.zeros(count, dtype=bool)))
+
+    def _confirm(self):
+        newly = ~self.confirmed & (self.hits >= self.min_hits)
+        if not newly.any():
+            return
+        self.confirmed |= newly
+        self.unique_counts += np.bincount(self.class_ids[newly], minlength=self.num_classes)
+        self.events.extend((TRACK_ENTER, int(t), int(c)) for t, c in zip(self.track_ids[newly], self.class_ids[newly]))
+
+    def _prune(self, missed_update=False):
+        dead = self.time_since_update > self.max_age
+        if missed_update:
+            # Tentative tracks are dropped as soon as they miss a detection
+            dead |= ~self.confirmed & (self.time_since_update > 0)
+        if not dead.any():
+            return
+        exits = dead & self.confirmed
+        self.events.extend((TRACK_EXIT, int(t), int(c)) for t, c in zip(self.track_ids[exits], self.class_ids[exits]))
+        keep = ~dead
+        self.boxes = self.boxes[keep]
+        self.velocities = self.velocities[keep]
+        self.covariances = self.covariances[keep]
+        self.scores = self.scores[keep]
+        self.class_ids = self.class_ids[keep]
+        self.track_ids = self.track_ids[keep]
+        self.hits = self.hits[keep]
+        self.time_since_update = self.time_since_update[keep]
+        self.confirmed = self.confirmed[keep]
+
+    def _process_noise(self):
+        heights = np.maximum(self.boxes[:, 3] - self.boxes[:, 1], 1.0)[:, None]
+        return (heights / 20.0) ** 2, (heights / 160.0) ** 2
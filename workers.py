@@ -0,0 +1,460 @@
+"""
+Multi-process detector: YOLOv10 instances in worker processes, fed through shared memory.
+
+Frames are copied into a per-worker shared-memory ring of frame slots and the
+detections are written back into a matching ring of result slots, so neither is
+pickled. Only fixed-size slot messages cross the pipes between the processes.
+
+Usage (worker side, started by WorkerPoolDetector): python workers.py --worker ...
+"""
+import argparse
+import json
+import os
+import queue
+import select
+import struct
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+import metrics
+from runtime_profile import ExecutionProfile, available_cores
+from zones import merge_detections
+
+CHANNEL_ORDERS = ("RGB", "BGR")
+# slot, frame height, frame width, confidence threshold, index into CHANNEL_ORDERS, whether the slot's class mask applies
+REQUEST = struct.Struct("<IIIfBB")
+# slot, status (0 ok, 1 error), detection count or error message length, worker time in ms
+REPLY = struct.Struct("<IIId")
+READY_SLOT = 0xFFFFFFFF
+# A result row is x1, y1, x2, y2, score, class_id
+RESULT_COLUMNS = 6
+# Bytes of the per-slot class mask, one per class id
+MAX_CLASSES = 256
+
+
+def _read_exact(fd, size):
+    """ Reads size bytes from fd, or returns None at end of file (the other process is gone). """
+    data = b""
+    while len(data) < size:
+        chunk = os.read(fd, size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _slot_layout(depth, max_frame_bytes, max_detections):
+    """ Byte offsets of the result ring and the class mask ring, and the total size of one shared-memory block. """
+    results_offset = depth * max_frame_bytes
+    masks_offset = results_offset + depth * max_detections * RESULT_COLUMNS * 4
+    return results_offset, masks_offset, masks_offset + depth * MAX_CLASSES
+
+
+def _ring_views(buffer, depth, max_frame_bytes, max_detections):
+    """ The frame, result and class mask rings of a block, each indexed by slot. """
+    results_offset, masks_offset, _ = _slot_layout(depth, max_frame_bytes, max_detections)
+    frames = np.ndarray((depth, max_frame_bytes), dtype=np.uint8, buffer=buffer)
+    results = np.ndarray((depth, max_detections, RESULT_COLUMNS), dtype=np.float32, buffer=buffer,
+                         offset=results_offset)
+    masks = np.ndarray((depth, MAX_CLASSES), dtype=bool, buffer=buffer, offset=masks_offset)
+    return frames, results, masks
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the block with this process's resource
+        # tracker, which would unlink it when the worker exits and break its restart
+        memory = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
+
+
+class _Worker:
+    def __init__(self, index, memory, frames, results, masks):
+        self.index = index
+        self.memory = memory
+        self.frames = frames
+        self.results = results
+        self.masks = masks
+        self.process = None
+        self.request_fd = None
+        self.reply_fd = None
+        self.restarts = 0
+
+
+class WorkerPoolDetector:
+    """
+    Runs detection in worker processes, each with its own YOLOv10 session and interpreter.
+
+    Same detect_objects contract as YOLOv10, and callable from any number of threads.
+    Each worker owns a shared-memory block with depth frame slots of max_frame_bytes
+    and depth result slots of max_detections rows; a dispatcher thread per worker
+    keeps up to depth frames in flight, so copying the next frame overlaps with
+    inference of the current one. Larger frames are downscaled to fit a slot and
+    their boxes scaled back.
+
+    Dispatchers check their worker every health_interval seconds. A worker that
+    exited, or has not answered a frame within request_timeout, is restarted and its
+    frames are queued again; a frame that has taken down max_attempts workers fails.
+    Without a thread count in profile, the workers split the cores between them.
+    """
+
+    def __init__(self, model_path, workers=2, letterbox=False, profile=None, depth=2,
+                 max_frame_bytes=1920 * 1080 * 3, max_detections=300, health_interval=1.0,
+                 request_timeout=10.0, startup_timeout=120.0, max_attempts=2):
+        self.model_path = model_path
+        self.letterbox = letterbox
+        profile = profile or ExecutionProfile()
+        if not profile.intra_op_num_threads:
+            profile = profile.copy(intra_op_num_threads=max(1, available_cores() // workers))
+        self.profile = profile
+        self.depth = max(1, int(depth))
+        self.max_frame_bytes = int(max_frame_bytes)
+        self.max_detections = int(max_detections)
+        self.health_interval = health_interval
+        self.request_timeout = request_timeout
+        self.startup_timeout = startup_timeout
+        self.max_attempts = max_attempts
+
+        self.frames_run = 0
+
+        self._queue = queue.Queue()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._workers = []
+        try:
+            _, _, size = _slot_layout(self.depth, self.max_frame_bytes, self.max_detections)
+            for index in range(max(1, int(workers))):
+                memory = shared_memory.SharedMemory(create=True, size=size)
+                worker = _Worker(index, memory, *_ring_views(memory.buf, self.depth, self.max_frame_bytes,
+                                                             self.max_detections))
+                self._workers.append(worker)
+                self._start_process(worker)
+        except Exception:
+            self._shutdown()
+            raise
+        self._threads = [threading.Thread(target=self._serve, args=(worker,), name=f"yolo-worker-{worker.index}",
+                                          daemon=True) for worker in self._workers]
+        for thread in self._threads:
+            thread.start()
+
+    def detect_objects(self, image, conf_threshold=0.3, channel_order="BGR", class_mask=None, zones=None):
+        """
+        Same contract as YOLOv10.detect_objects, run by the next free worker process.
+        With zones only their crops are sent, and the crops of one frame run in parallel.
+        """
+        return self._collect(self._submit(image, conf_threshold, channel_order, class_mask, zones))
+
+    def detect_objects_batch(self, images, conf_thresholds=0.3, channel_orders="BGR", class_masks=None, zones=None):
+        """ Same contract as YOLOv10.detect_objects_batch; the frames are spread over the workers. """
+        if np.isscalar(conf_thresholds):
+            conf_thresholds = [conf_thresholds] * len(images)
+        if isinstance(channel_orders, str):
+            channel_orders = [channel_orders] * len(images)
+        if class_masks is None or isinstance(class_masks, np.ndarray):
+            class_masks = [class_masks] * len(images)
+        if zones is None:
+            zones = [None] * len(images)
+        pending = [self._submit(image, conf, order, mask, frame_zones)
+                   for image, conf, order, mask, frame_zones
+                   in zip(images, conf_thresholds, channel_orders, class_masks, zones)]
+        return [self._collect(frame_pending) for frame_pending in pending]
+
+    def _submit(self, image, conf_threshold, channel_order, class_mask, zones):
+        """ Queues the frame, or each crop of it around zones; returns their (future, ZoneCrop) pairs. """
+        if self._closed:
+            raise RuntimeError("WorkerPoolDetector has been closed.")
+        if channel_order not in CHANNEL_ORDERS:
+            raise ValueError(f"Unsupported channel order '{channel_order}', expected one of {list(CHANNEL_ORDERS)}")
+        if image.ndim != 3 or image.shape[2] != 3:
+            raise ValueError(f"Expected an HxWx3 frame, got shape {image.shape}")
+        crops = [(image, None)] if zones is None else zones.crops(image)
+        pending = []
+        for view, crop in crops:
+            future = Future()
+            # The last field counts the workers this frame has been sent to
+            self._queue.put([view, conf_threshold, channel_order, class_mask, future, 0])
+            pending.append((future, crop))
+        return pending
+
+    @staticmethod
+    def _collect(pending):
+        results = []
+        for future, crop in pending:
+            result = future.result()
+            results.append(result if crop is None else crop.restore(*result))
+        return merge_detections(results)
+
+    @property
+    def workers(self):
+        return len(self._workers)
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    @property
+    def restarts(self):
+        return sum(worker.restarts for worker in self._workers)
+
+    def close(self):
+        """ Stops the dispatchers after the frames already queued have been served, then the workers. """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            for thread in self._threads:
+                thread.join()
+            self._shutdown()
+
+    def _shutdown(self):
+        for worker in self._workers:
+            self._stop_process(worker)
+            worker.frames = worker.results = worker.masks = None
+            worker.memory.close()
+            worker.memory.unlink()
+
+    def _start_process(self, worker):
+        request_read, request_write = os.pipe()
+        reply_read, reply_write = os.pipe()
+        command = [
+            sys.executable, os.path.abspath(__file__), "--worker",
+            "--model", self.model_path, "--profile", json.dumps(self.profile.to_dict()),
+            "--shm", worker.memory.name, "--depth", str(self.depth), "--max-frame-bytes", str(self.max_frame_bytes),
+            "--max-detections", str(self.max_detections), "--request-fd", str(request_read),
+            "--reply-fd", str(reply_write),
+        ]
+        if self.letterbox:
+            command.append("--letterbox")
+        try:
+            worker.process = subprocess.Popen(command, pass_fds=(request_read, reply_write), close_fds=True)
+        finally:
+            os.close(request_read)
+            os.close(reply_write)
+        worker.request_fd = request_write
+        worker.reply_fd = reply_read
+
+        # The worker reports in once its session is loaded and warmed up
+        try:
+            reply = self._receive(worker, self.startup_timeout)
+        except EOFError:
+            reply = None
+        if reply is None or reply[0] != READY_SLOT:
+            self._stop_process(worker)
+            raise RuntimeError(f"Worker {worker.index} did not start within {self.startup_timeout} s")
+
+    def _stop_process(self, worker):
+        if worker.process is None:
+            return
+        # Closing its request pipe makes the worker exit after the frame at hand
+        os.close(worker.request_fd)
+        try:
+            worker.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            worker.process.kill()
+            worker.process.wait()
+        os.close(worker.reply_fd)
+        worker.process = None
+
+    def _restart(self, worker, reason):
+        print(f"Restarting detector worker {worker.index}: {reason}")
+        if worker.process is not None and worker.process.poll() is None:
+            worker.process.kill()
+        self._stop_process(worker)
+        worker.restarts += 1
+        backoff = self.health_interval
+        while True:
+            try:
+                self._start_process(worker)
+                return
+            except Exception as e:
+                print(f"Detector worker {worker.index} failed to start: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    def _receive(self, worker, timeout):
+        """
+        The next (slot, status, count, elapsed_ms, message) from the worker, or None after
+        timeout seconds without one. Raises EOFError if the worker has gone away.
+        """
+        readable, _, _ = select.select([worker.reply_fd], [], [], timeout)
+        if not readable:
+            return None
+        header = _read_exact(worker.reply_fd, REPLY.size)
+        if header is None:
+            raise EOFError(f"Worker {worker.index} closed its reply pipe")
+        slot, status, count, elapsed_ms = REPLY.unpack(header)
+        message = None
+        if status:
+            message = _read_exact(worker.reply_fd, count)
+            if message is None:
+                raise EOFError(f"Worker {worker.index} closed its reply pipe")
+            message = message.decode(errors="replace")
+        return slot, status, count, elapsed_ms, message
+
+    def _send(self, worker, slot, request):
+        """ Copies the frame into slot and hands it to the worker; returns the box scale to undo a downscale. """
+        image, conf_threshold, channel_order, class_mask = request[:4]
+        image_height, image_width = image.shape[:2]
+        height, width = image_height, image_width
+        box_scale = None
+        if height * width * 3 > self.max_frame_bytes:
+            factor = (self.max_frame_bytes / (height * width * 3)) ** 0.5
+            width, height = max(1, int(width * factor)), max(1, int(height * factor))
+            box_scale = np.array([image_width / width, image_height / height] * 2, dtype=np.float32)
+        frame = worker.frames[slot, :height * width * 3].reshape(height, width, 3)
+        if box_scale is None:
+            np.copyto(frame, image)
+        else:
+            cv2.resize(image, (width, height), dst=frame, interpolation=cv2.INTER_AREA)
+        if class_mask is not None:
+            worker.masks[slot, :class_mask.shape[0]] = class_mask
+            worker.masks[slot, class_mask.shape[0]:] = False
+        request[5] += 1
+        os.write(worker.request_fd, REQUEST.pack(slot, height, width, conf_threshold,
+                                                 CHANNEL_ORDERS.index(channel_order), class_mask is not None))
+        return box_scale
+
+    def _serve(self, worker):
+        free = deque(range(self.depth))
+        # (slot, request, box scale, send time) in the order the worker answers them
+        in_flight = deque()
+        stopping = False
+        while True:
+            while free and not stopping:
+                try:
+                    # Wait for work only while idle; with frames in flight, go collect their results
+                    request = self._queue.get_nowait() if in_flight else self._queue.get(timeout=self.health_interval)
+                except queue.Empty:
+                    break
+                if request is None:
+                    # Pass the sentinel on so every dispatcher stops
+                    self._queue.put(None)
+                    stopping = True
+                    break
+                slot = free.popleft()
+                try:
+                    box_scale = self._send(worker, slot, request)
+                except OSError:
+                    # The worker is gone; the health check below restarts it and resends the frame
+                    request[5] -= 1
+                    box_scale = None
+                except Exception as e:
+                    free.append(slot)
+                    request[4].set_exception(e)
+                    continue
+                in_flight.append((slot, request, box_scale, time.perf_counter()))
+
+            if not in_flight:
+                if stopping:
+                    return
+                if worker.process.poll() is not None:
+                    self._restart(worker, f"exited with status {worker.process.returncode}")
+                continue
+
+            try:
+                reply = self._receive(worker, self.health_interval)
+                exited = False
+            except EOFError:
+                reply, exited = None, True
+            if reply is None:
+                exited = exited or worker.process.poll() is not None
+                overdue = time.perf_counter() - in_flight[0][3] > self.request_timeout
+                if not exited and not overdue:
+                    continue
+                self._restart(worker, "exited" if exited else f"no answer within {self.request_timeout} s")
+                for slot, request, _, _ in in_flight:
+                    free.append(slot)
+                    if request[5] >= self.max_attempts:
+                        request[4].set_exception(RuntimeError(
+                            f"Frame failed on {request[5]} detector workers, the last one exited or hung"))
+                    else:
+                        self._queue.put(request)
+                in_flight.clear()
+                continue
+
+            slot, status, count, elapsed_ms, message = reply
+            expected_slot, request, box_scale, sent = in_flight.popleft()
+            free.append(slot)
+            future = request[4]
+            if slot != expected_slot:
+                future.set_exception(RuntimeError(f"Worker {worker.index} answered slot {slot}, expected {expected_slot}"))
+                continue
+            if status:
+                future.set_exception(RuntimeError(f"Worker {worker.index}: {message}"))
+                continue
+            rows = worker.results[slot, :count]
+            boxes = rows[:, :4].copy() if box_scale is None else rows[:, :4] * box_scale
+            scores = rows[:, 4].copy()
+            class_ids = rows[:, 5].astype(np.int64)
+            if metrics.ENABLED:
+                round_trip_ms = (time.perf_counter() - sent) * 1000
+                metrics.registry.histogram("stage_latency_ms", stage="worker").observe(elapsed_ms)
+                metrics.registry.histogram("stage_latency_ms", stage="transport").observe(max(0.0, round_trip_ms - elapsed_ms))
+            with self._stats_lock:
+                self.frames_run += 1
+            future.set_result((boxes, scores, class_ids))
+
+
+def worker_main(args):
+    """ The worker process: detects frames from its frame slots until the request pipe closes. """
+    from inference import YOLOv10
+
+    detector = YOLOv10(args.model, letterbox=args.letterbox, profile=ExecutionProfile.from_dict(json.loads(args.profile)))
+    detector.detect_objects(np.zeros((480, 640, 3), dtype=np.uint8), channel_order="RGB")
+    memory = _attach(args.shm)
+    try:
+        _serve_requests(args, detector, memory)
+    finally:
+        memory.close()
+
+
+def _serve_requests(args, detector, memory):
+    # The ring views must be gone before the shared memory can be closed, hence a function of their own
+    frames, results, masks = _ring_views(memory.buf, args.depth, args.max_frame_bytes, args.max_detections)
+    num_classes = detector.decoder.num_classes
+    os.write(args.reply_fd, REPLY.pack(READY_SLOT, 0, 0, 0.0))
+    while True:
+        data = _read_exact(args.request_fd, REQUEST.size)
+        if data is None:
+            break
+        slot, height, width, conf_threshold, order, masked = REQUEST.unpack(data)
+        class_mask = masks[slot, :num_classes] if masked else None
+        frame = frames[slot, :height * width * 3].reshape(height, width, 3)
+        start = time.perf_counter()
+        try:
+            boxes, scores, class_ids = detector.detect_objects(frame, conf_threshold, CHANNEL_ORDERS[order], class_mask)
+            count = min(len(boxes), args.max_detections)
+            out = results[slot]
+            out[:count, :4] = boxes[:count]
+            out[:count, 4] = scores[:count]
+            out[:count, 5] = class_ids[:count]
+            reply = REPLY.pack(slot, 0, count, (time.perf_counter() - start) * 1000)
+        except Exception as e:
+            message = f"{type(e).__name__}: {e}".encode()[:1024]
+            reply = REPLY.pack(slot, 1, len(message), (time.perf_counter() - start) * 1000) + message
+        os.write(args.reply_fd, reply)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--worker", action="store_true", required=True)
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--profile", required=True, help="ExecutionProfile as JSON")
+    parser.add_argument("--letterbox", action="store_true")
+    parser.add_argument("--shm", required=True)
+    parser.add_argument("--depth", type=int, required=True)
+    parser.add_argument("--max-frame-bytes", type=int, required=True)
+    parser.add_argument("--max-detections", type=int, required=True)
+    parser.add_argument("--request-fd", type=int, required=True)
+    parser.add_argument("--reply-fd", type=int, required=True)
+    worker_main(parser.parse_args())
@@ -0,0 +1,159 @@
+import numpy as np
+
+
+def merge_detections(results):
+    """ Concatenates several (boxes, scores, class_ids) results into one. """
+    if len(results) == 1:
+        return results[0]
+    boxes, scores, class_ids = zip(*results)
+    return np.concatenate(boxes), np.concatenate(scores), np.concatenate(class_ids)
+
+
+def polygon_points(polygon):
+    """
+    The (n, 2) points of a polygon in either form zones come in: as stored in the settings,
+    {"points": [x0, y0, x1, y1, ...]}, or as [x, y] pairs, the form the Settings tab edits.
+    """
+    if isinstance(polygon, dict):
+        polygon = polygon.get("points") or []
+    points = np.asarray(polygon, dtype=np.float64)
+    if points.size % 2:
+        raise ValueError("A zone polygon needs an x and a y per point")
+    return points.reshape(-1, 2)
+
+
+def stored_zones(zones):
+    """
+    Zones per stream in the form they are stored: each polygon a {"points": [x0, y0, ...]}
+    map. Firestore rejects an array directly inside another array, so [x, y] pairs
+    cannot be stored as they are edited.
+    """
+    return {stream_id: [{"points": polygon_points(polygon).reshape(-1).tolist()} for polygon in polygons]
+            for stream_id, polygons in (zones or {}).items()}
+
+
+def editable_zones(zones):
+    """ Zones per stream as lists of [x, y] points, the form the Settings tab shows and takes. """
+    return {stream_id: [polygon_points(polygon).tolist() for polygon in polygons]
+            for stream_id, polygons in (zones or {}).items()}
+
+
+class ZoneCrop:
+    """ Where a crop of a frame was taken, to map detections in the crop back to the frame. """
+
+    def __init__(self, zones, x, y, frame_width, frame_height):
+        self.zones = zones
+        self.x = x
+        self.y = y
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+
+    def restore(self, boxes, scores, class_ids):
+        """ Shifts boxes from crop to frame pixels and keeps those centered in a zone. """
+        boxes = boxes + np.array([self.x, self.y, self.x, self.y], dtype=boxes.dtype)
+        keep = self.zones.contains(boxes, self.frame_width, self.frame_height)
+        return boxes[keep], scores[keep], class_ids[keep]
+
+
+class ZoneSet:
+    """
+    Polygon zones of one camera, in coordinates normalized to the frame size (0..1),
+    each in either form polygon_points() takes.
+
+    crops() gives the parts of a frame the detector needs to see: the bounding region of
+    all zones, grown by padding on each side for context, or one region per group of
+    zones whose regions intersect when that covers less than split_ratio of the pixels of
+    the shared region (zones far apart). A smaller region is upscaled more to the model input, so small objects in a
+    zone get more pixels, and the rest of the frame costs nothing. A detection is kept
+    when the center of its box lies inside a zone; the test runs on all boxes and all
+    polygon edges at once.
+    """
+
+    def __init__(self, polygons, padding=0.1, split_ratio=0.5):
+        self.polygons = [polygon_points(polygon) for polygon in polygons]
+        if not self.polygons or any(polygon.shape[0] < 3 for polygon in self.polygons):
+            raise ValueError("Zones need at least one polygon of three or more points")
+        self.padding = padding
+        self.split_ratio = split_ratio
+
+        # Edges of all polygons back to back, and where each polygon's edges start
+        starts, edges = [], []
+        for polygon in self.polygons:
+            starts.append(sum(len(e) for e in edges))
+            edges.append(np.concatenate((polygon, np.roll(polygon, -1, axis=0)), axis=1))
+        self._starts = np.array(starts)
+        x1, y1, x2, y2 = np.concatenate(edges).T
+        self._x1, self._y1, self._y2 = x1, y1, y2
+        dy = y2 - y1
+        # Horizontal edges never cross a scanline, so their slope is never used
+        self._slope = (x2 - x1) / np.where(dy == 0, 1.0, dy)
+        self._regions = {}
+
+    @classmethod
+    def from_settings(cls, polygons):
+        """ A ZoneSet from the zones value of one stream in the settings, or None if it has no polygons. """
+        return cls(polygons) if polygons else None
+
+    def regions(self, width, height):
+        """ The (x1, y1, x2, y2) pixel regions to run detection on for a width x height frame. """
+        key = (width, height)
+        regions = self._regions.get(key)
+        if regions is None:
+            regions = self._regions[key] = self._compute_regions(width, height)
+        return regions
+
+    def crops(self, image):
+        """ Views of image to run detection on, each with the ZoneCrop that maps its detections back. """
+        height, width = image.shape[:2]
+        return [(image[y1:y2, x1:x2], ZoneCrop(zones, x1, y1, width, height))
+                for (x1, y1, x2, y2), zones in self.regions(width, height)]
+
+    def contains(self, boxes, width, height):
+        """ Boolean mask of the xyxy pixel boxes whose center lies inside any zone. """
+        if boxes.shape[0] == 0:
+            return np.zeros(0, dtype=bool)
+        x = ((boxes[:, 0] + boxes[:, 2]) / (2 * width))[:, None]
+        y = ((boxes[:, 1] + boxes[:, 3]) / (2 * height))[:, None]
+        # Even-odd rule: count the edges a ray to the left of each point crosses
+        spans = (self._y1 > y) != (self._y2 > y)
+        crosses = spans & (x < self._x1 + (y - self._y1) * self._slope)
+        counts = np.add.reduceat(crosses, self._starts, axis=1)
+        return (counts % 2 == 1).any(axis=1)
+
+    def _compute_regions(self, width, height):
+        def pixel_region(points):
+            x1, y1 = points.min(axis=0)
+            x2, y2 = points.max(axis=0)
+            pad_x, pad_y = (x2 - x1) * self.padding, (y2 - y1) * self.padding
+            left = int(np.clip(np.floor((x1 - pad_x) * width), 0, width - 1))
+            top = int(np.clip(np.floor((y1 - pad_y) * height), 0, height - 1))
+            right = int(np.clip(np.ceil((x2 + pad_x) * width), left + 1, width))
+            bottom = int(np.clip(np.ceil((y2 + pad_y) * height), top + 1, height))
+            return left, top, right, bottom
+
+        def area(region):
+            return (region[2] - region[0]) * (region[3] - region[1])
+
+        def intersect(a, b):
+            return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+        shared = pixel_region(np.concatenate(self.polygons))
+        if len(self.polygons) > 1:
+            # Zones whose regions intersect share a crop, until no two crops intersect: a box
+            # centered in one crop's zones then lies in no other crop's zones, so no detection
+            # is kept twice
+            groups = [[polygon] for polygon in self.polygons]
+            merged = True
+            while merged and len(groups) > 1:
+                merged = False
+                regions = [pixel_region(np.concatenate(group)) for group in groups]
+                for i in range(len(groups)):
+                    j = next((j for j in range(i + 1, len(groups)) if intersect(regions[i], regions[j])), None)
+                    if j is not None:
+                        groups[i] += groups.pop(j)
+                        merged = True
+                        break
+            if len(groups) > 1 and sum(area(region) for region in regions) < self.split_ratio * area(shared):
+                return [(region, ZoneSet(group, self.padding, self.split_ratio))
+                        for region, group in zip(regions, groups)]
+        return [(shared, self)]